@@ -0,0 +1,303 @@
+"""
+Async Firebase Realtime Database Client
+Phiên bản asyncio của FirebaseClient: một process có thể đồng thời đẩy vị trí
+nhiều robot, lắng nghe stream đơn hàng và gọi OSRM (route_async) trên cùng
+một event loop.
+
+Ví dụ:
+
+    async def main():
+        async with AsyncFirebaseClient("https://...firebaseio.com") as firebase:
+            await firebase.update_robot_location(21.0285, 105.8542)
+            async for orders, payload, event_type in firebase.listen_orders():
+                print(f"[{event_type}] Có {len(orders)} đơn hàng")
+
+    asyncio.run(main())
+"""
+
+import asyncio
+import functools
+import json
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from firebase_sample import (
+    DEFAULT_DATABASE_URL,
+    DatabaseData,
+    FirebaseClient,
+    Order,
+    OrderCache,
+    Robot,
+    SSEParser,
+    StreamLineSplitter,
+    parse_orders,
+)
+from osrm_client import OSRMRouter
+from route_cache import RouteResult
+
+# Kích thước mỗi lần đọc stream (byte); dòng dài hơn vẫn được ghép đủ
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class AsyncFirebaseClient:
+    """Client asyncio để tương tác với Firebase Realtime Database"""
+
+    DEFAULT_TIMEOUTS: Dict[str, float] = dict(FirebaseClient.DEFAULT_TIMEOUTS)
+
+    def __init__(self, database_url: str,
+                 pool_size: int = 10,
+                 timeouts: Optional[Dict[str, float]] = None):
+        """
+        Khởi tạo Async Firebase Client
+
+        Args:
+            database_url: URL của Firebase Realtime Database
+            pool_size: Số kết nối đồng thời tối đa của connector (mặc định 10)
+            timeouts: Ghi đè timeout (giây) theo method, ví dụ {"PUT": 3, "STREAM": 90}
+        """
+        self.base_url = database_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeouts = dict(self.DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update({k.upper(): v for k, v in timeouts.items()})
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Lấy ClientSession keep-alive (tạo mới trong event loop hiện tại nếu chưa có)"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def _timeout_for(self, method: str) -> aiohttp.ClientTimeout:
+        seconds = self.timeouts.get(method.upper(), self.DEFAULT_TIMEOUTS["GET"])
+        if method.upper() == "STREAM":
+            # Stream không có giới hạn tổng, chỉ giới hạn thời gian chờ giữa 2 lần đọc
+            return aiohttp.ClientTimeout(total=None, sock_read=seconds)
+        return aiohttp.ClientTimeout(total=seconds)
+
+    async def close(self) -> None:
+        """Đóng session và toàn bộ kết nối"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> 'AsyncFirebaseClient':
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    def _url(self, path: str = "") -> str:
+        if path:
+            return f"{self.base_url}/{path}.json"
+        return f"{self.base_url}/.json"
+
+    async def _make_request(self, method: str, path: str = "", data: Optional[dict] = None) -> Optional[Any]:
+        """
+        Thực hiện HTTP request đến Firebase
+
+        Args:
+            method: HTTP method (GET, PUT, PATCH, POST, DELETE)
+            path: Đường dẫn trong database
+            data: Dữ liệu để gửi (nếu có)
+
+        Returns:
+            Response data hoặc None nếu có lỗi
+        """
+        method = method.upper()
+        if method not in ("GET", "PUT", "PATCH", "POST", "DELETE"):
+            raise ValueError(f"Unsupported HTTP method: {method}")
+
+        kwargs: Dict[str, Any] = {"timeout": self._timeout_for(method)}
+        if method not in ("GET", "DELETE"):
+            kwargs["json"] = data
+
+        try:
+            async with self._get_session().request(method, self._url(path), **kwargs) as response:
+                response.raise_for_status()
+                text = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Lỗi khi thực hiện request: {e!r}")
+            return None
+
+        # Firebase trả về null nếu không có dữ liệu
+        if text == "null":
+            return None
+
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            print(f"Lỗi khi parse JSON: {e}")
+            return None
+
+    async def update_robot_location(self, lat: float, lon: float) -> bool:
+        """Cập nhật vị trí robot lên Firebase, True nếu thành công"""
+        result = await self._make_request("PUT", "robot", {"lat": lat, "lon": lon})
+        return result is not None
+
+    async def get_robot_location(self) -> Optional[Robot]:
+        """Lấy vị trí robot từ Firebase"""
+        data = await self._make_request("GET", "robot")
+        if data is None:
+            return None
+
+        try:
+            return Robot.from_dict(data)
+        except (KeyError, ValueError) as e:
+            print(f"Lỗi khi parse robot data: {e}")
+            return None
+
+    async def get_all_orders(self) -> Dict[str, Order]:
+        """Lấy tất cả đơn hàng, trả về dict order_id -> Order"""
+        return parse_orders(await self._make_request("GET", "orders"))
+
+    async def get_order(self, order_id: str) -> Optional[Order]:
+        """Lấy một đơn hàng cụ thể, None nếu không tìm thấy hoặc có lỗi"""
+        data = await self._make_request("GET", f"orders/{order_id}")
+        if data is None:
+            return None
+
+        try:
+            return Order.from_dict(data, order_id)
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            print(f"Lỗi khi parse order data: {e}")
+            return None
+
+    async def get_all_data(self) -> Optional[DatabaseData]:
+        """Lấy toàn bộ dữ liệu từ Firebase (orders + robot)"""
+        data = await self._make_request("GET")
+        if data is None:
+            return None
+
+        try:
+            return DatabaseData.from_dict(data)
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            print(f"Lỗi khi parse database data: {e}")
+            return None
+
+    async def listen_orders(
+        self,
+        on_error: Optional[Callable[[Exception], None]] = None,
+        retry_delay_seconds: float = 5.0,
+        cache: Optional[OrderCache] = None,
+    ) -> AsyncIterator[Tuple[List[Order], Any, str]]:
+        """
+        Lắng nghe thay đổi đơn hàng dưới dạng async iterator.
+
+        Mỗi phần tử là (danh sách Order giảm dần theo createdAt, payload, event_type),
+        giống tham số của callback on_change trong FirebaseClient.listen_orders.
+        Tự kết nối lại sau retry_delay_seconds khi gặp lỗi; dừng bằng cách
+        thoát vòng lặp `async for` hoặc hủy task.
+
+        Args:
+            on_error: Callback khi có lỗi (optional). Nếu không truyền sẽ in ra console.
+            retry_delay_seconds: Thời gian chờ trước khi thử kết nối lại.
+            cache: OrderCache dùng để lưu đơn hàng (optional).
+        """
+        url = self._url("orders")
+        headers = {"Accept": "text/event-stream"}
+        order_cache = cache if cache is not None else OrderCache()
+
+        def _emit_error(exc: Exception) -> None:
+            if on_error:
+                on_error(exc)
+            else:
+                print(f"Lỗi stream orders: {exc!r}")
+
+        while True:
+            try:
+                async with self._get_session().get(
+                    url,
+                    headers=headers,
+                    timeout=self._timeout_for("STREAM"),
+                ) as response:
+                    response.raise_for_status()
+                    order_cache.loaded = False
+                    parser = SSEParser()
+                    # Không dùng `async for line in response.content`: reader dòng của
+                    # aiohttp báo LineTooLong khi snapshot ban đầu dài hơn giới hạn
+                    splitter = StreamLineSplitter()
+
+                    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                        for line in splitter.feed(chunk):
+                            event = parser.feed(line)
+                            if event is None:
+                                continue
+
+                            event_type, payload_str = event
+                            try:
+                                payload = json.loads(payload_str) if payload_str else {}
+                            except json.JSONDecodeError as exc:
+                                _emit_error(exc)
+                                continue
+
+                            if order_cache.needs_snapshot(event_type, payload):
+                                order_cache.load(await self._make_request("GET", "orders"))
+                            order_cache.apply_event(event_type, payload)
+
+                            yield order_cache.sorted_orders(), payload, event_type
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                _emit_error(exc)
+            except Exception as exc:
+                # Lỗi parse/decode stream: kết nối lại như lỗi mạng thay vì dừng hẳn
+                _emit_error(exc)
+
+            await asyncio.sleep(retry_delay_seconds)
+
+
+async def route_async(router: OSRMRouter,
+                      origin_lat: float, origin_lng: float,
+                      dest_lat: float, dest_lng: float,
+                      hedged: bool = True) -> Optional[RouteResult]:
+    """
+    Bản awaitable của OSRMRouter.route: chạy trên thread pool mặc định của
+    event loop nên nhiều lộ trình được tính đồng thời với stream và telemetry
+
+    Returns:
+        RouteResult hoặc None nếu mọi server đều lỗi
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None,
+        functools.partial(router.route, origin_lat, origin_lng, dest_lat, dest_lng, hedged=hedged),
+    )
+
+
+# ==================== EXAMPLE USAGE ====================
+
+async def _example() -> None:
+    async with AsyncFirebaseClient(DEFAULT_DATABASE_URL) as firebase:
+        # Chạy đồng thời nhiều request trên cùng một event loop
+        robot, orders = await asyncio.gather(
+            firebase.get_robot_location(),
+            firebase.get_all_orders(),
+        )
+        if robot:
+            print(f"Robot tại: lat={robot.lat}, lon={robot.lon}")
+        print(f"Tổng số đơn hàng: {len(orders)}")
+
+        if robot and orders:
+            # Tính lộ trình tới vài đơn hàng đồng thời
+            from auto_create_order import get_osrm_router
+            router = get_osrm_router()
+            targets = list(orders.values())[:5]
+            routes = await asyncio.gather(*(
+                route_async(router, robot.lat, robot.lon, o.destinationLat, o.destinationLng)
+                for o in targets
+            ))
+            for order, route in zip(targets, routes):
+                if route is not None:
+                    print(f"  {order.id}: {len(route.points)} điểm")
+
+        async for orders_list, _payload, event_type in firebase.listen_orders():
+            print(f"[{event_type}] Có {len(orders_list)} đơn hàng")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_example())
+    except KeyboardInterrupt:
+        print("\nĐã dừng.")
@@ -9,13 +9,19 @@ Tool tự động tạo đơn hàng cho Robot Delivery
 Chạy: python Embedded/auto_create_order.py "https://www.google.com/maps/place/..."
 """
 
-import requests
+import os
 import re
 import sys
 import random
+import time
 from datetime import datetime
 from typing import List, Optional, Tuple
-from firebase_sample import FirebaseClient, Order, RoutePoint
+from firebase_sample import DEFAULT_DATABASE_URL, FirebaseClient, Order, RoutePoint
+from geo_utils import simplify_route
+from metrics import REGISTRY
+from osrm_client import OSRMRouter
+from profiling import span
+from route_cache import RouteCache, RouteResult
 
 
 # ==================== CONFIGURATION ====================
@@ -24,6 +30,9 @@ OSRM_SERVERS = [
     'https://router.project-osrm.org',
     'https://routing.openstreetmap.de/routed-car',
 ]
+# Ghi đè bằng biến môi trường, ví dụ OSRM_SERVERS=http://127.0.0.1:5000 (local_osrm_server.py)
+if os.environ.get('OSRM_SERVERS'):
+    OSRM_SERVERS = [url.strip() for url in os.environ['OSRM_SERVERS'].split(',') if url.strip()]
 
 # Danh sách tên Việt Nam để random
 FIRST_NAMES = [
@@ -140,34 +149,145 @@ def generate_random_weight() -> float:
     return round(random.uniform(0.5, 20.0), 1)
 
 
-def downsample_route_points(route_coords: List[Tuple[float, float]], max_points: int = 100) -> List[Tuple[float, float]]:
+def downsample_route_points(route_coords: List[Tuple[float, float]],
+                            max_points: int = 100,
+                            tolerance_meters: float = 3.0) -> List[Tuple[float, float]]:
     """
-    Downsample route points về tối đa max_points điểm, phân bố đều
+    Đơn giản hóa route points (Douglas-Peucker), giữ hình dạng lộ trình
+    
+    Bỏ các điểm lệch không quá tolerance_meters so với lộ trình gốc (đoạn
+    đường thẳng chỉ còn 2 đầu mút, khúc cua được giữ lại). Nếu vẫn nhiều hơn
+    max_points thì giữ max_points điểm quan trọng nhất.
     
     Args:
         route_coords: List of (lat, lng) tuples
         max_points: Số điểm tối đa (mặc định 100)
+        tolerance_meters: Sai số cho phép (mét), mặc định 3m
     
     Returns:
         List of (lat, lng) tuples với tối đa max_points điểm
+        (luôn giữ điểm đầu và điểm cuối)
+    """
+    simplified = simplify_route(route_coords, tolerance_meters, max_points)
+    
+    if len(simplified) < len(route_coords):
+        print(f"  ⚠ Simplified route từ {len(route_coords)} điểm xuống {len(simplified)} điểm")
+    
+    return simplified
+
+
+def _simplify_route_result(result: RouteResult, max_points: int) -> RouteResult:
+    """Đơn giản hóa lộ trình của một RouteResult (quãng đường/thời gian giữ nguyên)"""
+    with span("downsample", points_in=len(result.points)) as downsample_span:
+        points = downsample_route_points(result.points, max_points=max_points)
+        downsample_span.set_attribute("points_out", len(points))
+    return RouteResult(points=points, distance=result.distance, duration=result.duration)
+
+
+# Số điểm route tối đa của một đơn hàng
+MAX_ROUTE_POINTS = 100
+
+_route_cache: Optional[RouteCache] = None
+_osrm_router: Optional[OSRMRouter] = None
+
+
+def get_osrm_router() -> OSRMRouter:
+    """OSRMRouter dùng chung (tạo từ OSRM_SERVERS khi dùng lần đầu)"""
+    global _osrm_router
+    if _osrm_router is None or _osrm_router.servers != OSRM_SERVERS:
+        _osrm_router = OSRMRouter(OSRM_SERVERS)
+    return _osrm_router
+
+
+def get_route_cache() -> RouteCache:
+    """Route cache mặc định của module (tạo khi dùng lần đầu)"""
+    global _route_cache
+    if _route_cache is None:
+        _route_cache = RouteCache()
+    return _route_cache
+
+
+def set_route_cache(cache: Optional[RouteCache]) -> None:
+    """Thay route cache mặc định (ví dụ cache chỉ trong RAM khi test)"""
+    global _route_cache
+    _route_cache = cache
+
+
+def get_route_result_from_osrm(origin_lat: float, origin_lng: float,
+                               dest_lat: float, dest_lng: float,
+                               use_cache: bool = True,
+                               hedged: bool = True,
+                               max_route_points: Optional[int] = MAX_ROUTE_POINTS) -> Optional[RouteResult]:
+    """
+    Lấy lộ trình kèm quãng đường/thời gian, ưu tiên route cache rồi mới gọi OSRM
+    
+    Lộ trình được đơn giản hóa một lần ngay sau khi tải từ OSRM, trước khi lưu
+    vào cache, nên các đơn dùng chung lộ trình không phải đơn giản hóa lại.
+    Cache tách entry theo max_route_points, nên max_route_points=None luôn nhận
+    lộ trình gốc.
+    
+    Args:
+        origin_lat, origin_lng: Tọa độ điểm đầu
+        dest_lat, dest_lng: Tọa độ điểm cuối
+        use_cache: Đọc/ghi route cache (mặc định True)
+        hedged: Gửi hedged request sang server kế tiếp khi server ưu tiên chậm
+                (mặc định True, False = thử lần lượt từng server)
+        max_route_points: Số điểm tối đa sau khi đơn giản hóa (None = giữ nguyên
+                          lộ trình của OSRM)
+    
+    Returns:
+        RouteResult hoặc None nếu có lỗi
     """
-    if len(route_coords) <= max_points:
-        return route_coords
+    cache_requests = REGISTRY.counter("route_cache_requests_total",
+                                      "Số lần tra route cache theo kết quả (hit/miss)")
+    cache = get_route_cache() if use_cache else None
+    if cache is not None:
+        with span("route_cache.get") as cache_span:
+            cached = cache.get(origin_lat, origin_lng, dest_lat, dest_lng,
+                               max_points=max_route_points)
+            if cached is None and max_route_points is not None:
+                # Đã có lộ trình gốc trong cache => chỉ cần đơn giản hóa, không gọi OSRM
+                full = cache.get(origin_lat, origin_lng, dest_lat, dest_lng)
+                if full is not None:
+                    cached = _simplify_route_result(full, max_route_points)
+                    cache.put(origin_lat, origin_lng, dest_lat, dest_lng, cached,
+                              max_points=max_route_points)
+            cache_span.set_attribute("hit", cached is not None)
+        cache_requests.inc(result="hit" if cached is not None else "miss")
+        if cached is not None:
+            print(f"  ✓ Route cache hit: {len(cached.points)} points, "
+                  f"{cached.distance/1000:.2f} km, {cached.duration/60:.1f} minutes")
+            return cached
+    
+    # Latency end-to-end gồm cả hedge/failover giữa các server
+    start = time.perf_counter()
+    with span("osrm.route", hedged=hedged) as route_span:
+        result = get_osrm_router().route(origin_lat, origin_lng, dest_lat, dest_lng, hedged=hedged)
+        route_span.set_attribute("ok", result is not None)
+    REGISTRY.histogram("osrm_route_duration_seconds",
+                       "Latency lấy lộ trình từ OSRM kể cả hedge/failover (giây)").observe(
+        time.perf_counter() - start, outcome="ok" if result is not None else "failed")
+    if result is None:
+        print(f"  ✗ All OSRM servers failed")
+        return None
     
-    # Downsample: chọn đều max_points điểm từ route
-    # Luôn giữ điểm đầu và điểm cuối
-    indices = [int(i * (len(route_coords) - 1) / (max_points - 1)) for i in range(max_points)]
-    downsampled = [route_coords[i] for i in indices]
+    print(f"  ✓ OSRM success: {len(result.points)} points, "
+          f"{result.distance/1000:.2f} km, {result.duration/60:.1f} minutes")
     
-    print(f"  ⚠ Downsampled route từ {len(route_coords)} điểm xuống {len(downsampled)} điểm")
+    if max_route_points is not None:
+        result = _simplify_route_result(result, max_route_points)
     
-    return downsampled
+    if cache is not None:
+        cache.put(origin_lat, origin_lng, dest_lat, dest_lng, result,
+                  max_points=max_route_points)
+    return result
 
 
 def get_route_from_osrm(origin_lat: float, origin_lng: float, 
                         dest_lat: float, dest_lng: float) -> Optional[List[Tuple[float, float]]]:
     """
-    Gọi OSRM API để lấy lộ trình chi tiết
+    Gọi OSRM API để lấy lộ trình (có dùng route cache), đã đơn giản hóa
+    còn tối đa MAX_ROUTE_POINTS điểm
     
     Args:
         origin_lat, origin_lng: Tọa độ điểm đầu
@@ -176,40 +296,77 @@ def get_route_from_osrm(origin_lat: float, origin_lng: float,
     Returns:
         List of (lat, lng) tuples hoặc None nếu có lỗi
     """
-    for server_url in OSRM_SERVERS:
-        try:
-            print(f"  Trying OSRM server: {server_url}")
-            
-            url = f"{server_url}/route/v1/driving/{origin_lng},{origin_lat};{dest_lng},{dest_lat}?overview=full&geometries=geojson"
-            
-            response = requests.get(url, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if data.get('code') == 'Ok' and data.get('routes'):
-                    route = data['routes'][0]
-                    coordinates = route['geometry']['coordinates']
-                    
-                    # Convert từ [lng, lat] sang (lat, lng)
-                    route_points = [(coord[1], coord[0]) for coord in coordinates]
-                    
-                    distance = route.get('distance', 0)  # meters
-                    duration = route.get('duration', 0)  # seconds
-                    
-                    print(f"  ✓ OSRM success: {len(route_points)} points, "
-                          f"{distance/1000:.2f} km, {duration/60:.1f} minutes")
-                    
-                    return route_points
-                else:
-                    print(f"  ✗ No route found from OSRM")
-            else:
-                print(f"  ✗ OSRM server returned status {response.status_code}")
-                
-        except Exception as e:
-            print(f"  ✗ OSRM Error with {server_url}: {e}")
-    
-    print(f"  ✗ All OSRM servers failed")
+    result = get_route_result_from_osrm(origin_lat, origin_lng, dest_lat, dest_lng)
+    if result is None:
+        return None
+    return result.points
+
+
+def build_random_order(destination_lat: float,
+                       destination_lng: float,
+                       route_coords: List[Tuple[float, float]],
+                       max_route_points: int = MAX_ROUTE_POINTS) -> Order:
+    """
+    Tạo Order (chưa đẩy lên Firebase) với thông tin người nhận ngẫu nhiên
+    
+    Args:
+        destination_lat, destination_lng: Tọa độ điểm đích
+        route_coords: Lộ trình dạng list (lat, lng) từ điểm pickup đến điểm đích
+        max_route_points: Số điểm route tối đa (mặc định 100)
+    
+    Returns:
+        Order với id rỗng, status "pending"
+    """
+    # Lộ trình từ get_route_from_osrm đã được đơn giản hóa một lần trước khi cache;
+    # chỉ đơn giản hóa ở đây nếu lộ trình truyền vào còn dài hơn giới hạn
+    if len(route_coords) > max_route_points:
+        with span("downsample", points_in=len(route_coords)) as downsample_span:
+            route_coords = downsample_route_points(route_coords, max_points=max_route_points)
+            downsample_span.set_attribute("points_out", len(route_coords))
+    
+    with span("generate_order"):
+        # Convert sang RoutePoint objects
+        route_points = [
+            RoutePoint(lat=lat, lng=lng, order=i)
+            for i, (lat, lng) in enumerate(route_coords)
+        ]
+        
+        return Order(
+            id="",  # Firebase sẽ tự tạo ID
+            createdAt=datetime.now().isoformat(),
+            destinationLat=destination_lat,
+            destinationLng=destination_lng,
+            goods=generate_random_goods(),
+            phoneNumber=generate_random_phone(),
+            receiverAge=generate_random_age(),
+            receiverName=generate_random_name(),
+            routePoints=route_points,
+            status="pending",
+            weight=generate_random_weight()
+        )
+
+
+def push_order(firebase: FirebaseClient, order: Order,
+               compact_route: bool = False) -> Optional[str]:
+    """
+    Đẩy Order lên Firebase bằng POST (Firebase tự tạo ID)
+    
+    Args:
+        firebase: FirebaseClient instance
+        order: Đơn hàng cần tạo
+        compact_route: Ghi lộ trình dạng encoded polyline ("routePolyline")
+    
+    Returns:
+        Order ID nếu thành công, None nếu có lỗi
+    """
+    with span("serialize_order"):
+        order_dict = order.to_dict(compact_route=compact_route)
+        # Remove id field vì Firebase sẽ tự tạo
+        order_dict.pop('id', None)
+    
+    result = firebase._make_request("POST", "orders", order_dict)
+    if result and 'name' in result:
+        return result['name']
     return None
 
 
@@ -219,6 +376,10 @@ def create_order_on_firebase(firebase: FirebaseClient,
     """
     Tạo đơn hàng mới trên Firebase
     
+    Cả lần tạo đơn là span "create_order", các stage (robot_get, osrm,
+    generate_order, firebase_post) là span con; downsample nằm trong osrm
+    khi lộ trình vừa được tải; xem profiling.py
+    
     Args:
         firebase: FirebaseClient instance
         destination_lat: Vĩ độ điểm đích
@@ -227,13 +388,24 @@ def create_order_on_firebase(firebase: FirebaseClient,
     Returns:
         Order ID nếu thành công, None nếu có lỗi
     """
+    with span("create_order", destination=(destination_lat, destination_lng)) as order_span:
+        order_id = _create_order_stages(firebase, destination_lat, destination_lng)
+        order_span.set_attribute("order_id", order_id)
+        return order_id
+
+
+def _create_order_stages(firebase: FirebaseClient,
+                         destination_lat: float,
+                         destination_lng: float) -> Optional[str]:
+    """Các stage của create_order_on_firebase, mỗi stage là một span"""
     print("\n" + "=" * 60)
     print("TẠO ĐỜN HÀNG MỚI")
     print("=" * 60)
     
     # 1. Lấy vị trí robot (pickup location)
     print("\n1. Lấy vị trí robot (pickup location)...")
-    robot = firebase.get_robot_location()
+    with span("robot_get"):
+        robot = firebase.get_robot_location()
     if not robot:
         print("  ✗ Không thể lấy vị trí robot từ Firebase")
         return None
@@ -247,63 +419,32 @@ def create_order_on_firebase(firebase: FirebaseClient,
     print(f"  From: ({origin_lat}, {origin_lng})")
     print(f"  To: ({destination_lat}, {destination_lng})")
     
-    route_coords = get_route_from_osrm(origin_lat, origin_lng, destination_lat, destination_lng)
+    with span("osrm"):
+        route_coords = get_route_from_osrm(origin_lat, origin_lng, destination_lat, destination_lng)
     
     if not route_coords:
         print("  ⚠ OSRM failed, tạo route thẳng đơn giản thay thế")
         # Fallback: tạo route thẳng với 2 điểm
         route_coords = [(origin_lat, origin_lng), (destination_lat, destination_lng)]
     
-    # Giới hạn số điểm route về tối đa 100
-    route_coords = downsample_route_points(route_coords, max_points=100)
-    
-    # Convert sang RoutePoint objects
-    route_points = [
-        RoutePoint(lat=lat, lng=lng, order=i)
-        for i, (lat, lng) in enumerate(route_coords)
-    ]
+    # build_random_order mở span "generate_order"
+    order = build_random_order(destination_lat, destination_lng, route_coords)
     
     # 3. Generate thông tin đơn hàng
     print(f"\n3. Generate thông tin đơn hàng...")
-    receiver_name = generate_random_name()
-    phone_number = generate_random_phone()
-    age = generate_random_age()
-    goods = generate_random_goods()
-    weight = generate_random_weight()
-    created_at = datetime.now().isoformat()
-    
-    print(f"  Người nhận: {receiver_name}")
-    print(f"  Tuổi: {age}")
-    print(f"  Số điện thoại: {phone_number}")
-    print(f"  Hàng hóa: {goods}")
-    print(f"  Trọng lượng: {weight} kg")
-    print(f"  Số điểm route: {len(route_points)}")
-    
-    # 4. Tạo Order object
-    order = Order(
-        id="",  # Firebase sẽ tự tạo ID
-        createdAt=created_at,
-        destinationLat=destination_lat,
-        destinationLng=destination_lng,
-        goods=goods,
-        phoneNumber=phone_number,
-        receiverAge=age,
-        receiverName=receiver_name,
-        routePoints=route_points,
-        status="pending",
-        weight=weight
-    )
-    
-    # 5. Push lên Firebase
+    print(f"  Người nhận: {order.receiverName}")
+    print(f"  Tuổi: {order.receiverAge}")
+    print(f"  Số điện thoại: {order.phoneNumber}")
+    print(f"  Hàng hóa: {order.goods}")
+    print(f"  Trọng lượng: {order.weight} kg")
+    print(f"  Số điểm route: {len(order.routePoints)}")
+    
+    # 4. Push lên Firebase
     print(f"\n4. Đẩy đơn hàng lên Firebase...")
-    order_dict = order.to_dict()
-    # Remove id field vì Firebase sẽ tự tạo
-    order_dict.pop('id', None)
-    
-    result = firebase._make_request("POST", "orders", order_dict)
+    with span("firebase_post"):
+        order_id = push_order(firebase, order)
     
-    if result and 'name' in result:
-        order_id = result['name']
+    if order_id:
         print(f"  ✓ Tạo đơn hàng thành công!")
         print(f"  Order ID: {order_id}")
         return order_id
@@ -343,7 +484,7 @@ def main():
     
     # 3. Khởi tạo Firebase Client
     print(f"\n2. Kết nối Firebase...")
-    firebase = FirebaseClient("https://robot-delivery-cbdcf-default-rtdb.firebaseio.com")
+    firebase = FirebaseClient(DEFAULT_DATABASE_URL)
     print(f"  ✓ Connected to Firebase")
     
     # 4. Tạo đơn hàng
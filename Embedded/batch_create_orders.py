@@ -3,15 +3,28 @@ Batch Create Orders - Tạo nhiều đơn hàng cùng lúc để test
 
 Chạy: python Embedded/batch_create_orders.py <số_lượng>
 Ví dụ: python Embedded/batch_create_orders.py 5
+       python Embedded/batch_create_orders.py 1000 --bulk
 """
 
 import sys
+import json
 import time
 import random
+from typing import Dict, List, Optional, Tuple
 from auto_create_order import (
-    create_order_on_firebase,
+    build_random_order,
+    get_route_from_osrm,
     FirebaseClient
 )
+from firebase_sample import DEFAULT_DATABASE_URL, generate_push_id
+from metrics import REGISTRY
+from order_pipeline import create_orders_concurrently, print_pipeline_report
+from profiling import ProfileCollector, add_hook, remove_hook
+
+FIREBASE_URL = DEFAULT_DATABASE_URL
+
+# Kích thước tối đa (bytes) của một request PATCH trong bulk mode
+DEFAULT_MAX_PAYLOAD_BYTES = 4 * 1024 * 1024
 
 # Địa điểm random trong Hà Nội
 HANOI_LOCATIONS = [
@@ -33,91 +46,214 @@ HANOI_LOCATIONS = [
 ]
 
 
-def batch_create(count: int, delay_seconds: float = 2.0):
+def batch_create(count: int, delay_seconds: float = 2.0, workers: int = 4,
+                 compact_route: bool = False):
     """
     Tạo nhiều đơn hàng cùng lúc
     
+    Các đơn được tạo song song trên `workers` luồng; thay vì sleep cố định,
+    tốc độ ghi Firebase được giới hạn bằng token bucket ở mức 1 đơn mỗi
+    `delay_seconds` giây (0 = không giới hạn).
+    
     Args:
         count: Số lượng đơn hàng cần tạo
-        delay_seconds: Thời gian đợi giữa mỗi đơn (giây)
+        delay_seconds: Khoảng cách trung bình giữa 2 lần ghi đơn (giây)
+        workers: Số worker chạy song song
+        compact_route: Ghi lộ trình dạng encoded polyline ("routePolyline")
     """
     print("\n" + "=" * 60)
-    print(f"BATCH CREATE: TẠO {count} ĐƠN HÀNG")
+    print(f"BATCH CREATE: TẠO {count} ĐƠN HÀNG ({workers} workers)")
     print("=" * 60)
     
     # Khởi tạo Firebase
     print("\nKết nối Firebase...")
-    firebase = FirebaseClient("https://robot-delivery-cbdcf-default-rtdb.firebaseio.com")
+    firebase = FirebaseClient(FIREBASE_URL, pool_size=max(10, workers))
     print("✓ Connected\n")
     
-    success_count = 0
-    fail_count = 0
-    order_ids = []
-    
+    destinations = []
     for i in range(count):
-        print(f"\n{'=' * 60}")
-        print(f"ĐƠN HÀNG {i + 1}/{count}")
-        print(f"{'=' * 60}")
-        
         # Random location
         location = random.choice(HANOI_LOCATIONS)
-        print(f"Đích đến: {location['name']}")
-        
-        # Tạo đơn hàng
-        order_id = create_order_on_firebase(
-            firebase,
-            location['lat'],
-            location['lng']
-        )
-        
-        if order_id:
-            success_count += 1
-            order_ids.append(order_id)
-            print(f"\n✓ Đơn {i + 1}: THÀNH CÔNG (ID: {order_id})")
-        else:
-            fail_count += 1
-            print(f"\n✗ Đơn {i + 1}: THẤT BẠI")
-        
-        # Đợi trước khi tạo đơn tiếp theo (trừ đơn cuối)
-        if i < count - 1:
-            print(f"\nĐợi {delay_seconds}s trước khi tạo đơn tiếp theo...")
-            time.sleep(delay_seconds)
+        print(f"Đơn {i + 1}/{count} - Đích đến: {location['name']}")
+        destinations.append((location['lat'], location['lng']))
+    
+    firebase_rate = 1.0 / delay_seconds if delay_seconds > 0 else None
+    result = create_orders_concurrently(
+        firebase,
+        destinations,
+        workers=workers,
+        firebase_rate=firebase_rate,
+        compact_route=compact_route,
+    )
     
     # Tổng kết
     print("\n" + "=" * 60)
     print("TỔNG KẾT")
     print("=" * 60)
     print(f"Tổng số đơn: {count}")
-    print(f"✓ Thành công: {success_count}")
-    print(f"✗ Thất bại: {fail_count}")
+    print(f"✓ Thành công: {len(result.order_ids)}")
+    print(f"✗ Thất bại: {result.failed}")
+    print_pipeline_report(result)
     
-    if order_ids:
+    if result.order_ids:
         print(f"\nDanh sách Order IDs:")
-        for idx, oid in enumerate(order_ids, 1):
+        for idx, oid in enumerate(result.order_ids, 1):
             print(f"  {idx}. {oid}")
     
     print("=" * 60 + "\n")
 
 
+def chunk_updates(updates: Dict[str, dict],
+                  max_payload_bytes: int = DEFAULT_MAX_PAYLOAD_BYTES) -> List[Dict[str, dict]]:
+    """
+    Chia một multi-path update thành nhiều phần, mỗi phần khi serialize
+    không vượt quá max_payload_bytes (một entry quá lớn vẫn được gửi riêng)
+    
+    Args:
+        updates: Dictionary đường dẫn -> giá trị
+        max_payload_bytes: Giới hạn kích thước JSON của mỗi request
+    
+    Returns:
+        Danh sách các dictionary con
+    """
+    chunks: List[Dict[str, dict]] = []
+    current: Dict[str, dict] = {}
+    current_size = 2  # "{}"
+    
+    for path, value in updates.items():
+        # "path": value, (ước lượng đúng với json.dumps mặc định)
+        entry_size = len(json.dumps(path)) + 2 + len(json.dumps(value)) + 2
+        if current and current_size + entry_size > max_payload_bytes:
+            chunks.append(current)
+            current = {}
+            current_size = 2
+        current[path] = value
+        current_size += entry_size
+    
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def batch_create_bulk(count: int,
+                      max_payload_bytes: int = DEFAULT_MAX_PAYLOAD_BYTES,
+                      firebase: Optional[FirebaseClient] = None,
+                      compact_route: bool = False) -> List[str]:
+    """
+    Tạo nhiều đơn hàng bằng multi-path PATCH tại root (bulk mode)
+    
+    - Lấy vị trí robot một lần cho cả batch
+    - Mỗi địa điểm đích chỉ gọi OSRM một lần
+    - Push ID được tạo phía client, N đơn được ghi trong ít request PATCH
+      (chia theo max_payload_bytes) thay vì N request POST
+    
+    Args:
+        count: Số lượng đơn hàng cần tạo
+        max_payload_bytes: Kích thước tối đa của mỗi request PATCH
+        firebase: FirebaseClient (mặc định kết nối FIREBASE_URL)
+        compact_route: Ghi lộ trình dạng encoded polyline ("routePolyline")
+    
+    Returns:
+        Danh sách Order IDs đã ghi thành công
+    """
+    print("\n" + "=" * 60)
+    print(f"BULK CREATE: TẠO {count} ĐƠN HÀNG (multi-path PATCH)")
+    print("=" * 60)
+    
+    start_time = time.perf_counter()
+    if firebase is None:
+        firebase = FirebaseClient(FIREBASE_URL)
+    
+    robot = firebase.get_robot_location()
+    if not robot:
+        print("✗ Không thể lấy vị trí robot từ Firebase")
+        return []
+    print(f"✓ Robot location: lat={robot.lat}, lng={robot.lon}")
+    
+    # Route theo từng địa điểm đích (mỗi cặp pickup-đích chỉ gọi OSRM một lần)
+    routes: Dict[Tuple[float, float], List[Tuple[float, float]]] = {}
+    updates: Dict[str, dict] = {}
+    
+    for _ in range(count):
+        location = random.choice(HANOI_LOCATIONS)
+        key = (location['lat'], location['lng'])
+        if key not in routes:
+            route_coords = get_route_from_osrm(robot.lat, robot.lon, key[0], key[1])
+            if not route_coords:
+                route_coords = [(robot.lat, robot.lon), key]
+            routes[key] = route_coords
+        
+        order = build_random_order(key[0], key[1], routes[key])
+        order_dict = order.to_dict(compact_route=compact_route)
+        order_dict.pop('id', None)
+        updates[f"orders/{generate_push_id()}"] = order_dict
+    
+    chunks = chunk_updates(updates, max_payload_bytes)
+    print(f"\nGhi {len(updates)} đơn trong {len(chunks)} request PATCH...")
+    
+    order_ids: List[str] = []
+    for index, chunk in enumerate(chunks, 1):
+        if firebase.multi_path_update(chunk):
+            order_ids.extend(path.split("/", 1)[1] for path in chunk)
+            print(f"  ✓ Chunk {index}/{len(chunks)}: {len(chunk)} đơn")
+        else:
+            print(f"  ✗ Chunk {index}/{len(chunks)}: THẤT BẠI ({len(chunk)} đơn)")
+    
+    elapsed = time.perf_counter() - start_time
+    print("\n" + "=" * 60)
+    print("TỔNG KẾT")
+    print("=" * 60)
+    print(f"Tổng số đơn: {count}")
+    print(f"✓ Thành công: {len(order_ids)}")
+    print(f"✗ Thất bại: {count - len(order_ids)}")
+    print(f"Thời gian: {elapsed:.2f}s ({len(routes)} lần gọi OSRM, {len(chunks)} request PATCH)")
+    print("=" * 60 + "\n")
+    
+    return order_ids
+
+
 def main():
-    if len(sys.argv) < 2:
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    bulk = "--bulk" in sys.argv[1:]
+    compact_route = "--compact-route" in sys.argv[1:]
+    show_metrics = "--metrics" in sys.argv[1:]
+    profile = "--profile" in sys.argv[1:]
+    
+    if len(args) < 1:
         print("\nCách sử dụng:")
-        print("  python Embedded/batch_create_orders.py <số_lượng> [delay_seconds]")
+        print("  python Embedded/batch_create_orders.py <số_lượng> [delay_seconds] [workers]")
+        print("  python Embedded/batch_create_orders.py <số_lượng> --bulk [max_payload_bytes]")
         print("\nVí dụ:")
         print("  python Embedded/batch_create_orders.py 5")
         print("  python Embedded/batch_create_orders.py 10 3.0")
+        print("  python Embedded/batch_create_orders.py 1000 --bulk")
         print("\nTham số:")
         print("  số_lượng: Số đơn hàng cần tạo")
-        print("  delay_seconds: Thời gian đợi giữa mỗi đơn (mặc định: 2.0s)")
+        print("  delay_seconds: Khoảng cách trung bình giữa 2 lần ghi đơn, 0 = không giới hạn (mặc định: 2.0s)")
+        print("  workers: Số đơn được tạo song song (mặc định: 4)")
+        print("  --bulk: Ghi tất cả đơn bằng multi-path PATCH (nhanh, dùng để seed dữ liệu)")
+        print("  --compact-route: Ghi lộ trình dạng encoded polyline (nhỏ hơn nhiều lần)")
+        print("  --metrics: In metrics request Firebase/OSRM (Prometheus text) khi chạy xong")
+        print("  --profile: In thời gian từng stage của mỗi đơn và bảng tổng hợp kiểu flame graph")
+        print(f"  max_payload_bytes: Kích thước tối đa mỗi PATCH (mặc định: {DEFAULT_MAX_PAYLOAD_BYTES})")
         return
     
     try:
-        count = int(sys.argv[1])
+        count = int(args[0])
         
         if count <= 0:
             print("Số lượng phải > 0")
             return
         
+        if bulk:
+            max_payload = DEFAULT_MAX_PAYLOAD_BYTES
+            if len(args) >= 2:
+                max_payload = int(args[1])
+            batch_create_bulk(count, max_payload, compact_route=compact_route)
+            if show_metrics:
+                print(REGISTRY.to_prometheus())
+            return
+        
         if count > 100:
             print("⚠️  Cảnh báo: Tạo quá nhiều đơn có thể làm quá tải Firebase")
             confirm = input(f"Bạn có chắc muốn tạo {count} đơn? (y/n): ").strip().lower()
@@ -127,11 +263,34 @@ def main():
         
         # Lấy delay (nếu có)
         delay = 2.0
-        if len(sys.argv) >= 3:
-            delay = float(sys.argv[2])
+        if len(args) >= 2:
+            delay = float(args[1])
+        
+        workers = 4
+        if len(args) >= 3:
+            workers = int(args[2])
         
         # Bắt đầu batch create
-        batch_create(count, delay)
+        collector = ProfileCollector(root_names=["create_order"]) if profile else None
+        if collector is not None:
+            add_hook(collector)
+        try:
+            batch_create(count, delay, workers, compact_route)
+        finally:
+            if collector is not None:
+                remove_hook(collector)
+        
+        if collector is not None:
+            print("\n" + "=" * 60)
+            print("PROFILE TỪNG ĐƠN")
+            print("=" * 60)
+            collector.print_breakdowns()
+            print("=" * 60)
+            print("PROFILE TỔNG HỢP")
+            print("=" * 60)
+            collector.print_summary()
+        if show_metrics:
+            print(REGISTRY.to_prometheus())
         
     except ValueError as e:
         print(f"Lỗi: Tham số không hợp lệ - {e}")
@@ -0,0 +1,333 @@
+"""
+Benchmarks - Đo hiệu năng các đường xử lý chính của Embedded tools
+
+Chạy offline hoàn toàn: Firebase và OSRM được thay bằng local_firebase_server.py
+và local_osrm_server.py chạy trong process.
+
+Chạy: python Embedded/benchmarks.py [--quick] [--output results.json]
+                                   [--baseline baseline.json] [--tolerance 0.2]
+                                   [--only order_parse,sse_events]
+
+- --output: ghi kết quả dạng JSON (để lưu làm baseline)
+- --baseline: so sánh với kết quả đã lưu, thoát với mã 1 nếu có chỉ số
+  chậm hơn baseline quá `tolerance` (0.2 = 20%)
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import auto_create_order
+from auto_create_order import create_order_on_firebase, downsample_route_points
+from firebase_sample import (
+    FirebaseClient,
+    Order,
+    OrderCache,
+    calculate_distance,
+    generate_push_id,
+    parse_sse_lines,
+)
+from fleet_simulator import FleetSimulator
+from local_firebase_server import LocalFirebaseServer
+from local_osrm_server import LocalOSRMServer
+from order_pipeline import percentile
+from route_cache import RouteCache
+
+
+CENTER = (21.0285, 105.8542)
+
+
+def _result(value: float, unit: str, higher_is_better: bool, **extra: Any) -> Dict[str, Any]:
+    result = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+    result.update(extra)
+    return result
+
+
+def _best_of(fn: Callable[[], Any], repeat: int) -> float:
+    """Thời gian nhỏ nhất (giây) của `repeat` lần chạy fn"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _random_point(spread: float = 0.03):
+    return (CENTER[0] + random.uniform(-spread, spread),
+            CENTER[1] + random.uniform(-spread, spread))
+
+
+def _random_route(points: int) -> List[Dict[str, Any]]:
+    lat, lng = CENTER
+    route = []
+    for i in range(points):
+        lat += random.uniform(-1e-4, 1e-4)
+        lng += random.uniform(-1e-4, 1e-4)
+        route.append({"lat": lat, "lng": lng, "order": i})
+    return route
+
+
+def _orders_snapshot(count: int, route_points: int = 50) -> Dict[str, Dict[str, Any]]:
+    """Snapshot `orders` giả lập (các đơn dùng chung một lộ trình để tiết kiệm RAM)"""
+    route = _random_route(route_points)
+    return {
+        generate_push_id(): {
+            "createdAt": datetime.now().isoformat(),
+            "destinationLat": route[-1]["lat"],
+            "destinationLng": route[-1]["lng"],
+            "goods": "Điện thoại",
+            "phoneNumber": "0912345678",
+            "receiverAge": 30,
+            "receiverName": "Nguyễn Văn An",
+            "routePoints": route,
+            "status": "pending",
+            "weight": 1.5,
+        }
+        for _ in range(count)
+    }
+
+
+# ==================== BENCHMARKS ====================
+
+def bench_order_models(sizes: List[int], repeat: int) -> Dict[str, Dict[str, Any]]:
+    """Order.from_dict / to_dict trên snapshot nhiều kích thước"""
+    results = {}
+    for size in sizes:
+        snapshot = _orders_snapshot(size)
+        parse_time = _best_of(
+            lambda: [Order.from_dict(data, order_id) for order_id, data in snapshot.items()],
+            repeat,
+        )
+        orders = [Order.from_dict(data, order_id) for order_id, data in snapshot.items()]
+        serialize_time = _best_of(lambda: [order.to_dict() for order in orders], repeat)
+        # Truy cập lộ trình => giải mã thật sự (lazy decode)
+        decode_time = _best_of(
+            lambda: [Order.from_dict(data, order_id).routePoints.lats
+                     for order_id, data in snapshot.items()],
+            repeat,
+        )
+
+        results[f"order_parse_{size}"] = _result(size / parse_time, "orders/s", True)
+        results[f"order_parse_with_route_{size}"] = _result(size / decode_time, "orders/s", True)
+        results[f"order_serialize_{size}"] = _result(size / serialize_time, "orders/s", True)
+    return results
+
+
+def bench_calculate_distance(count: int, repeat: int) -> Dict[str, Dict[str, Any]]:
+    points = [(_random_point(), _random_point()) for _ in range(count)]
+
+    def _run():
+        for (lat1, lng1), (lat2, lng2) in points:
+            calculate_distance(lat1, lng1, lat2, lng2)
+
+    elapsed = _best_of(_run, repeat)
+    return {"calculate_distance": _result(count / elapsed, "calls/s", True)}
+
+
+def bench_downsample(route_points: int, repeat: int) -> Dict[str, Dict[str, Any]]:
+    route = [(p["lat"], p["lng"]) for p in _random_route(route_points)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed = _best_of(lambda: downsample_route_points(route, max_points=100), repeat)
+    return {f"downsample_route_{route_points}": _result(elapsed * 1000, "ms", False)}
+
+
+def bench_sse_events(count: int, repeat: int) -> Dict[str, Dict[str, Any]]:
+    """Parse SSE + áp dụng vào OrderCache (đường xử lý của listen_orders)"""
+    snapshot = _orders_snapshot(200)
+    order_ids = list(snapshot)
+    lines: List[str] = [
+        "event: put",
+        "data: " + json.dumps({"path": "/", "data": snapshot}),
+        "",
+    ]
+    for i in range(count):
+        order_id = order_ids[i % len(order_ids)]
+        if i % 2:
+            payload = {"path": f"/{order_id}/status", "data": random.choice(["pending", "completed"])}
+            lines += ["event: put", "data: " + json.dumps(payload), ""]
+        else:
+            payload = {"path": f"/{order_id}", "data": {"status": "in_progress", "weight": 2.0}}
+            lines += ["event: patch", "data: " + json.dumps(payload), ""]
+
+    def _run():
+        cache = OrderCache()
+        for event_type, payload_str in parse_sse_lines(lines):
+            cache.apply_event(event_type, json.loads(payload_str))
+            cache.sorted_orders()
+
+    elapsed = _best_of(_run, repeat)
+    return {"sse_events": _result(count / elapsed, "events/s", True)}
+
+
+def bench_create_order(count: int) -> Dict[str, Dict[str, Any]]:
+    """Độ trễ end-to-end của create_order_on_firebase với Firebase/OSRM giả lập"""
+    old_servers = auto_create_order.OSRM_SERVERS
+    old_cache = auto_create_order._route_cache
+
+    with LocalFirebaseServer() as firebase_server, LocalOSRMServer() as osrm_server:
+        auto_create_order.OSRM_SERVERS = [osrm_server.url]
+        auto_create_order.set_route_cache(RouteCache(path=None))
+        try:
+            with FirebaseClient(firebase_server.url) as firebase:
+                firebase.update_robot_location(*CENTER)
+                latencies = []
+                with contextlib.redirect_stdout(io.StringIO()):
+                    for _ in range(count):
+                        start = time.perf_counter()
+                        create_order_on_firebase(firebase, *_random_point())
+                        latencies.append(time.perf_counter() - start)
+        finally:
+            auto_create_order.OSRM_SERVERS = old_servers
+            auto_create_order.set_route_cache(old_cache)
+
+    latencies.sort()
+    return {
+        "create_order_p50": _result(percentile(latencies, 50) * 1000, "ms", False),
+        "create_order_p95": _result(percentile(latencies, 95) * 1000, "ms", False),
+    }
+
+
+def bench_telemetry(seconds: float) -> Dict[str, Dict[str, Any]]:
+    """Số lần ghi vị trí mỗi giây: từng robot (PUT) và cả đội (multi-path PATCH)"""
+    with LocalFirebaseServer() as server, FirebaseClient(server.url) as firebase:
+        writes = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            lat, lng = _random_point()
+            firebase.update_robot_location(lat, lng)
+            writes += 1
+        put_rate = writes / (time.perf_counter() - start)
+
+        simulator = FleetSimulator(firebase, robot_count=1000, interval_seconds=1.0,
+                                   tick_seconds=0.1, seed=1)
+        start = time.perf_counter()
+        now = simulator.next_due()
+        while time.perf_counter() - start < seconds:
+            simulator.step(now)
+            now += simulator.tick_seconds
+        fleet_rate = simulator.robot_updates / (time.perf_counter() - start)
+
+    return {
+        "telemetry_put": _result(put_rate, "writes/s", True),
+        "telemetry_fleet": _result(fleet_rate, "robot updates/s", True),
+    }
+
+
+# ==================== RUNNER ====================
+
+def run_benchmarks(quick: bool = False, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Chạy toàn bộ benchmark
+
+    Args:
+        quick: Dùng kích thước nhỏ (kiểm tra nhanh, kết quả kém ổn định hơn)
+        only: Chỉ chạy các nhóm có tên trong danh sách
+              (order_models, calculate_distance, downsample, sse_events,
+              create_order, telemetry)
+
+    Returns:
+        {"meta": {...}, "results": {tên: {"value", "unit", "higher_is_better"}}}
+    """
+    random.seed(1234)
+    repeat = 2 if quick else 5
+    groups: Dict[str, Callable[[], Dict[str, Dict[str, Any]]]] = {
+        "order_models": lambda: bench_order_models(
+            [1000, 10000] if quick else [1000, 10000, 100000], 1 if quick else 3),
+        "calculate_distance": lambda: bench_calculate_distance(20000 if quick else 200000, repeat),
+        "downsample": lambda: bench_downsample(5000, repeat),
+        "sse_events": lambda: bench_sse_events(2000 if quick else 20000, repeat),
+        "create_order": lambda: bench_create_order(20 if quick else 200),
+        "telemetry": lambda: bench_telemetry(1.0 if quick else 3.0),
+    }
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, bench in groups.items():
+        if only and name not in only:
+            continue
+        print(f"▶ {name}...", flush=True)
+        results.update(bench())
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any],
+                          tolerance: float = 0.2) -> List[str]:
+    """
+    So sánh với baseline
+
+    Returns:
+        Danh sách tên chỉ số bị chậm đi quá tolerance
+    """
+    regressions = []
+    print(f"\n{'Benchmark':<32}{'baseline':>14}{'hiện tại':>14}{'thay đổi':>11}")
+    for name, current in results["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None or not base["value"]:
+            print(f"{name:<32}{'-':>14}{current['value']:>14.1f}{'mới':>11}")
+            continue
+
+        change = current["value"] / base["value"] - 1.0
+        worse = -change if current["higher_is_better"] else change
+        flag = ""
+        if worse > tolerance:
+            regressions.append(name)
+            flag = "  ✗"
+        print(f"{name:<32}{base['value']:>14.1f}{current['value']:>14.1f}"
+              f"{change * 100:>+10.1f}%{flag}")
+    return regressions
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    print(f"\n{'Benchmark':<32}{'giá trị':>14}  đơn vị")
+    for name, result in results["results"].items():
+        print(f"{name:<32}{result['value']:>14.1f}  {result['unit']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark các đường xử lý chính của Embedded tools")
+    parser.add_argument("--quick", action="store_true", help="Kích thước nhỏ, chạy nhanh")
+    parser.add_argument("--output", help="Ghi kết quả JSON ra file")
+    parser.add_argument("--baseline", help="File JSON baseline để so sánh")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Mức chậm đi tối đa so với baseline (mặc định 0.2 = 20%%)")
+    parser.add_argument("--only", help="Chỉ chạy các nhóm, cách nhau bởi dấu phẩy")
+    args = parser.parse_args()
+
+    only = [name.strip() for name in args.only.split(",")] if args.only else None
+    results = run_benchmarks(quick=args.quick, only=only)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n✓ Đã ghi kết quả: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n✗ Chậm hơn baseline quá {args.tolerance * 100:.0f}%: {', '.join(regressions)}")
+            return 1
+        print("\n✓ Không có chỉ số nào chậm hơn baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
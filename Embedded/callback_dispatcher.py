@@ -0,0 +1,256 @@
+"""
+Callback Dispatcher - Gọi callback trên thread riêng qua hàng đợi giới hạn
+
+Thread đọc stream (ví dụ FirebaseClient.listen_orders) chỉ submit() rồi đọc
+tiếp, nên callback chậm không còn giữ socket tới mức read timeout và kết nối lại.
+Chính sách khi callback không theo kịp (backpressure):
+- "block": giao mọi item theo thứ tự; submit() chờ khi đã có max_pending item
+- "drop": item mới gộp vào item đang chờ cuối cùng bằng merge() (mặc định giữ
+  item mới nhất, tức bỏ các snapshot trung gian); merge() trả về None để giữ
+  riêng item mới (ví dụ không gộp mất một snapshot đầy đủ)
+- "coalesce": như "drop" nhưng chờ thêm debounce_seconds kể từ item đầu tiên,
+  gộp cả loạt thay đổi dồn dập thành một lần gọi
+
+    dispatcher = CallbackDispatcher(handle, policy="coalesce", debounce_seconds=0.1)
+    dispatcher.submit(item)  # không chờ callback
+    ...
+    dispatcher.close()  # giao nốt item còn lại
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from metrics import REGISTRY, MetricsRegistry
+
+
+POLICIES = ("block", "drop", "coalesce")
+
+
+class CallbackDispatcher:
+    """Gọi callback(item) trên một thread nền theo thứ tự submit, với chính sách backpressure"""
+
+    def __init__(self,
+                 callback: Callable[[Any], None],
+                 policy: str = "block",
+                 max_pending: int = 1000,
+                 debounce_seconds: float = 0.05,
+                 merge: Optional[Callable[[Any, Any], Any]] = None,
+                 on_error: Optional[Callable[[Exception], None]] = None,
+                 name: str = "callback",
+                 metrics: Optional[MetricsRegistry] = None,
+                 autostart: bool = True):
+        """
+        Args:
+            callback: Hàm nhận một item (chạy trên thread nền)
+            policy: "block", "drop" hoặc "coalesce" (xem docstring module)
+            max_pending: Số item tối đa đang chờ với policy "block"
+            debounce_seconds: Thời gian gom item với policy "coalesce"
+            merge: Hàm merge(item_cũ, item_mới) -> item gộp cho "drop"/"coalesce"
+                   (mặc định giữ item mới); trả về None = không gộp, xếp item mới
+                   sau item cũ
+            on_error: Callback khi callback chính ném lỗi (mặc định in ra console)
+            name: Giá trị label `dispatcher` của các metric
+            metrics: MetricsRegistry ghi độ dài hàng đợi, thời gian chờ và
+                     thời gian chạy callback (mặc định metrics.REGISTRY)
+            autostart: Tự chạy thread nền (False = gọi start() sau)
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"policy phải là một trong {POLICIES}, nhận được {policy!r}")
+
+        self.callback = callback
+        self.policy = policy
+        self.max_pending = max(1, max_pending)
+        self.debounce_seconds = debounce_seconds
+        self.merge = merge or (lambda older, newer: newer)
+        self.on_error = on_error
+        self.name = name
+
+        # (item, thời điểm submit item đầu tiên được gộp vào)
+        self._items: Deque[Tuple[Any, float]] = deque()
+        self._changed = threading.Condition()
+        self._busy = False
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+
+        registry = metrics if metrics is not None else REGISTRY
+        self._depth = registry.gauge(
+            "callback_queue_depth", "Số item đang chờ callback")
+        self._events_total = registry.counter(
+            "callback_events_total", "Số item theo kết quả (submitted/coalesced/blocked/delivered/error)")
+        self._wait_seconds = registry.histogram(
+            "callback_queue_wait_seconds", "Thời gian từ submit tới khi callback bắt đầu chạy")
+        self._duration_seconds = registry.histogram(
+            "callback_duration_seconds", "Thời gian chạy callback")
+
+        # Thống kê
+        self.submitted = 0
+        self.coalesced = 0
+        self.blocked = 0
+        self.delivered = 0
+        self.errors = 0
+        self.max_depth = 0
+
+        if autostart:
+            self.start()
+
+    # ==================== PRODUCER ====================
+
+    def submit(self, item: Any) -> bool:
+        """
+        Đưa item vào hàng đợi; chỉ chờ khi policy "block" và hàng đợi đầy
+
+        Returns:
+            False nếu dispatcher đã đóng (item bị bỏ)
+        """
+        now = time.monotonic()
+        with self._changed:
+            if self._closing:
+                return False
+            self.submitted += 1
+            self._events_total.inc(dispatcher=self.name, outcome="submitted")
+
+            if self.policy == "block":
+                if len(self._items) >= self.max_pending:
+                    self.blocked += 1
+                    self._events_total.inc(dispatcher=self.name, outcome="blocked")
+                    while len(self._items) >= self.max_pending and not self._closing:
+                        self._changed.wait()
+                self._items.append((item, now))
+            elif self._items:
+                # Callback chưa lấy item trước => gộp vào item cuối cùng
+                older, first_submitted = self._items[-1]
+                merged = self.merge(older, item)
+                if merged is None:
+                    self._items.append((item, now))
+                else:
+                    self._items[-1] = (merged, first_submitted)
+                    self.coalesced += 1
+                    self._events_total.inc(dispatcher=self.name, outcome="coalesced")
+            else:
+                self._items.append((item, now))
+
+            depth = len(self._items)
+            self.max_depth = max(self.max_depth, depth)
+            self._changed.notify_all()
+        self._depth.set(depth, dispatcher=self.name)
+        return True
+
+    # ==================== WORKER ====================
+
+    def start(self) -> None:
+        """Chạy thread nền gọi callback"""
+        if self._thread is not None:
+            return
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-dispatcher", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Ngừng nhận item, giao nốt các item đang chờ (bỏ qua debounce) rồi dừng thread nền"""
+        thread = self._thread
+        if thread is None:
+            return
+        with self._changed:
+            self._closing = True
+            self._changed.notify_all()
+        if thread is not threading.current_thread():
+            thread.join(timeout)
+        self._thread = None
+
+    def __enter__(self) -> 'CallbackDispatcher':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Chờ tới khi mọi item đã được giao
+
+        Returns:
+            True nếu hàng đợi trống và callback không còn chạy trước khi hết timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self._items or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._thread is None:
+                    return False
+                self._changed.wait(remaining)
+            return True
+
+    def _next_item(self) -> Optional[Tuple[Any, float]]:
+        """Lấy item tiếp theo (chờ hết debounce với "coalesce"); None khi đã đóng và hết item"""
+        with self._changed:
+            while not self._items and not self._closing:
+                self._changed.wait()
+            if not self._items:
+                return None
+
+            if self.policy == "coalesce":
+                # Cửa sổ cố định tính từ item đầu tiên => độ trễ tối đa debounce_seconds
+                deadline = self._items[0][1] + self.debounce_seconds
+                while not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._changed.wait(remaining)
+
+            entry = self._items.popleft()
+            depth = len(self._items)
+            self._busy = True
+            self._changed.notify_all()
+        self._depth.set(depth, dispatcher=self.name)
+        return entry
+
+    def _run(self) -> None:
+        while True:
+            entry = self._next_item()
+            if entry is None:
+                break
+
+            item, submitted_at = entry
+            self._wait_seconds.observe(time.monotonic() - submitted_at, dispatcher=self.name)
+            start = time.perf_counter()
+            try:
+                self.callback(item)
+                outcome = "delivered"
+            except Exception as exc:
+                outcome = "error"
+                if self.on_error:
+                    self.on_error(exc)
+                else:
+                    print(f"Lỗi callback ({self.name}): {exc}")
+            self._duration_seconds.observe(time.perf_counter() - start, dispatcher=self.name)
+            self._events_total.inc(dispatcher=self.name, outcome=outcome)
+
+            with self._changed:
+                if outcome == "delivered":
+                    self.delivered += 1
+                else:
+                    self.errors += 1
+                self._busy = False
+                self._changed.notify_all()
+
+    # ==================== STATS ====================
+
+    @property
+    def pending(self) -> int:
+        """Số item đang chờ callback"""
+        with self._changed:
+            return len(self._items)
+
+    def stats(self) -> Dict[str, float]:
+        """Số item đã nhận, bị gộp, phải chờ, đã giao, lỗi và độ dài hàng đợi lớn nhất"""
+        with self._changed:
+            return {
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "blocked": self.blocked,
+                "delivered": self.delivered,
+                "errors": self.errors,
+                "pending": len(self._items),
+                "max_depth": self.max_depth,
+            }
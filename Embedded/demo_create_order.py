@@ -9,6 +9,7 @@ from auto_create_order import (
     create_order_on_firebase,
     FirebaseClient
 )
+from firebase_sample import DEFAULT_DATABASE_URL
 
 # Một số địa điểm nổi tiếng ở Hà Nội để test
 DEMO_LOCATIONS = [
@@ -70,7 +71,7 @@ def main():
         print(f"  Tọa độ: {location['lat']}, {location['lng']}")
         
         # Khởi tạo Firebase
-        firebase = FirebaseClient("https://robot-delivery-cbdcf-default-rtdb.firebaseio.com")
+        firebase = FirebaseClient(DEFAULT_DATABASE_URL)
         
         # Tạo đơn hàng
         order_id = create_order_on_firebase(
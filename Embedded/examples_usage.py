@@ -13,6 +13,7 @@ from auto_create_order import (
     create_order_on_firebase,
     FirebaseClient
 )
+from firebase_sample import DEFAULT_DATABASE_URL
 
 
 def example_1_parse_link():
@@ -89,7 +90,7 @@ def example_4_create_order_full():
     print(f"Tọa độ: {dest_lat}, {dest_lng}")
     
     try:
-        firebase = FirebaseClient("https://robot-delivery-cbdcf-default-rtdb.firebaseio.com")
+        firebase = FirebaseClient(DEFAULT_DATABASE_URL)
         order_id = create_order_on_firebase(firebase, dest_lat, dest_lng)
         
         if order_id:
@@ -107,7 +108,7 @@ def example_5_firebase_operations():
     print("=" * 60)
     
     try:
-        firebase = FirebaseClient("https://robot-delivery-cbdcf-default-rtdb.firebaseio.com")
+        firebase = FirebaseClient(DEFAULT_DATABASE_URL)
         
         # Lấy vị trí robot
         print("\n1. Lấy vị trí robot:")
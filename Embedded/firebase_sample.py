@@ -3,21 +3,45 @@ Firebase Realtime Database Client
 Đẩy vị trí robot và lấy dữ liệu từ Firebase Realtime Database
 """
 
+import os
 import requests
 import json
 import time
 import random
 import math
-from typing import Any, Callable, Dict, List, Optional, Tuple
+import threading
+from array import array
+from collections.abc import Sequence
+from requests.adapters import HTTPAdapter
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from dataclasses import dataclass, asdict
 from datetime import datetime
 
+import numpy as np
+
+from geo_utils import decode_polyline, encode_polyline, haversine, haversine_scalar
+from json_stream import iter_object_items
+from callback_dispatcher import CallbackDispatcher
+from metrics import REGISTRY, MetricsRegistry, path_label
+from profiling import span
+
+if TYPE_CHECKING:
+    from telemetry import TelemetryPublisher
+    from telemetry_queue import TelemetryQueue
+    from order_snapshot import OrderSnapshotStore
+
 
 # ==================== MODELS ====================
 
+# Số chữ số thập phân của lộ trình dạng encoded polyline (5 chữ số ~ 1.1m)
+ROUTE_POLYLINE_PRECISION = 5
+
+
 @dataclass
 class RoutePoint:
     """Điểm trên lộ trình"""
+    __slots__ = ("lat", "lng", "order")
+    
     lat: float
     lng: float
     order: int
@@ -38,9 +62,139 @@ class RoutePoint:
         )
 
 
+class RoutePointList(Sequence):
+    """
+    Danh sách RoutePoint lưu gọn dưới dạng 2 mảng float64 (lat, lng).
+    
+    Dữ liệu gốc (list {lat, lng, order} hoặc chuỗi encoded polyline) chỉ được
+    giải mã khi truy cập lần đầu, nên parse Order không tốn chi phí cho lộ trình
+    nếu không dùng đến. RoutePoint được tạo khi truy cập từng phần tử
+    (order = vị trí trong danh sách).
+    """
+    __slots__ = ("_raw", "_lats", "_lngs")
+    
+    def __init__(self, points: Iterable[Any] = ()):
+        """
+        Args:
+            points: Các RoutePoint hoặc tuple (lat, lng)
+        """
+        self._raw: Any = None
+        self._lats = array("d")
+        self._lngs = array("d")
+        for point in points:
+            if isinstance(point, RoutePoint):
+                self._lats.append(point.lat)
+                self._lngs.append(point.lng)
+            else:
+                lat, lng = point
+                self._lats.append(lat)
+                self._lngs.append(lng)
+    
+    @classmethod
+    def from_raw(cls, raw: Any) -> 'RoutePointList':
+        """
+        Tạo danh sách chưa giải mã từ dữ liệu JSON
+        
+        Args:
+            raw: list các dict {lat, lng, order} hoặc chuỗi encoded polyline
+        """
+        if not isinstance(raw, (list, str)):
+            raise TypeError(f"Route points không hợp lệ: {type(raw).__name__}")
+        
+        instance = cls()
+        instance._raw = raw
+        return instance
+    
+    def _decode(self) -> None:
+        raw, self._raw = self._raw, None
+        if isinstance(raw, str):
+            for lat, lng in decode_polyline(raw, ROUTE_POLYLINE_PRECISION):
+                self._lats.append(lat)
+                self._lngs.append(lng)
+        else:
+            for rp in raw:
+                self._lats.append(float(rp["lat"]))
+                self._lngs.append(float(rp["lng"]))
+    
+    @property
+    def lats(self) -> array:
+        """Mảng vĩ độ (array('d'))"""
+        if self._raw is not None:
+            self._decode()
+        return self._lats
+    
+    @property
+    def lngs(self) -> array:
+        """Mảng kinh độ (array('d'))"""
+        if self._raw is not None:
+            self._decode()
+        return self._lngs
+    
+    def coords(self) -> List[Tuple[float, float]]:
+        """List of (lat, lng)"""
+        return list(zip(self.lats, self.lngs))
+    
+    def to_raw_list(self) -> List[dict]:
+        """Định dạng JSON cũ: list {lat, lng, order}"""
+        if isinstance(self._raw, list):
+            # Chưa giải mã => trả lại nguyên dữ liệu gốc, không cần dựng lại
+            return self._raw
+        return [
+            {"lat": lat, "lng": lng, "order": i}
+            for i, (lat, lng) in enumerate(zip(self.lats, self.lngs))
+        ]
+    
+    def to_polyline(self) -> str:
+        """Định dạng encoded polyline"""
+        if isinstance(self._raw, str):
+            return self._raw
+        return encode_polyline(self.coords(), ROUTE_POLYLINE_PRECISION)
+    
+    def __len__(self) -> int:
+        if isinstance(self._raw, list):
+            return len(self._raw)
+        return len(self.lats)
+    
+    def __getitem__(self, index):
+        lats = self.lats
+        lngs = self.lngs
+        if isinstance(index, slice):
+            return [
+                RoutePoint(lat=lats[i], lng=lngs[i], order=i)
+                for i in range(*index.indices(len(lats)))
+            ]
+        if index < 0:
+            index += len(lats)
+        if not 0 <= index < len(lats):
+            raise IndexError("route point index out of range")
+        return RoutePoint(lat=lats[index], lng=lngs[index], order=index)
+    
+    def __iter__(self) -> Iterator[RoutePoint]:
+        for i, (lat, lng) in enumerate(zip(self.lats, self.lngs)):
+            yield RoutePoint(lat=lat, lng=lng, order=i)
+    
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, RoutePointList):
+            # Cùng dữ liệu gốc chưa giải mã => bằng nhau, khỏi giải mã
+            if self._raw is not None and self._raw == other._raw:
+                return True
+            return self.lats == other.lats and self.lngs == other.lngs
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return list(self) == list(other)
+        return NotImplemented
+    
+    def __repr__(self) -> str:
+        return f"RoutePointList({len(self)} points)"
+
+
 @dataclass
 class Order:
     """Đơn hàng giao hàng"""
+    __slots__ = (
+        "id", "createdAt", "destinationLat", "destinationLng", "goods",
+        "phoneNumber", "receiverAge", "receiverName", "routePoints", "status", "weight",
+    )
+    
     id: str
     createdAt: str
     destinationLat: float
@@ -49,12 +203,21 @@ class Order:
     phoneNumber: str
     receiverAge: int
     receiverName: str
-    routePoints: List[RoutePoint]
+    routePoints: RoutePointList  # nhận cả list RoutePoint, tự chuyển sang RoutePointList
     status: str  # "pending", "in_progress", "completed"
     weight: float
     
-    def to_dict(self) -> dict:
-        return {
+    def __post_init__(self):
+        if not isinstance(self.routePoints, RoutePointList):
+            self.routePoints = RoutePointList(self.routePoints)
+    
+    def to_dict(self, compact_route: bool = False) -> dict:
+        """
+        Args:
+            compact_route: True = ghi lộ trình dạng encoded polyline vào
+                           "routePolyline" thay cho list "routePoints"
+        """
+        data = {
             "id": self.id,
             "createdAt": self.createdAt,
             "destinationLat": self.destinationLat,
@@ -63,13 +226,23 @@ class Order:
             "phoneNumber": self.phoneNumber,
             "receiverAge": self.receiverAge,
             "receiverName": self.receiverName,
-            "routePoints": [rp.to_dict() for rp in self.routePoints],
             "status": self.status,
             "weight": self.weight
         }
+        if compact_route:
+            data["routePolyline"] = self.routePoints.to_polyline()
+        else:
+            data["routePoints"] = self.routePoints.to_raw_list()
+        return data
     
     @classmethod
     def from_dict(cls, data: dict, order_id: Optional[str] = None) -> 'Order':
+        # Lộ trình được giữ nguyên dạng gốc, chỉ giải mã khi truy cập
+        if data.get("routePolyline") is not None:
+            route_points = RoutePointList.from_raw(data["routePolyline"])
+        else:
+            route_points = RoutePointList.from_raw(data["routePoints"])
+        
         return cls(
             id=order_id or data.get("id", ""),
             createdAt=data["createdAt"],
@@ -79,7 +252,7 @@ class Order:
             phoneNumber=data["phoneNumber"],
             receiverAge=int(data["receiverAge"]),
             receiverName=data["receiverName"],
-            routePoints=[RoutePoint.from_dict(rp) for rp in data["routePoints"]],
+            routePoints=route_points,
             status=data["status"],
             weight=float(data["weight"])
         )
@@ -88,6 +261,8 @@ class Order:
 @dataclass
 class Robot:
     """Vị trí robot"""
+    __slots__ = ("lat", "lon")
+    
     lat: float
     lon: float  # Note: trong JSON là "lon" nhưng trong model có thể dùng "lng"
     
@@ -108,38 +283,585 @@ class Robot:
 @dataclass
 class DatabaseData:
     """Toàn bộ dữ liệu từ Firebase"""
+    __slots__ = ("orders", "robot")
+    
     orders: Dict[str, Order]
     robot: Robot
     
     @classmethod
     def from_dict(cls, data: dict) -> 'DatabaseData':
-        orders = {}
-        if "orders" in data and data["orders"]:
-            for order_id, order_data in data["orders"].items():
-                orders[order_id] = Order.from_dict(order_data, order_id)
-        
+        orders = parse_orders(data.get("orders"))
         robot = Robot.from_dict(data.get("robot", {"lat": 0.0, "lon": 0.0}))
         
         return cls(orders=orders, robot=robot)
 
 
+def parse_orders(data: Any) -> Dict[str, Order]:
+    """
+    Parse node `orders` (dict order_id -> dữ liệu đơn) thành dict order_id -> Order
+    
+    Đơn lỗi được in ra và bỏ qua, không làm mất các đơn còn lại.
+    """
+    if not isinstance(data, dict):
+        return {}
+    
+    orders = {}
+    for order_id, order_data in data.items():
+        try:
+            orders[order_id] = Order.from_dict(order_data, order_id)
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            print(f"Lỗi khi parse order {order_id}: {e}")
+    
+    return orders
+
+
+# ==================== ORDER CACHE ====================
+
+@dataclass
+class OrderChange:
+    """Một đơn hàng được thêm, sửa hoặc xóa, kèm Order trước và sau thay đổi"""
+    __slots__ = ("kind", "order_id", "old", "new")
+    
+    kind: str  # "added", "updated", "removed"
+    order_id: str
+    old: Optional[Order]  # None nếu kind == "added"
+    new: Optional[Order]  # None nếu kind == "removed"
+    
+    @classmethod
+    def between(cls, order_id: str, old: Optional[Order],
+                new: Optional[Order]) -> Optional['OrderChange']:
+        """OrderChange từ Order cũ sang Order mới (None nếu không có gì thay đổi)"""
+        if old is None:
+            return cls("added", order_id, None, new) if new is not None else None
+        if new is None:
+            return cls("removed", order_id, old, None)
+        return cls("updated", order_id, old, new) if old != new else None
+    
+    @property
+    def order(self) -> Order:
+        """Order hiện tại (Order cũ nếu đơn đã bị xóa)"""
+        return self.new if self.new is not None else self.old
+    
+    def changed_fields(self) -> List[str]:
+        """Tên các field khác nhau giữa old và new (mọi field nếu added/removed)"""
+        if self.old is None or self.new is None:
+            return list(Order.__slots__)
+        return [
+            name for name in Order.__slots__
+            if getattr(self.old, name) != getattr(self.new, name)
+        ]
+
+
+def merge_order_changes(older: List[OrderChange], newer: List[OrderChange]) -> List[OrderChange]:
+    """
+    Gộp 2 loạt thay đổi liên tiếp thành một: mỗi đơn giữ Order cũ của loạt
+    trước và Order mới của loạt sau (đơn thêm rồi xóa trong cùng lúc bị bỏ)
+    """
+    merged: Dict[str, Optional[OrderChange]] = {change.order_id: change for change in older}
+    for change in newer:
+        first = merged.get(change.order_id)
+        if first is None:
+            merged[change.order_id] = change
+        else:
+            merged[change.order_id] = OrderChange.between(change.order_id, first.old, change.new)
+    return [change for change in merged.values() if change is not None]
+
+
+def _split_path(path: Optional[str]) -> List[str]:
+    """Tách path của Firebase ("/a/b") thành các segment ["a", "b"]"""
+    if not path:
+        return []
+    return [segment for segment in path.split("/") if segment]
+
+
+def _set_child(node: Any, key: str, value: Any) -> Any:
+    """
+    Gán (hoặc xóa nếu value là None) con `key` của node dict/list.
+    Trả về node sau khi gán (có thể là dict mới nếu node không phải container).
+    """
+    if isinstance(node, list) and key.isdigit():
+        index = int(key)
+        if value is None:
+            if index < len(node):
+                node[index] = None
+            while node and node[-1] is None:
+                node.pop()
+        else:
+            node.extend([None] * (index + 1 - len(node)))
+            node[index] = value
+        return node
+    
+    if not isinstance(node, dict):
+        node = {}
+    if value is None:
+        node.pop(key, None)
+    else:
+        node[key] = value
+    return node
+
+
+def _set_at_path(node: Any, segments: List[str], value: Any) -> Any:
+    """Gán value tại đường dẫn segments bên trong node, trả về node mới"""
+    if not segments:
+        return value
+    
+    head, rest = segments[0], segments[1:]
+    child = None
+    if isinstance(node, dict):
+        child = node.get(head)
+    elif isinstance(node, list) and head.isdigit() and int(head) < len(node):
+        child = node[int(head)]
+    
+    new_child = _set_at_path(child, rest, value) if rest else value
+    # Firebase không lưu node rỗng
+    if new_child in ({}, []):
+        new_child = None
+    return _set_child(node, head, new_child)
+
+
+class OrderCache:
+    """
+    Bản sao cục bộ của node `orders`, cập nhật tăng dần theo event put/patch
+    của Firebase SSE (mỗi event chỉ parse lại những đơn hàng bị thay đổi).
+    """
+    
+    def __init__(self, track_changes: bool = False):
+        """
+        Args:
+            track_changes: Ghi nhận Order cũ của các đơn bị thay đổi để lấy
+                           danh sách OrderChange bằng take_changes()
+        """
+        self._raw: Dict[str, Any] = {}
+        self._orders: Dict[str, Order] = {}
+        self._sorted: Optional[List[Order]] = None
+        self.loaded = False
+        self.track_changes = track_changes
+        # order_id -> Order trước lần thay đổi đầu tiên kể từ take_changes() trước
+        self._previous: Dict[str, Optional[Order]] = {}
+    
+    @property
+    def orders(self) -> Dict[str, Order]:
+        """Dictionary order_id -> Order hiện có trong cache"""
+        return self._orders
+    
+    @property
+    def raw_orders(self) -> Dict[str, Any]:
+        """Dictionary order_id -> dữ liệu JSON gốc (không sửa trực tiếp)"""
+        return self._raw
+    
+    @staticmethod
+    def touched_ids(event_type: str, payload: Any) -> Optional[Set[str]]:
+        """
+        Các order_id bị một event put/patch thay đổi
+        
+        Returns:
+            Set order_id, hoặc None nếu event thay toàn bộ node `orders`
+        """
+        if event_type not in ("put", "patch") or not isinstance(payload, dict):
+            return set()
+        
+        segments = _split_path(payload.get("path"))
+        if segments:
+            return {segments[0]}
+        if event_type == "put":
+            return None
+        
+        data = payload.get("data")
+        if not isinstance(data, dict):
+            return set()
+        touched = set()
+        for key in data:
+            key_segments = _split_path(key)
+            if not key_segments:
+                return None
+            touched.add(key_segments[0])
+        return touched
+    
+    def load(self, data: Optional[Dict[str, Any]]) -> None:
+        """Thay toàn bộ cache bằng snapshot `orders` (dữ liệu JSON gốc)"""
+        new_raw = dict(data) if isinstance(data, dict) else {}
+        if self.track_changes:
+            for order_id, order in self._orders.items():
+                self._previous.setdefault(order_id, order)
+            for order_id in new_raw:
+                self._previous.setdefault(order_id, None)
+        self._raw = new_raw
+        self._orders = {}
+        for order_id in self._raw:
+            self._reparse(order_id)
+        self._sorted = None
+        self.loaded = True
+    
+    def apply_event(self, event_type: str, payload: Any) -> bool:
+        """
+        Áp dụng một event SSE vào cache
+        
+        Args:
+            event_type: "put" hoặc "patch" (các event khác bị bỏ qua)
+            payload: {"path": "/...", "data": ...} từ Firebase
+        
+        Returns:
+            True nếu event đã được áp dụng
+        """
+        if event_type not in ("put", "patch") or not isinstance(payload, dict):
+            return False
+        
+        segments = _split_path(payload.get("path"))
+        data = payload.get("data")
+        
+        if event_type == "put":
+            if not segments:
+                self.load(data)
+            else:
+                self._put(segments, data)
+            return True
+        
+        # patch: mỗi key trong data là một đường dẫn con tương đối với path
+        if isinstance(data, dict):
+            for key, value in data.items():
+                self._put(segments + _split_path(key), value)
+        return True
+    
+    def needs_snapshot(self, event_type: str, payload: Any) -> bool:
+        """
+        True nếu cache chưa có snapshot và event này cũng không phải snapshot
+        (put tại root), tức là cần tải toàn bộ `orders` một lần trước khi áp dụng.
+        """
+        if self.loaded:
+            return False
+        is_root_put = (
+            event_type == "put"
+            and isinstance(payload, dict)
+            and not _split_path(payload.get("path"))
+        )
+        return not is_root_put
+    
+    def take_changes(self) -> List[OrderChange]:
+        """
+        Các đơn hàng đã thay đổi kể từ lần gọi trước (cần track_changes=True).
+        Chỉ duyệt các đơn bị event chạm tới; đơn bị sửa rồi trả về như cũ bị bỏ qua.
+        
+        Returns:
+            List OrderChange theo thứ tự đơn hàng bị thay đổi lần đầu
+        """
+        previous, self._previous = self._previous, {}
+        changes = []
+        for order_id, old in previous.items():
+            change = OrderChange.between(order_id, old, self._orders.get(order_id))
+            if change is not None:
+                changes.append(change)
+        return changes
+    
+    def sorted_orders(self) -> List[Order]:
+        """Danh sách Order sắp xếp giảm dần theo createdAt"""
+        if self._sorted is None:
+            self._sorted = sorted(
+                self._orders.values(),
+                key=lambda o: o.createdAt,
+                reverse=True,
+            )
+        return self._sorted
+    
+    def _put(self, segments: List[str], value: Any) -> None:
+        if not segments:
+            self.load(value)
+            return
+        
+        order_id = segments[0]
+        if self.track_changes:
+            if order_id not in self._previous:
+                self._previous[order_id] = self._orders.get(order_id)
+            old = self._previous[order_id]
+            if old is not None and len(segments) > 2 and segments[1] == "routePoints":
+                # Lộ trình chưa giải mã dùng chung list gốc sắp bị sửa tại chỗ
+                # => giải mã trước để Order cũ giữ nguyên lộ trình cũ
+                old.routePoints.coords()
+        if len(segments) == 1:
+            new_raw = value
+        else:
+            new_raw = _set_at_path(self._raw.get(order_id), segments[1:], value)
+        
+        if new_raw is None:
+            self._raw.pop(order_id, None)
+        else:
+            self._raw[order_id] = new_raw
+        self._reparse(order_id)
+        self._sorted = None
+    
+    def _reparse(self, order_id: str) -> None:
+        order_data = self._raw.get(order_id)
+        if order_data is None:
+            self._orders.pop(order_id, None)
+            return
+        
+        try:
+            self._orders[order_id] = Order.from_dict(order_data, order_id)
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            # Đơn hàng chưa đầy đủ dữ liệu (vd. đang được ghi từng phần)
+            self._orders.pop(order_id, None)
+            print(f"Lỗi khi parse order {order_id}: {e}")
+
+
+class SSEParser:
+    """
+    Parser tăng dần cho text/event-stream: đưa từng dòng vào feed(),
+    nhận về (event_type, payload_str) khi một event kết thúc.
+    """
+    
+    def __init__(self):
+        self._event_type: Optional[str] = None
+        self._data_buffer: List[str] = []
+    
+    def feed(self, raw_line: Optional[str]) -> Optional[Tuple[str, str]]:
+        """
+        Xử lý một dòng của stream
+        
+        Returns:
+            Tuple (event_type, payload_str) nếu dòng này kết thúc một event,
+            ngược lại None. event_type mặc định là "message".
+        """
+        if raw_line is None:
+            return None
+        
+        line = raw_line.strip()
+        
+        # Dòng trống => kết thúc một event
+        if line == "":
+            event = None
+            if self._data_buffer:
+                event = (
+                    self._event_type or "message",
+                    "\n".join(self._data_buffer).strip(),
+                )
+            self._data_buffer = []
+            self._event_type = None
+            return event
+        
+        if line.startswith("event:"):
+            self._event_type = line[len("event:") :].strip()
+        elif line.startswith("data:"):
+            self._data_buffer.append(line[len("data:") :].strip())
+        # Các dòng khác (ví dụ comment bắt đầu bằng ':') bỏ qua
+        return None
+
+
+def parse_sse_lines(lines: Iterable[Optional[str]]) -> Iterator[Tuple[str, str]]:
+    """
+    Tách luồng dòng text/event-stream thành các event
+    
+    Args:
+        lines: Các dòng (đã decode) đọc từ response stream
+    
+    Yields:
+        Tuple (event_type, payload_str); event_type mặc định là "message"
+    """
+    parser = SSEParser()
+    for raw_line in lines:
+        event = parser.feed(raw_line)
+        if event is not None:
+            yield event
+
+
+class StreamLineSplitter:
+    """
+    Tách các chunk byte của response stream thành từng dòng (đã decode UTF-8)
+    
+    Khác Response.iter_lines (nối chuỗi đang chờ với mỗi chunk mới, O(n²) với
+    một dòng dài), các phần của dòng chưa kết thúc được gom trong list và chỉ
+    nối một lần, nên event snapshot nhiều MB vẫn tách trong thời gian tuyến tính.
+    Không giới hạn độ dài dòng, dùng được cho cả stream sync và async.
+    """
+    
+    def __init__(self):
+        self._pending: List[bytes] = []
+    
+    def feed(self, chunk: bytes) -> List[str]:
+        """
+        Returns:
+            Các dòng kết thúc trong chunk này, không gồm "\n" hoặc "\r\n"
+        """
+        lines = []
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                if start < len(chunk):
+                    self._pending.append(chunk[start:])
+                return lines
+            piece = chunk[start:end]
+            if self._pending:
+                self._pending.append(piece)
+                piece = b"".join(self._pending)
+                self._pending = []
+            if piece.endswith(b"\r"):
+                piece = piece[:-1]
+            lines.append(piece.decode("utf-8"))
+            start = end + 1
+    
+    def finish(self) -> List[str]:
+        """Dòng cuối chưa có ký tự xuống dòng (nếu còn)"""
+        if not self._pending:
+            return []
+        line = b"".join(self._pending).decode("utf-8")
+        self._pending = []
+        return [line]
+
+
+def iter_stream_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """
+    Tách các chunk byte thành từng dòng bằng StreamLineSplitter
+    
+    Args:
+        chunks: Các chunk byte, ví dụ response.iter_content(chunk_size=512)
+    
+    Yields:
+        Từng dòng không gồm ký tự xuống dòng ("\n" hoặc "\r\n")
+    """
+    splitter = StreamLineSplitter()
+    for chunk in chunks:
+        yield from splitter.feed(chunk)
+    yield from splitter.finish()
+
+
 # ==================== FIREBASE CLIENT ====================
 
+# URL database mặc định của các script, ghi đè bằng biến môi trường
+# FIREBASE_DATABASE_URL (ví dụ trỏ tới local_firebase_server.py khi test offline)
+DEFAULT_DATABASE_URL = os.environ.get(
+    "FIREBASE_DATABASE_URL",
+    "https://robot-delivery-cbdcf-default-rtdb.firebaseio.com",
+)
+
+
+def build_query_params(order_by: Optional[str] = None,
+                       equal_to: Any = None,
+                       start_at: Any = None,
+                       end_at: Any = None,
+                       limit_to_first: Optional[int] = None,
+                       limit_to_last: Optional[int] = None,
+                       shallow: bool = False) -> Dict[str, str]:
+    """
+    Tạo query parameters cho Firebase REST API
+    (giá trị orderBy/equalTo/startAt/endAt phải được encode dạng JSON)
+    
+    Returns:
+        Dictionary dùng làm `params` của request
+    """
+    params: Dict[str, str] = {}
+    if order_by is not None:
+        params["orderBy"] = json.dumps(order_by)
+    if equal_to is not None:
+        params["equalTo"] = json.dumps(equal_to)
+    if start_at is not None:
+        params["startAt"] = json.dumps(start_at)
+    if end_at is not None:
+        params["endAt"] = json.dumps(end_at)
+    if limit_to_first is not None:
+        params["limitToFirst"] = str(int(limit_to_first))
+    if limit_to_last is not None:
+        params["limitToLast"] = str(int(limit_to_last))
+    if shallow:
+        params["shallow"] = "true"
+    return params
+
+
 class FirebaseClient:
     """Client để tương tác với Firebase Realtime Database"""
     
-    def __init__(self, database_url: str):
+    # Timeout mặc định (giây) cho từng HTTP method, "STREAM" dùng cho listen_orders.
+    # Có thể là một số hoặc tuple (connect_timeout, read_timeout) như của requests.
+    DEFAULT_TIMEOUTS: Dict[str, Any] = {
+        "GET": 10,
+        "PUT": 10,
+        "PATCH": 10,
+        "POST": 10,
+        "DELETE": 10,
+        "STREAM": 60,
+    }
+    
+    def __init__(self, database_url: str,
+                 pool_size: int = 10,
+                 timeouts: Optional[Dict[str, Any]] = None,
+                 metrics: Optional[MetricsRegistry] = None):
         """
         Khởi tạo Firebase Client
         
         Args:
             database_url: URL của Firebase Realtime Database
                          Ví dụ: https://robot-delivery-cbdcf-default-rtdb.firebaseio.com
+            pool_size: Số kết nối keep-alive tối đa giữ trong pool (mặc định 10)
+            timeouts: Ghi đè timeout theo method, ví dụ {"PUT": 3, "STREAM": 90}
+            metrics: MetricsRegistry để ghi số request, latency, byte và lỗi
+                     (mặc định metrics.REGISTRY)
         """
         # Đảm bảo URL không có dấu / ở cuối
         self.base_url = database_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeouts = dict(self.DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update({k.upper(): v for k, v in timeouts.items()})
+        
+        # Pool kết nối dùng chung (urllib3 pool an toàn đa luồng), mỗi thread
+        # có Session riêng mount cùng adapter để không chia sẻ state của Session.
+        # Nhờ vậy các request liên tiếp tái sử dụng kết nối TCP+TLS đã mở.
+        # pool_block=False: khi pool đầy (vd. stream đang giữ kết nối) thì mở
+        # thêm kết nối tạm thay vì chờ, tránh treo listen_orders.
+        self._adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=False,
+        )
+        self._local = threading.local()
+        self._sessions: List[requests.Session] = []
+        self._sessions_lock = threading.Lock()
+        
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self._requests_total = self.metrics.counter(
+            "firebase_requests_total", "Số request tới Firebase theo method, path, status")
+        self._request_duration = self.metrics.histogram(
+            "firebase_request_duration_seconds", "Latency request tới Firebase (giây)")
+        self._bytes_total = self.metrics.counter(
+            "firebase_bytes_total", "Số byte gửi đi (out) / nhận về (in)")
+        self._errors_total = self.metrics.counter(
+            "firebase_errors_total", "Số lỗi theo loại exception")
+        self._sse_events_total = self.metrics.counter(
+            "firebase_sse_events_total", "Số event SSE nhận được theo loại event")
+        self._reconnects_total = self.metrics.counter(
+            "firebase_stream_reconnects_total", "Số lần stream orders phải kết nối lại")
+    
+    def _get_session(self) -> requests.Session:
+        """Lấy Session keep-alive của thread hiện tại (tạo mới nếu chưa có)"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+            self._local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+    
+    def _timeout_for(self, method: str) -> Any:
+        """Timeout áp dụng cho một HTTP method"""
+        return self.timeouts.get(method.upper(), self.DEFAULT_TIMEOUTS["GET"])
     
-    def _make_request(self, method: str, path: str = "", data: Optional[dict] = None) -> Optional[dict]:
+    def close(self) -> None:
+        """Đóng toàn bộ kết nối trong pool"""
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+        self._adapter.close()
+        self._local = threading.local()
+    
+    def __enter__(self) -> 'FirebaseClient':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+    
+    def _make_request(self, method: str, path: str = "", data: Optional[dict] = None,
+                      params: Optional[Dict[str, str]] = None) -> Optional[dict]:
         """
         Thực hiện HTTP request đến Firebase
         
@@ -147,6 +869,7 @@ class FirebaseClient:
             method: HTTP method (GET, PUT, PATCH, POST, DELETE)
             path: Đường dẫn trong database (ví dụ: "robot", "orders/-OdiO9pdXUIykq5vwqyL")
             data: Dữ liệu để gửi (nếu có)
+            params: Query parameters (ví dụ từ build_query_params)
         
         Returns:
             Response data dưới dạng dict hoặc None nếu có lỗi
@@ -157,34 +880,53 @@ class FirebaseClient:
         else:
             url = f"{self.base_url}/.json"
         
-        try:
-            if method.upper() == "GET":
-                response = requests.get(url, timeout=10)
-            elif method.upper() == "PUT":
-                response = requests.put(url, json=data, timeout=10)
-            elif method.upper() == "PATCH":
-                response = requests.patch(url, json=data, timeout=10)
-            elif method.upper() == "POST":
-                response = requests.post(url, json=data, timeout=10)
-            elif method.upper() == "DELETE":
-                response = requests.delete(url, timeout=10)
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
+        method = method.upper()
+        if method not in ("GET", "PUT", "PATCH", "POST", "DELETE"):
+            raise ValueError(f"Unsupported HTTP method: {method}")
+        
+        label = path_label(path)
+        status = "error"
+        start = time.perf_counter()
+        with span(f"firebase.{method}", path=label) as request_span:
+            try:
+                session = self._get_session()
+                if method in ("GET", "DELETE"):
+                    response = session.request(method, url, params=params,
+                                               timeout=self._timeout_for(method))
+                else:
+                    response = session.request(method, url, json=data, params=params,
+                                               timeout=self._timeout_for(method))
             
-            response.raise_for_status()
+                status = response.status_code
+                request_span.set_attribute("status", status)
+                body = response.request.body
+                self._bytes_total.inc(len(body) if body else 0, direction="out", method=method)
+                self._bytes_total.inc(len(response.content), direction="in", method=method)
+                response.raise_for_status()
             
-            # Firebase trả về null nếu không có dữ liệu
-            if response.text == "null":
-                return None
+                # Firebase trả về null nếu không có dữ liệu
+                if response.text == "null":
+                    return None
             
-            return response.json()
+                return response.json()
         
-        except requests.exceptions.RequestException as e:
-            print(f"Lỗi khi thực hiện request: {e}")
-            return None
-        except json.JSONDecodeError as e:
-            print(f"Lỗi khi parse JSON: {e}")
-            return None
+            except requests.exceptions.RequestException as e:
+                self._errors_total.inc(method=method, error=type(e).__name__)
+                print(f"Lỗi khi thực hiện request: {e}")
+                return None
+            except json.JSONDecodeError as e:
+                self._errors_total.inc(method=method, error=type(e).__name__)
+                print(f"Lỗi khi parse JSON: {e}")
+                return None
+            finally:
+                self._request_duration.observe(time.perf_counter() - start, method=method, path=label)
+                self._requests_total.inc(method=method, path=label, status=status)
+    
+    def _count_bytes_in(self, chunks: Iterable[bytes], method: str) -> Iterator[bytes]:
+        """Chuyển tiếp các chunk của response stream, cộng số byte vào metric"""
+        for chunk in chunks:
+            self._bytes_total.inc(len(chunk), direction="in", method=method)
+            yield chunk
     
     def update_robot_location(self, lat: float, lon: float) -> bool:
         """
@@ -229,19 +971,141 @@ class FirebaseClient:
         Returns:
             Dictionary với key là order_id và value là Order object
         """
-        data = self._make_request("GET", "orders")
-        if data is None:
-            return {}
+        return self._query_orders()
+    
+    def _query_orders(self, params: Optional[Dict[str, str]] = None) -> Dict[str, Order]:
+        """GET node `orders` (có thể kèm query) và parse thành dict order_id -> Order"""
+        return parse_orders(self._make_request("GET", "orders", params=params))
+    
+    
+    def list_order_ids(self) -> List[str]:
+        """
+        Lấy danh sách ID đơn hàng (shallow=true, không tải nội dung đơn)
         
-        orders = {}
-        try:
-            for order_id, order_data in data.items():
-                orders[order_id] = Order.from_dict(order_data, order_id)
-        except (KeyError, ValueError) as e:
-            print(f"Lỗi khi parse orders data: {e}")
+        Returns:
+            List order_id đã sắp xếp (push ID => theo thời gian tạo)
+        """
+        data = self._make_request("GET", "orders", params=build_query_params(shallow=True))
+        if not isinstance(data, dict):
+            return []
+        return sorted(data.keys())
+    
+    def get_orders_by_status(self, status: str, limit: Optional[int] = None) -> Dict[str, Order]:
+        """
+        Lấy các đơn hàng có status cho trước, lọc phía server (orderBy/equalTo)
         
-        return orders
+        Cần khai báo `".indexOn": ["status", "createdAt"]` cho node `orders`
+        trong Firebase rules, nếu không server sẽ trả lỗi 400.
+        
+        Args:
+            status: "pending", "in_progress", "completed", ...
+            limit: Số đơn tối đa (lấy các đơn có key lớn nhất khi vượt quá)
+        
+        Returns:
+            Dictionary order_id -> Order
+        """
+        params = build_query_params(order_by="status", equal_to=status, limit_to_last=limit)
+        return self._query_orders(params)
+    
+    def get_recent_orders(self, limit: int = 50, since: Optional[str] = None) -> Dict[str, Order]:
+        """
+        Lấy các đơn hàng mới nhất theo createdAt (orderBy/startAt/limitToLast)
+        
+        Args:
+            limit: Số đơn tối đa
+            since: Chỉ lấy đơn có createdAt >= since (chuỗi ISO 8601), None = không lọc
+        
+        Returns:
+            Dictionary order_id -> Order
+        """
+        params = build_query_params(order_by="createdAt", start_at=since, limit_to_last=limit)
+        return self._query_orders(params)
     
+    def iter_orders(self, page_size: int = 100) -> Iterator[Tuple[str, Order]]:
+        """
+        Duyệt toàn bộ đơn hàng theo từng trang (cursor theo key), mỗi lần
+        chỉ tải page_size đơn nên dùng được với node rất lớn
+        
+        Args:
+            page_size: Số đơn mỗi trang
+        
+        Yields:
+            Tuple (order_id, Order) theo thứ tự key tăng dần
+        """
+        cursor: Optional[str] = None
+        while True:
+            # startAt bao gồm cả cursor => lấy thêm 1 phần tử rồi bỏ phần tử trùng
+            params = build_query_params(
+                order_by="$key",
+                start_at=cursor,
+                limit_to_first=page_size + (1 if cursor is not None else 0),
+            )
+            data = self._make_request("GET", "orders", params=params)
+            if not isinstance(data, dict):
+                return
+            
+            # Hết trang và cursor tính theo key thô của response, để đơn
+            # parse lỗi không làm dừng phân trang
+            keys = sorted(k for k in data if k != cursor)
+            page = parse_orders({k: data[k] for k in keys})
+            
+            for order_id in keys:
+                if order_id in page:
+                    yield order_id, page[order_id]
+            
+            if len(keys) < page_size:
+                return
+            cursor = keys[-1]
+
+    def stream_orders(self, params: Optional[Dict[str, str]] = None,
+                      chunk_size: int = 64 * 1024) -> Iterator[Tuple[str, Order]]:
+        """
+        Tải node `orders` và parse tăng dần trong lúc đang tải (không gọi
+        response.json() trên toàn bộ body)
+
+        Bộ nhớ chỉ phụ thuộc vào chunk_size và kích thước một đơn hàng, đơn
+        đầu tiên có ngay khi phần đầu response về tới nơi. Khác iter_orders,
+        toàn bộ node chỉ cần một request.
+
+        Args:
+            params: Query parameters (ví dụ từ build_query_params)
+            chunk_size: Số byte đọc từ socket mỗi lần
+
+        Yields:
+            Tuple (order_id, Order) theo thứ tự trong response của Firebase
+        """
+        url = f"{self.base_url}/orders.json"
+        status = "error"
+        start = time.perf_counter()
+
+        try:
+            with self._get_session().get(
+                url,
+                params=params,
+                stream=True,
+                timeout=self._timeout_for("STREAM"),
+            ) as response:
+                status = response.status_code
+                response.raise_for_status()
+
+                chunks = self._count_bytes_in(response.iter_content(chunk_size=chunk_size), "GET")
+                for order_id, order_data in iter_object_items(chunks):
+                    try:
+                        yield order_id, Order.from_dict(order_data, order_id)
+                    except (KeyError, ValueError, TypeError, AttributeError) as e:
+                        print(f"Lỗi khi parse order {order_id}: {e}")
+
+        except requests.exceptions.RequestException as e:
+            self._errors_total.inc(method="GET", error=type(e).__name__)
+            print(f"Lỗi khi thực hiện request: {e}")
+        except ValueError as e:
+            self._errors_total.inc(method="GET", error=type(e).__name__)
+            print(f"Lỗi khi parse JSON: {e}")
+        finally:
+            # Latency tính tới khi đọc xong (hoặc bỏ dở) toàn bộ stream
+            self._request_duration.observe(time.perf_counter() - start, method="GET", path="orders")
+            self._requests_total.inc(method="GET", path="orders", status=status)
+
     def get_order(self, order_id: str) -> Optional[Order]:
         """
         Lấy một đơn hàng cụ thể từ Firebase
@@ -258,10 +1122,29 @@ class FirebaseClient:
         
         try:
             return Order.from_dict(data, order_id)
-        except (KeyError, ValueError) as e:
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
             print(f"Lỗi khi parse order data: {e}")
             return None
     
+    def multi_path_update(self, updates: Dict[str, Any]) -> bool:
+        """
+        Ghi nhiều đường dẫn trong một request PATCH tại root (multi-path update).
+        Toàn bộ thay đổi được Firebase áp dụng nguyên tử.
+        
+        Args:
+            updates: Dictionary đường dẫn -> giá trị,
+                     ví dụ {"orders/-Nabc": {...}, "robot": {"lat": ..., "lon": ...}}
+                     (giá trị None sẽ xóa đường dẫn đó)
+        
+        Returns:
+            True nếu thành công, False nếu có lỗi
+        """
+        if not updates:
+            return True
+        
+        result = self._make_request("PATCH", "", updates)
+        return result is not None
+    
     def get_all_data(self) -> Optional[DatabaseData]:
         """
         Lấy toàn bộ dữ liệu từ Firebase (orders + robot)
@@ -275,19 +1158,29 @@ class FirebaseClient:
         
         try:
             return DatabaseData.from_dict(data)
-        except (KeyError, ValueError) as e:
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
             print(f"Lỗi khi parse database data: {e}")
             return None
 
     def listen_orders(
         self,
-        on_change: Callable[[List[Order], Dict[str, Any], str], None],
+        on_change: Optional[Callable[[List[Order], Dict[str, Any], str], None]] = None,
         on_error: Optional[Callable[[Exception], None]] = None,
         retry_delay_seconds: float = 5.0,
+        cache: Optional[OrderCache] = None,
+        snapshot_store: Optional['OrderSnapshotStore'] = None,
+        on_order_events: Optional[Callable[[List[OrderChange], str], None]] = None,
+        dispatch_policy: Optional[str] = None,
+        debounce_seconds: float = 0.05,
+        max_pending_callbacks: int = 1000,
     ) -> None:
         """
         Lắng nghe thay đổi của danh sách đơn hàng theo thời gian thực.
 
+        Danh sách đơn hàng được giữ trong một OrderCache cục bộ: event `put`
+        đầu tiên của stream là snapshot ban đầu, các event put/patch sau đó chỉ
+        cập nhật phần bị thay đổi, không tải lại toàn bộ node `orders`.
+
         Args:
             on_change: Callback khi có thay đổi. Tham số gồm:
                 - danh sách Order đã được sắp xếp giảm dần theo createdAt
@@ -295,6 +1188,34 @@ class FirebaseClient:
                 - event_type (put, patch, keep-alive, ...)
             on_error: Callback khi có lỗi (optional). Nếu không truyền sẽ in ra console.
             retry_delay_seconds: Thời gian chờ trước khi thử kết nối lại khi gặp lỗi.
+            cache: OrderCache dùng để lưu đơn hàng (optional), tiện khi cần đọc
+                lại trạng thái hiện tại từ bên ngoài callback.
+            snapshot_store: OrderSnapshotStore (optional). Nếu có, cache được nạp
+                từ snapshot trên đĩa (đối chiếu với server bằng shallow diff),
+                on_change được gọi ngay một lần với event_type "snapshot", và
+                mọi thay đổi từ stream được ghi lại vào snapshot. Stream REST vẫn
+                gửi lại toàn bộ node ở event put đầu mỗi kết nối, nên snapshot chỉ
+                giúp có dữ liệu sớm, không giảm lượng dữ liệu tải về.
+            on_order_events: Callback nhận danh sách OrderChange (added/updated/
+                removed kèm Order cũ và mới) và event_type; chỉ được gọi khi có
+                đơn hàng thay đổi. Diff được tính một lần trong client, chỉ trên
+                các đơn bị event chạm tới. Lần nạp đầu tiên báo mọi đơn là "added";
+                khi kết nối lại chỉ báo các đơn khác với cache.
+            dispatch_policy: Cách gọi callback (xem callback_dispatcher.py).
+                Mặc định None: gọi trực tiếp trên thread đọc stream như trước.
+                Các policy khác chạy callback trên thread riêng để callback chậm
+                không giữ socket tới mức timeout và kết nối lại:
+                - "block": gọi cho từng event theo thứ tự; thread đọc stream chỉ
+                  chờ khi đã có max_pending_callbacks event chưa xử lý
+                - "drop": khi callback còn bận, bỏ các snapshot trung gian
+                  (on_change nhận danh sách mới nhất, OrderChange được gộp lại)
+                - "coalesce": như "drop" và gom các event trong debounce_seconds
+                  thành một lần gọi (hợp với loạt đơn tạo từ batch_create_orders)
+                Với "drop"/"coalesce", payload và event_type là của event cuối cùng;
+                snapshot đầy đủ ("snapshot", put tại root) không bị gộp vào event
+                sau nó, chỉ có thể được thay bằng một snapshot mới hơn.
+            debounce_seconds: Cửa sổ gom event của policy "coalesce".
+            max_pending_callbacks: Số event tối đa chờ callback với policy "block".
 
         Ví dụ:
 
@@ -302,78 +1223,139 @@ class FirebaseClient:
                 print(f\"Có {len(orders)} đơn hàng (event={event_type})\")
 
             firebase.listen_orders(handle_change)
+
+            def handle_events(changes, event_type):
+                for change in changes:
+                    print(change.kind, change.order_id, change.changed_fields())
+
+            firebase.listen_orders(on_order_events=handle_events)
         """
+        if on_change is None and on_order_events is None:
+            raise ValueError("Cần truyền on_change hoặc on_order_events")
+
         url = f"{self.base_url}/orders.json"
         headers = {"Accept": "text/event-stream"}
-        params = {"print": "silent"}  # Giảm dung lượng dữ liệu
+        order_cache = cache if cache is not None else OrderCache()
+        if on_order_events is not None:
+            order_cache.track_changes = True
+        # Thread đọc stream sửa cache, thread callback đọc danh sách đã sắp xếp
+        cache_lock = threading.Lock()
 
         def _emit_error(exc: Exception) -> None:
+            self._errors_total.inc(method="STREAM", error=type(exc).__name__)
             if on_error:
                 on_error(exc)
             else:
                 print(f"Lỗi stream orders: {exc}")
 
+        # Mỗi thông báo là (danh sách Order hoặc None, payload, event_type, OrderChange).
+        # Danh sách None = lấy danh sách mới nhất lúc gọi callback (policy drop/coalesce)
+        Notification = Tuple[Optional[List[Order]], Dict[str, Any], str, List[OrderChange]]
+
+        def _deliver(notification: Notification) -> None:
+            orders, payload, event_type, changes = notification
+            if on_order_events is not None and changes:
+                try:
+                    on_order_events(changes, event_type)
+                except Exception as callback_exc:  # pragma: no cover
+                    _emit_error(callback_exc)
+            if on_change is not None:
+                if orders is None:
+                    with cache_lock:
+                        orders = order_cache.sorted_orders()
+                try:
+                    on_change(orders, payload, event_type)
+                except Exception as callback_exc:  # pragma: no cover
+                    _emit_error(callback_exc)
+
+        def _is_full_snapshot(payload: Dict[str, Any], event_type: str) -> bool:
+            return event_type == "snapshot" or (
+                event_type == "put" and not _split_path(payload.get("path")))
+
+        def _merge(older: Notification, newer: Notification) -> Optional[Notification]:
+            _, older_payload, older_type, older_changes = older
+            _, payload, event_type, changes = newer
+            if _is_full_snapshot(older_payload, older_type) and not _is_full_snapshot(payload, event_type):
+                # Giữ snapshot cho consumer dựng lại trạng thái, event sau xếp riêng
+                return None
+            if event_type not in ("put", "patch", "snapshot"):
+                # Event không mang dữ liệu (keep-alive) không thay event đang chờ
+                payload, event_type = older_payload, older_type
+            return None, payload, event_type, merge_order_changes(older_changes, changes)
+
+        dispatcher = None
+        if dispatch_policy is not None:
+            dispatcher = CallbackDispatcher(
+                _deliver,
+                policy=dispatch_policy,
+                max_pending=max_pending_callbacks,
+                debounce_seconds=debounce_seconds,
+                merge=_merge,
+                on_error=_emit_error,
+                name="orders",
+                metrics=self.metrics,
+            )
+        # Danh sách đã sắp xếp chỉ cần chụp lại ngay khi mọi event đều được giao
+        eager_orders = on_change is not None and (dispatcher is None or dispatch_policy == "block")
+
+        def _notify(payload: Dict[str, Any], event_type: str) -> Optional[Notification]:
+            """Thông báo cần giao cho event vừa áp dụng (gọi khi đang giữ cache_lock)"""
+            changes = order_cache.take_changes() if on_order_events is not None else []
+            if on_change is None and not changes:
+                return None
+            orders = order_cache.sorted_orders() if eager_orders else None
+            return orders, payload, event_type, changes
+
+        def _dispatch(notification: Optional[Notification]) -> None:
+            if notification is None:
+                return
+            if dispatcher is None:
+                _deliver(notification)
+            else:
+                dispatcher.submit(notification)
+
+        if snapshot_store is not None:
+            with cache_lock:
+                snapshot_store.warm_start(self, order_cache)
+                notification = _notify({}, "snapshot") if order_cache.loaded else None
+            _dispatch(notification)
+
+        connected_before = False
         while True:
+            if connected_before:
+                self._reconnects_total.inc()
+            connected_before = True
             try:
-                with requests.get(
+                with self._get_session().get(
                     url,
                     stream=True,
                     headers=headers,
-                    params=params,
-                    timeout=60,
+                    timeout=self._timeout_for("STREAM"),
                 ) as response:
+                    self._requests_total.inc(method="STREAM", path="orders",
+                                             status=response.status_code)
                     response.raise_for_status()
+                    # Kết nối mới: chờ snapshot ban đầu của stream này
+                    order_cache.loaded = False
 
-                    event_type: Optional[str] = None
-                    data_buffer: List[str] = []
-
-                    for raw_line in response.iter_lines(decode_unicode=True):
-                        if raw_line is None:
-                            continue
-
-                        line = raw_line.strip()
-
-                        # Dòng trống => kết thúc một event
-                        if line == "":
-                            if not data_buffer:
-                                event_type = None
-                                continue
-
-                            try:
-                                payload_str = "\n".join(data_buffer).strip()
-                                payload: Dict[str, Any] = (
-                                    json.loads(payload_str) if payload_str else {}
-                                )
-                            except json.JSONDecodeError as exc:
-                                _emit_error(exc)
-                                data_buffer = []
-                                event_type = None
-                                continue
-
-                            # Lấy lại toàn bộ danh sách đơn hàng (đảm bảo đồng bộ)
-                            orders_dict = self.get_all_orders()
-                            orders_list = sorted(
-                                orders_dict.values(),
-                                key=lambda o: o.createdAt,
-                                reverse=True,
+                    # Đọc từng phần nhỏ như iter_lines để event keep-alive không bị giữ lại
+                    chunks = self._count_bytes_in(response.iter_content(chunk_size=512), "STREAM")
+                    for event_type, payload_str in parse_sse_lines(iter_stream_lines(chunks)):
+                        self._sse_events_total.inc(event=event_type)
+                        try:
+                            payload: Dict[str, Any] = (
+                                json.loads(payload_str) if payload_str else {}
                             )
-
-                            try:
-                                on_change(orders_list, payload, event_type or "message")
-                            except Exception as callback_exc:  # pragma: no cover
-                                _emit_error(callback_exc)
-
-                            data_buffer = []
-                            event_type = None
+                        except json.JSONDecodeError as exc:
+                            _emit_error(exc)
                             continue
 
-                        if line.startswith("event:"):
-                            event_type = line[len("event:") :].strip()
-                        elif line.startswith("data:"):
-                            data_buffer.append(line[len("data:") :].strip())
-                        else:
-                            # Các dòng khác (ví dụ comment bắt đầu bằng ':') bỏ qua
-                            continue
+                        with cache_lock:
+                            self._apply_order_event(order_cache, event_type, payload)
+                            if snapshot_store is not None:
+                                snapshot_store.record_event(order_cache, event_type, payload)
+                            notification = _notify(payload, event_type)
+                        _dispatch(notification)
 
             except KeyboardInterrupt:
                 print("\nĐã dừng lắng nghe đơn hàng (KeyboardInterrupt)")
@@ -383,11 +1365,68 @@ class FirebaseClient:
             except Exception as exc:  # pragma: no cover
                 _emit_error(exc)
 
-            time.sleep(retry_delay_seconds)
+            try:
+                time.sleep(retry_delay_seconds)
+            except KeyboardInterrupt:
+                print("\nĐã dừng lắng nghe đơn hàng (KeyboardInterrupt)")
+                break
+
+        if dispatcher is not None:
+            dispatcher.close()
+
+    def _apply_order_event(self, cache: OrderCache, event_type: str, payload: Any) -> None:
+        """Cập nhật cache theo một event SSE, tải snapshot một lần nếu cache còn trống"""
+        if cache.needs_snapshot(event_type, payload):
+            # Chưa nhận được snapshot ban đầu từ stream => tải một lần
+            cache.load(self._make_request("GET", "orders"))
+        cache.apply_event(event_type, payload)
 
 
 # ==================== HELPER FUNCTIONS ====================
 
+# Bảng ký tự của push ID Firebase (đã sắp xếp theo ASCII để ID tăng dần theo thời gian)
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+_push_id_lock = threading.Lock()
+_last_push_time = 0
+_last_rand_chars: List[int] = [0] * 12
+
+
+def generate_push_id() -> str:
+    """
+    Tạo push ID phía client giống thuật toán của Firebase SDK
+    (8 ký tự timestamp ms + 12 ký tự ngẫu nhiên), tăng dần theo thời gian
+    nên thứ tự key giống như khi dùng POST.
+    
+    Returns:
+        Chuỗi 20 ký tự, ví dụ "-OdiO9pdXUIykq5vwqyL"
+    """
+    global _last_push_time
+    
+    with _push_id_lock:
+        now = int(time.time() * 1000)
+        duplicate_time = now <= _last_push_time
+        if duplicate_time:
+            # Cùng millisecond (hoặc đồng hồ lùi): tăng phần ngẫu nhiên thêm 1
+            now = _last_push_time
+            for i in range(11, -1, -1):
+                if _last_rand_chars[i] != 63:
+                    _last_rand_chars[i] += 1
+                    break
+                _last_rand_chars[i] = 0
+        else:
+            for i in range(12):
+                _last_rand_chars[i] = random.randrange(64)
+        _last_push_time = now
+        
+        time_chars = []
+        for _ in range(8):
+            time_chars.append(PUSH_CHARS[now % 64])
+            now //= 64
+        
+        return "".join(reversed(time_chars)) + "".join(PUSH_CHARS[c] for c in _last_rand_chars)
+
+
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
     Tính khoảng cách giữa 2 điểm tọa độ (Haversine formula)
@@ -400,18 +1439,7 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     Returns:
         Khoảng cách tính bằng mét
     """
-    R = 6371000  # Bán kính Trái Đất tính bằng mét
-    
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-    
-    a = math.sin(delta_phi / 2) ** 2 + \
-        math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    return R * c
+    return haversine_scalar(lat1, lon1, lat2, lon2)
 
 
 def generate_next_location(current_lat: float, current_lon: float, 
@@ -443,23 +1471,19 @@ def generate_next_location(current_lat: float, current_lon: float,
     max_lat_delta = max_distance_meters * lat_degree_per_meter
     max_lon_delta = max_distance_meters * lon_degree_per_meter
     
-    # Tạo tọa độ mới trong phạm vi cho phép
-    attempts = 0
-    while attempts < 50:  # Thử tối đa 50 lần
-        # Tạo tọa độ ngẫu nhiên trong phạm vi
-        new_lat = current_lat + random.uniform(-max_lat_delta, max_lat_delta)
-        new_lon = current_lon + random.uniform(-max_lon_delta, max_lon_delta)
-        
-        # Đảm bảo trong phạm vi Hà Nội
-        new_lat = max(HANOI_LAT_MIN, min(HANOI_LAT_MAX, new_lat))
-        new_lon = max(HANOI_LON_MIN, min(HANOI_LON_MAX, new_lon))
-        
-        # Kiểm tra khoảng cách
-        distance = calculate_distance(current_lat, current_lon, new_lat, new_lon)
-        if distance <= max_distance_meters:
-            return (new_lat, new_lon)
-        
-        attempts += 1
+    # Tạo một lượt 50 tọa độ ngẫu nhiên trong phạm vi cho phép (thay cho 50 lần thử)
+    new_lats = current_lat + np.random.uniform(-max_lat_delta, max_lat_delta, 50)
+    new_lons = current_lon + np.random.uniform(-max_lon_delta, max_lon_delta, 50)
+    
+    # Đảm bảo trong phạm vi Hà Nội
+    new_lats = np.clip(new_lats, HANOI_LAT_MIN, HANOI_LAT_MAX)
+    new_lons = np.clip(new_lons, HANOI_LON_MIN, HANOI_LON_MAX)
+    
+    # Kiểm tra khoảng cách, lấy tọa độ hợp lệ đầu tiên
+    distances = haversine(current_lat, current_lon, new_lats, new_lons)
+    valid = np.flatnonzero(distances <= max_distance_meters)
+    if len(valid) > 0:
+        return (float(new_lats[valid[0]]), float(new_lons[valid[0]]))
     
     # Nếu không tìm được trong phạm vi, trả về điểm gần nhất trong phạm vi
     new_lat = current_lat + random.uniform(-max_lat_delta * 0.5, max_lat_delta * 0.5)
@@ -474,21 +1498,35 @@ def run_periodic_location_update(firebase_client: FirebaseClient,
                                 interval_seconds: int = 10,
                                 max_distance_meters: float = 200.0,
                                 initial_lat: Optional[float] = None,
-                                initial_lon: Optional[float] = None):
+                                initial_lon: Optional[float] = None,
+                                publisher: Optional['TelemetryPublisher'] = None,
+                                write_queue: Optional['TelemetryQueue'] = None):
     """
     Chạy định kỳ đẩy tọa độ robot lên Firebase
     
     Args:
         firebase_client: FirebaseClient instance
         interval_seconds: Khoảng thời gian giữa các lần cập nhật (giây), mặc định 10s
-        max_distance_meters: Khoảng cách tối đa giữa các điểm (mét), mặc định 200m
+        max_distance_meters: Quãng đường tối đa robot mô phỏng đi được trong
+                             interval_seconds (mét), mặc định 200m; bước dài/ngắn
+                             hơn được co giãn theo thời gian thực tế giữa 2 mẫu
         initial_lat: Vĩ độ ban đầu (nếu None sẽ lấy từ Firebase)
         initial_lon: Kinh độ ban đầu (nếu None sẽ lấy từ Firebase)
+        publisher: TelemetryPublisher (optional). Nếu có, mỗi vị trí mới đi qua
+                   dead-band của publisher và chu kỳ lấy mẫu theo
+                   publisher.next_interval(), không ngắn hơn interval_seconds
+                   (publisher chỉ giảm số lần ghi, không tăng)
+        write_queue: TelemetryQueue (optional). Nếu có, vị trí được ghi qua hàng
+                     đợi write-behind (không chặn vòng lặp, giữ lại khi mất mạng);
+                     publisher nên được tạo với chính queue này
     """
     print(f"=== Bắt đầu đẩy tọa độ robot định kỳ (mỗi {interval_seconds}s) ===")
     print(f"Khoảng cách tối đa giữa các điểm: {max_distance_meters}m")
     print("Nhấn Ctrl+C để dừng\n")
     
+    # Ghi qua write-behind queue nếu có, ngược lại PUT trực tiếp
+    writer = write_queue if write_queue is not None else firebase_client
+    
     # Lấy vị trí ban đầu
     if initial_lat is None or initial_lon is None:
         robot = firebase_client.get_robot_location()
@@ -501,27 +1539,36 @@ def run_periodic_location_update(firebase_client: FirebaseClient,
             current_lat = 21.0285
             current_lon = 105.8542
             print(f"Không lấy được vị trí từ Firebase, dùng vị trí mặc định: lat={current_lat}, lon={current_lon}")
-            firebase_client.update_robot_location(current_lat, current_lon)
+            writer.update_robot_location(current_lat, current_lon)
     else:
         current_lat = initial_lat
         current_lon = initial_lon
         print(f"Vị trí ban đầu: lat={current_lat}, lon={current_lon}")
-        firebase_client.update_robot_location(current_lat, current_lon)
+        writer.update_robot_location(current_lat, current_lon)
     
     try:
         update_count = 0
+        step_seconds = float(interval_seconds)
         while True:
-            # Tạo tọa độ mới
-            new_lat, new_lon = generate_next_location(current_lat, current_lon, max_distance_meters)
+            # Tạo tọa độ mới: quãng đường tối đa tỉ lệ với thời gian từ mẫu trước
+            step_meters = max_distance_meters * step_seconds / interval_seconds
+            new_lat, new_lon = generate_next_location(current_lat, current_lon, step_meters)
             distance = calculate_distance(current_lat, current_lon, new_lat, new_lon)
             
             # Đẩy lên Firebase
-            success = firebase_client.update_robot_location(new_lat, new_lon)
+            if publisher is not None:
+                reason = publisher.publish_reason(new_lat, new_lon)
+                success = publisher.offer(new_lat, new_lon)
+            else:
+                reason = "interval"
+                success = writer.update_robot_location(new_lat, new_lon)
             
             if success:
                 update_count += 1
                 print(f"[{update_count}] ✓ Đã cập nhật: lat={new_lat:.6f}, lon={new_lon:.6f} "
                       f"(khoảng cách: {distance:.1f}m)")
+            elif reason is None:
+                print(f"    - Bỏ qua (trong dead-band): lat={new_lat:.6f}, lon={new_lon:.6f}")
             else:
                 print(f"[{update_count + 1}] ✗ Lỗi khi cập nhật vị trí")
             
@@ -529,11 +1576,23 @@ def run_periodic_location_update(firebase_client: FirebaseClient,
             current_lat = new_lat
             current_lon = new_lon
             
-            # Đợi interval_seconds giây
-            time.sleep(interval_seconds)
+            # Đợi interval_seconds giây (hoặc lâu hơn theo chu kỳ thích ứng của publisher)
+            step_seconds = float(interval_seconds)
+            if publisher is not None:
+                step_seconds = max(step_seconds, publisher.next_interval())
+            time.sleep(step_seconds)
     
     except KeyboardInterrupt:
         print(f"\n\nĐã dừng. Tổng số lần cập nhật: {update_count}")
+        if publisher is not None:
+            stats = publisher.stats()
+            print(f"Số mẫu: {stats['samples']}, bỏ qua: {stats['suppressed']} "
+                  f"({stats['suppression_rate'] * 100:.0f}%)")
+        if write_queue is not None:
+            write_queue.close()
+            stats = write_queue.stats()
+            print(f"Telemetry queue: đã gửi {stats['flushed']} entry trong {stats['batches']} lô, "
+                  f"còn chờ {stats['pending']} (gửi ở lần chạy sau)")
         print(f"Vị trí cuối cùng: lat={current_lat:.6f}, lon={current_lon:.6f}")
 
 
@@ -541,7 +1600,7 @@ def run_periodic_location_update(firebase_client: FirebaseClient,
 
 if __name__ == "__main__":
     # Khởi tạo Firebase Client
-    firebase = FirebaseClient("https://robot-delivery-cbdcf-default-rtdb.firebaseio.com")
+    firebase = FirebaseClient(DEFAULT_DATABASE_URL)
     
     # Ví dụ 1: Cập nhật vị trí robot
     print("=== Cập nhật vị trí robot ===")
@@ -0,0 +1,220 @@
+"""
+Fleet Simulator - Mô phỏng N robot cùng lúc để load-test Firebase và bản đồ Mobile
+
+Mỗi robot ghi vị trí vào `robots/{id}` theo chu kỳ riêng (lệch pha ngẫu nhiên).
+Một scheduler duy nhất giữ heap (thời điểm đến hạn, robot); các robot đến hạn
+trong cùng một tick được cập nhật vị trí bằng NumPy và ghi chung một request
+multi-path PATCH, nên vài nghìn robot chỉ cần một core.
+
+Chạy: python Embedded/fleet_simulator.py <số_robot> [interval] [thời_gian]
+Ví dụ: python Embedded/fleet_simulator.py 2000 5 60
+"""
+
+import heapq
+import math
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from firebase_sample import DEFAULT_DATABASE_URL, FirebaseClient
+
+# Phạm vi Hà Nội (giống generate_next_location)
+HANOI_LAT_MIN = 20.9
+HANOI_LAT_MAX = 21.1
+HANOI_LON_MIN = 105.7
+HANOI_LON_MAX = 105.9
+
+METERS_PER_DEGREE = 111000.0
+
+
+class FleetSimulator:
+    """Điều khiển N robot mô phỏng từ một scheduler"""
+
+    def __init__(self,
+                 firebase: Optional[FirebaseClient],
+                 robot_count: int,
+                 interval_seconds: float = 5.0,
+                 interval_jitter: float = 0.2,
+                 max_distance_meters: float = 50.0,
+                 tick_seconds: float = 0.1,
+                 base_path: str = "robots",
+                 center: Tuple[float, float] = (21.0285, 105.8542),
+                 spread_meters: float = 5000.0,
+                 seed: Optional[int] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        Args:
+            firebase: FirebaseClient để ghi (None = chạy khô, chỉ đếm)
+            robot_count: Số robot mô phỏng
+            interval_seconds: Chu kỳ cập nhật trung bình của mỗi robot (giây)
+            interval_jitter: Độ lệch ngẫu nhiên của chu kỳ (tỉ lệ, 0.2 = ±20%)
+            max_distance_meters: Quãng đường tối đa mỗi lần cập nhật (mét)
+            tick_seconds: Các robot đến hạn trong cùng khoảng này được gộp vào một lần ghi
+            base_path: Node chứa robot trên Firebase
+            center: Tâm khu vực đặt robot ban đầu (lat, lng)
+            spread_meters: Bán kính khu vực đặt robot ban đầu (mét)
+            seed: Seed cho bộ sinh số ngẫu nhiên (để tái lập)
+            clock, sleep: Hàm thời gian, đổi được khi chạy mô phỏng nhanh
+        """
+        self.firebase = firebase
+        self.robot_count = robot_count
+        self.max_distance_meters = max_distance_meters
+        self.tick_seconds = tick_seconds
+        self.base_path = base_path.strip("/")
+        self.clock = clock
+        self.sleep = sleep
+
+        self._rng = np.random.default_rng(seed)
+        self.robot_ids = [f"robot_{i:05d}" for i in range(robot_count)]
+
+        # Trạng thái của cả đội lưu trong mảng NumPy, index = số thứ tự robot
+        lat_spread = spread_meters / METERS_PER_DEGREE
+        lon_spread = lat_spread / math.cos(math.radians(center[0]))
+        self.lats = np.clip(center[0] + self._rng.uniform(-lat_spread, lat_spread, robot_count),
+                            HANOI_LAT_MIN, HANOI_LAT_MAX)
+        self.lons = np.clip(center[1] + self._rng.uniform(-lon_spread, lon_spread, robot_count),
+                            HANOI_LON_MIN, HANOI_LON_MAX)
+        self.intervals = interval_seconds * self._rng.uniform(
+            1.0 - interval_jitter, 1.0 + interval_jitter, robot_count
+        )
+
+        # Heap (thời điểm đến hạn, index robot), lệch pha để các robot không dồn cùng lúc
+        start = self.clock()
+        offsets = self._rng.uniform(0.0, interval_seconds, robot_count)
+        self._heap: List[Tuple[float, int]] = [
+            (start + float(offset), index) for index, offset in enumerate(offsets)
+        ]
+        heapq.heapify(self._heap)
+
+        self.ticks = 0
+        self.writes = 0
+        self.failed_writes = 0
+        self.robot_updates = 0
+
+    def _move(self, indices: np.ndarray) -> None:
+        """Random walk cho các robot được chọn (không cần thử lại như generate_next_location)"""
+        count = len(indices)
+        distances = self._rng.uniform(0.0, self.max_distance_meters, count)
+        headings = self._rng.uniform(0.0, 2.0 * math.pi, count)
+
+        lats = self.lats[indices]
+        delta_lat = distances * np.cos(headings) / METERS_PER_DEGREE
+        delta_lon = distances * np.sin(headings) / (METERS_PER_DEGREE * np.cos(np.radians(lats)))
+
+        self.lats[indices] = np.clip(lats + delta_lat, HANOI_LAT_MIN, HANOI_LAT_MAX)
+        self.lons[indices] = np.clip(self.lons[indices] + delta_lon, HANOI_LON_MIN, HANOI_LON_MAX)
+
+    def build_updates(self, indices: np.ndarray) -> Dict[str, Any]:
+        """Multi-path update cho các robot được chọn: robots/{id} -> {lat, lon, updatedAt}"""
+        updated_at = datetime.now().isoformat()
+        return {
+            f"{self.base_path}/{self.robot_ids[index]}": {
+                "lat": lat,
+                "lon": lon,
+                "updatedAt": updated_at,
+            }
+            for index, lat, lon in zip(indices.tolist(),
+                                       self.lats[indices].tolist(),
+                                       self.lons[indices].tolist())
+        }
+
+    def step(self, now: Optional[float] = None) -> int:
+        """
+        Xử lý các robot đã đến hạn (trong vòng tick_seconds) bằng một lần ghi
+
+        Returns:
+            Số robot đã cập nhật trong tick này
+        """
+        now = self.clock() if now is None else now
+        deadline = now + self.tick_seconds
+
+        popped: List[Tuple[float, int]] = []
+        while self._heap and self._heap[0][0] <= deadline:
+            popped.append(heapq.heappop(self._heap))
+
+        # Lên lịch lần tiếp theo theo mốc cũ để chu kỳ không bị trôi
+        for due_time, index in popped:
+            heapq.heappush(self._heap, (max(due_time + self.intervals[index], now), index))
+        due = [index for _, index in popped]
+
+        if not due:
+            return 0
+
+        indices = np.asarray(due, dtype=np.intp)
+        self._move(indices)
+        updates = self.build_updates(indices)
+
+        self.ticks += 1
+        self.robot_updates += len(due)
+        if self.firebase is not None:
+            if self.firebase.multi_path_update(updates):
+                self.writes += 1
+            else:
+                self.failed_writes += 1
+        return len(due)
+
+    def next_due(self) -> Optional[float]:
+        """Thời điểm robot tiếp theo đến hạn"""
+        return self._heap[0][0] if self._heap else None
+
+    def run(self, duration_seconds: Optional[float] = None) -> None:
+        """
+        Chạy scheduler cho đến khi hết duration_seconds (None = đến khi Ctrl+C)
+        """
+        start = self.clock()
+        print(f"=== Mô phỏng {self.robot_count} robot tại `{self.base_path}/` ===")
+        print("Nhấn Ctrl+C để dừng\n")
+
+        last_report = start
+        try:
+            while duration_seconds is None or self.clock() - start < duration_seconds:
+                next_due = self.next_due()
+                if next_due is None:
+                    break
+                wait = next_due - self.clock()
+                if wait > 0:
+                    self.sleep(wait)
+                self.step()
+
+                now = self.clock()
+                if now - last_report >= 5.0:
+                    self.print_stats(now - start)
+                    last_report = now
+        except KeyboardInterrupt:
+            print("\nĐã dừng mô phỏng")
+
+        self.print_stats(self.clock() - start)
+
+    def stats(self, elapsed_seconds: float) -> Dict[str, float]:
+        return {
+            "ticks": self.ticks,
+            "writes": self.writes,
+            "failed_writes": self.failed_writes,
+            "robot_updates": self.robot_updates,
+            "updates_per_second": self.robot_updates / elapsed_seconds if elapsed_seconds > 0 else 0.0,
+            "robots_per_write": self.robot_updates / self.ticks if self.ticks else 0.0,
+        }
+
+    def print_stats(self, elapsed_seconds: float) -> None:
+        s = self.stats(elapsed_seconds)
+        print(f"[{elapsed_seconds:6.1f}s] {s['robot_updates']} cập nhật "
+              f"({s['updates_per_second']:.0f}/s) trong {s['ticks']} lần ghi "
+              f"(~{s['robots_per_write']:.0f} robot/lần, lỗi: {s['failed_writes']})")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Sử dụng: python fleet_simulator.py <số_robot> [interval] [thời_gian]")
+        print("Ví dụ: python fleet_simulator.py 2000 5 60")
+        sys.exit(1)
+
+    robot_count = int(sys.argv[1])
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    with FirebaseClient(DEFAULT_DATABASE_URL) as firebase:
+        FleetSimulator(firebase, robot_count, interval_seconds=interval).run(duration)
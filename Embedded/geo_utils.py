@@ -0,0 +1,298 @@
+"""
+Geo Utils - Các hàm hình học trên tọa độ (lat, lng) dùng NumPy
+
+Các hàm nhận số hoặc mảng NumPy và broadcast như phép toán NumPy thông thường,
+ví dụ khoảng cách từ 10k đơn hàng tới 100 robot chỉ cần một lần gọi:
+
+    distances = pairwise_distances(order_points, robot_points)  # shape (10000, 100)
+
+- haversine / haversine_scalar: khoảng cách đường tròn lớn (mét)
+- bearing: hướng từ điểm 1 tới điểm 2 (độ, 0 = Bắc, theo chiều kim đồng hồ)
+- polyline_cumulative_length: quãng đường tích lũy dọc theo lộ trình
+- point_to_polyline_distance: khoảng cách từ các điểm tới lộ trình
+- encode_polyline / decode_polyline: mã hóa lộ trình dạng Google encoded polyline
+- simplify_route: đơn giản hóa lộ trình bằng Douglas-Peucker (sai số tính bằng mét),
+  giữ hình dạng ở các khúc cua thay vì lấy mẫu đều theo index
+"""
+
+import heapq
+import math
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+EARTH_RADIUS_METERS = 6371000.0
+
+
+def haversine_scalar(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Khoảng cách (mét) giữa 2 điểm theo công thức Haversine, bản thuần Python
+    cho một cặp điểm (nhanh hơn NumPy khi chỉ tính một giá trị)
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_phi / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return EARTH_RADIUS_METERS * c
+
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Khoảng cách Haversine (mét), broadcast trên mảng
+
+    Args:
+        lat1, lon1: Tọa độ điểm 1 (số hoặc mảng)
+        lat2, lon2: Tọa độ điểm 2 (số hoặc mảng, broadcast được với điểm 1)
+
+    Returns:
+        Mảng khoảng cách (mét) với shape sau broadcast
+    """
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_phi = phi2 - phi1
+    delta_lambda = np.radians(np.subtract(lon2, lon1))
+
+    a = np.sin(delta_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def pairwise_distances(points_a, points_b) -> np.ndarray:
+    """
+    Ma trận khoảng cách Haversine giữa 2 tập điểm
+
+    Args:
+        points_a: Mảng shape (N, 2) các (lat, lng)
+        points_b: Mảng shape (M, 2) các (lat, lng)
+
+    Returns:
+        Mảng shape (N, M), phần tử [i, j] là khoảng cách (mét) từ a[i] tới b[j]
+    """
+    a = np.asarray(points_a, dtype=np.float64).reshape(-1, 2)
+    b = np.asarray(points_b, dtype=np.float64).reshape(-1, 2)
+    return haversine(a[:, 0:1], a[:, 1:2], b[None, :, 0], b[None, :, 1])
+
+
+def bearing(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Hướng ban đầu từ điểm 1 tới điểm 2 (độ trong [0, 360), 0 = Bắc), broadcast trên mảng
+    """
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_lambda = np.radians(np.subtract(lon2, lon1))
+
+    y = np.sin(delta_lambda) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(delta_lambda)
+    return np.degrees(np.arctan2(y, x)) % 360.0
+
+
+def polyline_cumulative_length(points) -> np.ndarray:
+    """
+    Quãng đường tích lũy (mét) dọc theo lộ trình
+
+    Args:
+        points: Mảng shape (N, 2) các (lat, lng)
+
+    Returns:
+        Mảng shape (N,), phần tử đầu là 0, phần tử cuối là tổng chiều dài
+    """
+    coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(coords) == 0:
+        return np.zeros(0)
+
+    segment_lengths = haversine(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+    return np.concatenate(([0.0], np.cumsum(segment_lengths)))
+
+
+def point_to_polyline_distance(points, polyline, chunk_size: int = 4096) -> np.ndarray:
+    """
+    Khoảng cách ngắn nhất (mét) từ mỗi điểm tới lộ trình (xấp xỉ mặt phẳng cục bộ)
+
+    Args:
+        points: Mảng shape (P, 2) các (lat, lng)
+        polyline: Mảng shape (N, 2) các (lat, lng) của lộ trình, N >= 1
+        chunk_size: Số điểm xử lý mỗi lần để giới hạn bộ nhớ (P x N)
+
+    Returns:
+        Mảng shape (P,)
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    line = np.asarray(polyline, dtype=np.float64).reshape(-1, 2)
+    if len(line) == 0:
+        raise ValueError("polyline phải có ít nhất 1 điểm")
+
+    # Chiếu chung một hệ tọa độ cục bộ cho cả điểm và lộ trình
+    all_lats = np.concatenate((pts[:, 0], line[:, 0]))
+    all_lngs = np.concatenate((pts[:, 1], line[:, 1]))
+    x, y = _to_local_xy(all_lats, all_lngs)
+    px, py = x[:len(pts)], y[:len(pts)]
+    lx, ly = x[len(pts):], y[len(pts):]
+
+    if len(line) == 1:
+        return np.hypot(px - lx[0], py - ly[0])
+
+    ax, ay = lx[:-1], ly[:-1]
+    dx, dy = lx[1:] - ax, ly[1:] - ay
+    length_sq = dx * dx + dy * dy
+    safe_length_sq = np.where(length_sq == 0.0, 1.0, length_sq)
+
+    result = np.empty(len(pts))
+    for start in range(0, len(pts), chunk_size):
+        cx = px[start:start + chunk_size, None]
+        cy = py[start:start + chunk_size, None]
+        t = np.clip(((cx - ax) * dx + (cy - ay) * dy) / safe_length_sq, 0.0, 1.0)
+        distances = np.hypot(cx - (ax + t * dx), cy - (ay + t * dy))
+        result[start:start + chunk_size] = distances.min(axis=1)
+    return result
+
+
+def encode_polyline(points: Sequence[Tuple[float, float]], precision: int = 5) -> str:
+    """
+    Mã hóa lộ trình theo Google encoded polyline (delta số nguyên, ~1.1m với precision 5)
+
+    Args:
+        points: List of (lat, lng)
+        precision: Số chữ số thập phân được giữ lại
+
+    Returns:
+        Chuỗi ASCII, mỗi điểm thường chỉ tốn 4-8 ký tự
+    """
+    factor = 10 ** precision
+    chunks: List[str] = []
+    prev_lat = 0
+    prev_lng = 0
+
+    for lat, lng in points:
+        ilat = math.floor(lat * factor + 0.5)
+        ilng = math.floor(lng * factor + 0.5)
+        for delta in (ilat - prev_lat, ilng - prev_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        prev_lat, prev_lng = ilat, ilng
+
+    return "".join(chunks)
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[Tuple[float, float]]:
+    """
+    Giải mã Google encoded polyline
+
+    Returns:
+        List of (lat, lng)
+    """
+    factor = float(10 ** precision)
+    points: List[Tuple[float, float]] = []
+    index = 0
+    length = len(encoded)
+    lat = 0
+    lng = 0
+
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            result = 0
+            shift = 0
+            while True:
+                b = ord(encoded[index]) - 63
+                index += 1
+                result |= (b & 0x1f) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+
+    return points
+
+
+def _to_local_xy(lats: np.ndarray, lngs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Chiếu tọa độ sang mặt phẳng cục bộ (mét) quanh điểm giữa,
+    đủ chính xác cho lộ trình trong phạm vi một thành phố
+    """
+    lat0 = float(lats.mean())
+    lng0 = float(lngs.mean())
+    x = np.radians(lngs - lng0) * (EARTH_RADIUS_METERS * math.cos(math.radians(lat0)))
+    y = np.radians(lats - lat0) * EARTH_RADIUS_METERS
+    return x, y
+
+
+def _max_segment_distance(x: np.ndarray, y: np.ndarray, i: int, j: int) -> Tuple[float, int]:
+    """
+    Khoảng cách lớn nhất từ các điểm i+1..j-1 tới đoạn thẳng (i, j)
+
+    Returns:
+        Tuple (khoảng cách lớn nhất (mét), index của điểm đó)
+    """
+    px = x[i + 1:j]
+    py = y[i + 1:j]
+    ax, ay = x[i], y[i]
+    dx, dy = x[j] - ax, y[j] - ay
+    length_sq = dx * dx + dy * dy
+
+    if length_sq == 0.0:
+        distances = np.hypot(px - ax, py - ay)
+    else:
+        # Hình chiếu lên đoạn thẳng, kẹp trong [0, 1] để tính tới 2 đầu mút
+        t = np.clip(((px - ax) * dx + (py - ay) * dy) / length_sq, 0.0, 1.0)
+        distances = np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+    k = int(np.argmax(distances))
+    return float(distances[k]), i + 1 + k
+
+
+def simplify_route(points: Sequence[Tuple[float, float]],
+                   tolerance_meters: float = 3.0,
+                   max_points: Optional[int] = None) -> List[Tuple[float, float]]:
+    """
+    Đơn giản hóa lộ trình bằng Douglas-Peucker
+
+    Các điểm được thêm theo thứ tự độ lệch giảm dần (dùng heap), nên khi có
+    max_points thì kết quả là max_points điểm quan trọng nhất; luôn giữ điểm
+    đầu và điểm cuối.
+
+    Args:
+        points: List of (lat, lng)
+        tolerance_meters: Độ lệch tối đa cho phép so với lộ trình gốc (mét)
+        max_points: Số điểm tối đa (None = không giới hạn)
+
+    Returns:
+        List of (lat, lng) là tập con theo đúng thứ tự của points
+    """
+    n = len(points)
+    if n <= 2 or (max_points is not None and max_points <= 2):
+        return list(points) if n <= 2 else [points[0], points[-1]]
+
+    coords = np.asarray(points, dtype=np.float64)
+    x, y = _to_local_xy(coords[:, 0], coords[:, 1])
+
+    heap: List[Tuple[float, int, int, int]] = []
+
+    def _push(i: int, j: int) -> None:
+        if j - i < 2:
+            return
+        distance, k = _max_segment_distance(x, y, i, j)
+        if distance > tolerance_meters:
+            heapq.heappush(heap, (-distance, i, j, k))
+
+    selected = [0, n - 1]
+    _push(0, n - 1)
+
+    while heap and (max_points is None or len(selected) < max_points):
+        _, i, j, k = heapq.heappop(heap)
+        selected.append(k)
+        _push(i, k)
+        _push(k, j)
+
+    selected.sort()
+    return [points[index] for index in selected]
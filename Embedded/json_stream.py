@@ -0,0 +1,151 @@
+"""
+JSON Stream - Đọc tăng dần các cặp key/value của một JSON object lớn
+
+Dùng cho response của Firebase: thay vì đọc toàn bộ body rồi json.loads,
+từng phần tử con của object được parse và trả về ngay khi đã tải đủ,
+nên bộ nhớ chỉ phụ thuộc vào kích thước một phần tử (một đơn hàng).
+
+    for order_id, order_data in iter_object_items(chunks):
+        ...
+"""
+
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator, Sequence, Tuple, Union
+
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class _StreamReader:
+    """Bộ đệm text trên một luồng chunk, hỗ trợ parse từng giá trị JSON"""
+
+    def __init__(self, chunks: Iterable[Union[str, bytes]]):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """Đọc thêm một chunk vào bộ đệm, False nếu đã hết dữ liệu"""
+        if self.eof:
+            return False
+
+        # Bỏ phần đã xử lý để bộ đệm không tăng theo kích thước response
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                self.buf += text
+                return True
+
+        self.eof = True
+        tail = self._utf8.decode(b"", final=True)
+        if tail:
+            self.buf += tail
+            return True
+        return False
+
+    def peek(self) -> str:
+        """Ký tự khác khoảng trắng tiếp theo ('' nếu hết dữ liệu)"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"JSON không hợp lệ: cần '{char}' tại vị trí {self.pos}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Parse một giá trị JSON hoàn chỉnh tại vị trí hiện tại"""
+        self.peek()
+        while True:
+            try:
+                result, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill_more():
+                    raise
+                continue
+
+            # Số nằm ở cuối bộ đệm có thể còn chữ số ở chunk sau
+            if end == len(self.buf) and not self.eof:
+                if self._fill_more():
+                    continue
+
+            self.pos = end
+            return result
+
+    def _fill_more(self) -> bool:
+        """Đọc thêm cho đến khi phần chưa xử lý dài gấp đôi (tránh parse lại quá nhiều lần)"""
+        target = max(2 * (len(self.buf) - self.pos), len(self.buf) - self.pos + 1)
+        filled = False
+        while len(self.buf) - self.pos < target and self._fill():
+            filled = True
+        return filled
+
+
+def iter_object_items(chunks: Iterable[Union[str, bytes]],
+                      path: Sequence[str] = ()) -> Iterator[Tuple[str, Any]]:
+    """
+    Duyệt tăng dần các cặp (key, value) của JSON object trong luồng chunk
+
+    Args:
+        chunks: Các phần của JSON (str hoặc bytes UTF-8), ví dụ response.iter_content()
+        path: Đường dẫn tới object cần duyệt bên trong JSON gốc,
+              ví dụ ("orders",) khi JSON gốc là toàn bộ database
+
+    Yields:
+        Tuple (key, value) theo thứ tự xuất hiện trong JSON.
+        Không yield gì nếu object không tồn tại hoặc là null.
+
+    Raises:
+        ValueError: JSON không hợp lệ
+    """
+    reader = _StreamReader(chunks)
+
+    # Đi xuống object đích, bỏ qua các nhánh khác
+    for key in path:
+        if reader.peek() != "{":
+            return
+        reader.pos += 1
+
+        while True:
+            if reader.peek() == "}":
+                return
+            child_key = reader.value()
+            reader.expect(":")
+            if child_key == key:
+                break
+            reader.value()
+            if reader.peek() == ",":
+                reader.pos += 1
+
+    if reader.peek() != "{":
+        # null hoặc không phải object
+        return
+    reader.pos += 1
+
+    if reader.peek() == "}":
+        return
+
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        yield key, reader.value()
+
+        char = reader.peek()
+        reader.pos += 1
+        if char == "}":
+            return
+        if char != ",":
+            raise ValueError(f"JSON không hợp lệ: cần ',' hoặc '}}' tại vị trí {reader.pos - 1}")
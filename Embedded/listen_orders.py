@@ -1,11 +1,17 @@
 """
 Script theo dõi danh sách đơn hàng theo thời gian thực.
-Chạy: python Embedded/listen_orders.py
+Chạy: python Embedded/listen_orders.py [--changes] [--coalesce]
+
+--changes: chỉ in các đơn hàng được thêm/sửa/xóa thay vì cả danh sách
+--coalesce: gộp các event dồn dập (vd. khi batch_create_orders đang chạy)
+            thành một lần in mỗi 0.5s
 """
 
+import sys
 from typing import List
 
-from firebase_sample import FirebaseClient, Order
+from firebase_sample import DEFAULT_DATABASE_URL, FirebaseClient, Order, OrderChange
+from order_snapshot import OrderSnapshotStore
 
 
 def print_orders(orders: List[Order], payload: dict, event_type: str) -> None:
@@ -20,15 +26,32 @@ def print_orders(orders: List[Order], payload: dict, event_type: str) -> None:
         )
 
 
+def print_changes(changes: List[OrderChange], event_type: str) -> None:
+    print(f"Event: {event_type} - {len(changes)} đơn hàng thay đổi")
+    for change in changes:
+        order = change.order
+        detail = ""
+        if change.kind == "updated":
+            detail = f" [{', '.join(change.changed_fields())}]"
+        print(f"{change.kind:>8} {order.id}: {order.receiverName} ({order.status}){detail}")
+
+
 def log_error(exc: Exception) -> None:
     print(f"[ERROR] {exc}")
 
 
 if __name__ == "__main__":
-    firebase = FirebaseClient("https://robot-delivery-cbdcf-default-rtdb.firebaseio.com")
+    firebase = FirebaseClient(DEFAULT_DATABASE_URL)
+    changes_only = "--changes" in sys.argv[1:]
+    coalesce = "--coalesce" in sys.argv[1:]
     firebase.listen_orders(
-        on_change=print_orders,
+        on_change=None if changes_only else print_orders,
+        on_order_events=print_changes if changes_only else None,
         on_error=log_error,
         retry_delay_seconds=5.0,
+        dispatch_policy="coalesce" if coalesce else None,
+        debounce_seconds=0.5,
+        # Nạp đơn hàng từ Embedded/.orders_snapshot.sqlite3 thay vì chờ tải cả node
+        snapshot_store=OrderSnapshotStore(),
     )
 
@@ -0,0 +1,446 @@
+"""
+Local Firebase Server - Giả lập Firebase Realtime Database REST API ngay trong process
+
+Dùng để test/benchmark khi không có mạng: FirebaseClient, AsyncFirebaseClient,
+batch_create_orders, fleet_simulator... đều chạy được với URL của server này.
+
+Hỗ trợ:
+- GET/PUT/PATCH/POST/DELETE trên `<path>.json` (PATCH tại root = multi-path update)
+- POST tạo push ID giống Firebase (trả về {"name": "<push_id>"})
+- Query: shallow, orderBy ($key, $value, child), equalTo, startAt, endAt,
+  limitToFirst, limitToLast, print=silent
+- `Accept: text/event-stream`: event put/patch/keep-alive giống Firebase
+- Độ trễ (latency + jitter) và lỗi giả lập (failure_rate, fail_next)
+
+    with LocalFirebaseServer(latency_seconds=0.05) as server:
+        firebase = FirebaseClient(server.url)
+        ...
+
+Chạy độc lập: python Embedded/local_firebase_server.py [port] [latency_ms] [failure_rate]
+"""
+
+import json
+import queue
+import random
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from firebase_sample import _set_at_path, _split_path, generate_push_id
+
+
+def _get_at_path(node: Any, segments: List[str]) -> Any:
+    """Giá trị tại đường dẫn segments (None nếu không tồn tại)"""
+    for segment in segments:
+        if isinstance(node, dict):
+            node = node.get(segment)
+        elif isinstance(node, list) and segment.isdigit() and int(segment) < len(node):
+            node = node[int(segment)]
+        else:
+            return None
+    return node
+
+
+def _is_prefix(prefix: List[str], segments: List[str]) -> bool:
+    return segments[:len(prefix)] == prefix
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    """Thứ tự sắp xếp của Firebase: null < false < true < số < chuỗi < object"""
+    if value is None:
+        return (0, 0)
+    if value is False:
+        return (1, 0)
+    if value is True:
+        return (2, 0)
+    if isinstance(value, (int, float)):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, 0)
+
+
+def apply_query(data: Any, params: Dict[str, str]) -> Any:
+    """
+    Áp dụng query parameters của Firebase REST lên một node
+
+    Raises:
+        ValueError: Query không hợp lệ (Firebase trả về 400)
+    """
+    if params.get("shallow") == "true":
+        if isinstance(data, dict):
+            return {key: True for key in data}
+        if isinstance(data, list):
+            return {str(i): True for i, value in enumerate(data) if value is not None}
+        return data
+
+    if "orderBy" not in params:
+        if any(name in params for name in ("equalTo", "startAt", "endAt",
+                                           "limitToFirst", "limitToLast")):
+            raise ValueError("orderBy must be defined when other query parameters are defined")
+        return data
+
+    order_by = json.loads(params["orderBy"])
+    if isinstance(data, list):
+        data = {str(i): value for i, value in enumerate(data) if value is not None}
+    if not isinstance(data, dict):
+        return data
+
+    def _order_value(item: Tuple[str, Any]) -> Any:
+        key, value = item
+        if order_by == "$key":
+            return key
+        if order_by == "$value":
+            return value
+        return _get_at_path(value, _split_path(order_by))
+
+    def _item_key(item: Tuple[str, Any]) -> Tuple[Tuple[int, Any], str]:
+        return (_sort_key(_order_value(item)), item[0])
+
+    items = sorted(data.items(), key=_item_key)
+
+    if "equalTo" in params:
+        target = _sort_key(json.loads(params["equalTo"]))
+        items = [item for item in items if _sort_key(_order_value(item)) == target]
+    if "startAt" in params:
+        start = _sort_key(json.loads(params["startAt"]))
+        items = [item for item in items if _sort_key(_order_value(item)) >= start]
+    if "endAt" in params:
+        end = _sort_key(json.loads(params["endAt"]))
+        items = [item for item in items if _sort_key(_order_value(item)) <= end]
+    if "limitToFirst" in params:
+        items = items[:int(params["limitToFirst"])]
+    if "limitToLast" in params:
+        limit = int(params["limitToLast"])
+        items = items[-limit:] if limit else []
+
+    return dict(items)
+
+
+class _Listener:
+    """Một kết nối SSE đang mở"""
+
+    def __init__(self, segments: List[str]):
+        self.segments = segments
+        # Event đã được encode sẵn (khi còn giữ lock dữ liệu), None = đóng stream
+        self.events: "queue.Queue[Optional[bytes]]" = queue.Queue()
+
+    def send(self, event_type: str, payload: Any) -> None:
+        self.events.put(
+            f"event: {event_type}\n"
+            f"data: {json.dumps(payload, separators=(',', ':'))}\n\n".encode("utf-8")
+        )
+
+
+class LocalFirebaseServer:
+    """Firebase RTDB giả lập chạy trên một thread nền"""
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 initial_data: Optional[Dict[str, Any]] = None,
+                 latency_seconds: float = 0.0,
+                 latency_jitter_seconds: float = 0.0,
+                 failure_rate: float = 0.0,
+                 failure_status: int = 503,
+                 keepalive_seconds: float = 30.0,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            host, port: Địa chỉ lắng nghe (port=0 = chọn port trống)
+            initial_data: Dữ liệu ban đầu của database
+            latency_seconds: Độ trễ cố định thêm vào mỗi request
+            latency_jitter_seconds: Độ trễ ngẫu nhiên thêm (0..jitter)
+            failure_rate: Xác suất một request bị trả lỗi failure_status
+            failure_status: HTTP status khi giả lập lỗi
+            keepalive_seconds: Chu kỳ gửi event keep-alive trên stream
+            seed: Seed cho độ trễ/lỗi ngẫu nhiên (để tái lập)
+        """
+        self.data: Any = json.loads(json.dumps(initial_data)) if initial_data else None
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.keepalive_seconds = keepalive_seconds
+
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._listeners: List[_Listener] = []
+        self._fail_next = 0
+        self.request_counts: Dict[str, int] = {}
+
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'LocalFirebaseServer':
+        """Chạy server trên thread nền"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                            name="local-firebase", daemon=True)
+            self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Chạy server trên thread hiện tại (chặn đến khi Ctrl+C)"""
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        """Dừng server và đóng mọi stream"""
+        self.disconnect_streams()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread = None
+
+    def __enter__(self) -> 'LocalFirebaseServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+    # ---------- Điều khiển từ test ----------
+
+    def fail_next(self, count: int = 1) -> None:
+        """Trả lỗi failure_status cho `count` request tiếp theo"""
+        with self._lock:
+            self._fail_next += count
+
+    def disconnect_streams(self) -> None:
+        """Đóng mọi kết nối SSE (giả lập mất kết nối)"""
+        with self._lock:
+            listeners, self._listeners = self._listeners, []
+        for listener in listeners:
+            listener.events.put(None)
+
+    def get(self, path: str = "") -> Any:
+        """Đọc trực tiếp dữ liệu (không qua HTTP)"""
+        with self._lock:
+            return json.loads(json.dumps(_get_at_path(self.data, _split_path(path))))
+
+    def set(self, path: str, value: Any) -> None:
+        """Ghi trực tiếp dữ liệu (không qua HTTP), vẫn phát event cho stream"""
+        self._write("put", _split_path(path), value)
+
+    # ---------- Dữ liệu và event ----------
+
+    def _write(self, kind: str, segments: List[str], value: Any) -> None:
+        """Áp dụng put/patch tại segments và phát event cho các listener liên quan"""
+        with self._lock:
+            if kind == "put":
+                operations = [(segments, value)]
+            else:
+                operations = [(segments + _split_path(key), child)
+                              for key, child in value.items()]
+
+            for op_segments, op_value in operations:
+                self.data = _set_at_path(self.data, op_segments, op_value)
+
+            for listener in self._listeners:
+                self._notify(listener, kind, segments, value, operations)
+
+    def _notify(self, listener: _Listener, kind: str, segments: List[str], value: Any,
+                operations: List[Tuple[List[str], Any]]) -> None:
+        base = listener.segments
+
+        if kind == "patch" and _is_prefix(base, segments):
+            relative = segments[len(base):]
+            listener.send("patch", {"path": "/" + "/".join(relative), "data": value})
+            return
+
+        for op_segments, op_value in operations:
+            if _is_prefix(base, op_segments):
+                relative = op_segments[len(base):]
+                listener.send("put", {"path": "/" + "/".join(relative), "data": op_value})
+            elif _is_prefix(op_segments, base):
+                # Node cha bị ghi đè => gửi lại toàn bộ node đang nghe
+                listener.send("put", {"path": "/", "data": _get_at_path(self.data, base)})
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            if self._fail_next > 0:
+                self._fail_next -= 1
+                return True
+        return self.failure_rate > 0 and self._random.random() < self.failure_rate
+
+    def _delay(self) -> None:
+        delay = self.latency_seconds
+        if self.latency_jitter_seconds > 0:
+            delay += self._random.uniform(0.0, self.latency_jitter_seconds)
+        if delay > 0:
+            time.sleep(delay)
+
+    # ---------- HTTP ----------
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Header và body được ghi riêng => tắt Nagle để tránh trễ ~40ms mỗi request
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, format, *args):
+                pass
+
+            def _parse(self) -> Tuple[Optional[List[str]], Dict[str, str]]:
+                parts = urlsplit(self.path)
+                path = unquote(parts.path)
+                if not path.endswith(".json"):
+                    return None, {}
+                params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+                return _split_path(path[:-len(".json")]), params
+
+            def _read_body(self) -> Any:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                return json.loads(body) if body else None
+
+            def _send_json(self, status: int, value: Any, silent: bool = False) -> None:
+                self._send_body(status, json.dumps(value, separators=(",", ":")).encode("utf-8"),
+                                silent)
+
+            def _send_body(self, status: int, body: bytes, silent: bool = False) -> None:
+                if silent and status == 200:
+                    self.send_response(204)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self, method: str) -> None:
+                with server._lock:
+                    server.request_counts[method] = server.request_counts.get(method, 0) + 1
+
+                segments, params = self._parse()
+                if segments is None:
+                    self._send_json(404, {"error": "Not found (path must end with .json)"})
+                    return
+
+                try:
+                    body = self._read_body() if method in ("PUT", "PATCH", "POST") else None
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": "Invalid data; couldn't parse JSON object"})
+                    return
+
+                server._delay()
+                if server._should_fail():
+                    self._send_json(server.failure_status, {"error": "Injected failure"})
+                    return
+
+                if method == "GET" and "text/event-stream" in self.headers.get("Accept", ""):
+                    self._stream(segments)
+                    return
+
+                silent = params.get("print") == "silent"
+                try:
+                    if method == "GET":
+                        # Serialize khi còn giữ lock, gửi sau khi nhả lock
+                        with server._lock:
+                            value = apply_query(_get_at_path(server.data, segments), params)
+                            body = json.dumps(value, separators=(",", ":")).encode("utf-8")
+                        self._send_body(200, body, silent)
+                    elif method == "PUT":
+                        # Encode trước khi body thành một phần của server.data:
+                        # sau _write, request khác có thể sửa object này
+                        response = json.dumps(body, separators=(",", ":")).encode("utf-8")
+                        server._write("put", segments, body)
+                        self._send_body(200, response, silent)
+                    elif method == "PATCH":
+                        if not isinstance(body, dict):
+                            self._send_json(400, {"error": "Invalid data; PATCH requires an object"})
+                            return
+                        response = json.dumps(body, separators=(",", ":")).encode("utf-8")
+                        server._write("patch", segments, body)
+                        self._send_body(200, response, silent)
+                    elif method == "POST":
+                        name = generate_push_id()
+                        server._write("put", segments + [name], body)
+                        self._send_json(200, {"name": name}, silent)
+                    elif method == "DELETE":
+                        server._write("put", segments, None)
+                        self._send_json(200, None, silent)
+                except (ValueError, TypeError) as e:
+                    self._send_json(400, {"error": str(e)})
+
+            def _stream(self, segments: List[str]) -> None:
+                listener = _Listener(segments)
+                with server._lock:
+                    listener.send("put", {"path": "/", "data": _get_at_path(server.data, segments)})
+                    server._listeners.append(listener)
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                # Chunked để client nhận từng event ngay (không chờ đầy bộ đệm đọc)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                try:
+                    while True:
+                        try:
+                            message = listener.events.get(timeout=server.keepalive_seconds)
+                        except queue.Empty:
+                            message = b"event: keep-alive\ndata: null\n\n"
+                        if message is None:
+                            self.wfile.write(b"0\r\n\r\n")
+                            break
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(message), message))
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with server._lock:
+                        if listener in server._listeners:
+                            server._listeners.remove(listener)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_PUT(self):
+                self._handle("PUT")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+        return Handler
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9000
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    failure_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+
+    server = LocalFirebaseServer(port=port,
+                                 latency_seconds=latency_ms / 1000.0,
+                                 failure_rate=failure_rate)
+    print(f"Local Firebase đang chạy tại {server.url}")
+    print(f"Dùng với script khác: FIREBASE_DATABASE_URL={server.url}")
+    print("Nhấn Ctrl+C để dừng")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nĐã dừng")
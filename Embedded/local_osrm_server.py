@@ -0,0 +1,498 @@
+"""
+Local OSRM Server - Giả lập OSRM HTTP API trên một đồ thị đường tổng hợp
+
+Dùng để benchmark route cache, hedged request và pipeline tạo đơn khi không
+có mạng (và không bị giới hạn tốc độ của OSRM public server).
+
+Hỗ trợ:
+- /route/v1/driving/{lng,lat;lng,lat;...}?overview=full|simplified|false
+  &geometries=geojson|polyline
+- /table/v1/driving/{lng,lat;...}?sources=..&destinations=..&annotations=duration,distance
+- Đồ thị dạng lưới quanh Hà Nội (RoadGraph.grid) hoặc đọc từ file JSON
+  (RoadGraph.from_file)
+- Độ trễ (latency + jitter) và lỗi giả lập (failure_rate, fail_next)
+
+    with LocalOSRMServer(latency_seconds=0.02) as osrm:
+        router = OSRMRouter([osrm.url])
+        ...
+
+Chạy độc lập: python Embedded/local_osrm_server.py [port] [latency_ms] [failure_rate]
+"""
+
+import heapq
+import json
+import math
+import random
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+from geo_utils import EARTH_RADIUS_METERS, encode_polyline, haversine, haversine_scalar, simplify_route
+
+
+class RoadGraph:
+    """Đồ thị đường vô hướng: node (lat, lng), cạnh có chiều dài và tốc độ"""
+
+    def __init__(self, nodes: Sequence[Tuple[float, float]],
+                 edges: Sequence[Tuple[int, int, float]],
+                 route_cache_size: int = 4096):
+        """
+        Args:
+            nodes: List of (lat, lng)
+            edges: List of (u, v, speed_mps), mỗi cạnh đi được cả 2 chiều
+            route_cache_size: Số cặp (node đầu, node cuối) giữ kết quả tìm đường
+        """
+        coords = np.asarray(nodes, dtype=np.float64).reshape(-1, 2)
+        self.lats = coords[:, 0]
+        self.lngs = coords[:, 1]
+        # Bản list cho vòng lặp tìm đường (truy cập phần tử nhanh hơn mảng NumPy)
+        self._lat_list: List[float] = self.lats.tolist()
+        self._lng_list: List[float] = self.lngs.tolist()
+
+        lats, lngs = self._lat_list, self._lng_list
+        self.adjacency: List[List[Tuple[int, float, float]]] = [[] for _ in range(len(coords))]
+        self.max_speed = 1.0
+        for u, v, speed in edges:
+            length = haversine_scalar(lats[u], lngs[u], lats[v], lngs[v])
+            duration = length / speed
+            self.adjacency[u].append((v, length, duration))
+            self.adjacency[v].append((u, length, duration))
+            self.max_speed = max(self.max_speed, speed)
+
+        # Tọa độ phẳng cục bộ (mét) cho heuristic của A*, rẻ hơn nhiều so với Haversine
+        lat0 = math.radians(float(self.lats.mean())) if len(coords) else 0.0
+        self._x: List[float] = (np.radians(self.lngs) * EARTH_RADIUS_METERS * math.cos(lat0)).tolist()
+        self._y: List[float] = (np.radians(self.lats) * EARTH_RADIUS_METERS).tolist()
+
+        # Node không có cạnh nối thì không dùng để snap tọa độ
+        self._isolated = np.array([not adj for adj in self.adjacency], dtype=bool)
+
+        self.route_cache_size = route_cache_size
+        self._route_cache: "OrderedDict[Tuple[int, int], Optional[Tuple[List[int], float, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def grid(cls,
+             center: Tuple[float, float] = (21.0285, 105.8542),
+             rows: int = 60,
+             cols: int = 60,
+             spacing_meters: float = 150.0,
+             arterial_every: int = 5,
+             drop_rate: float = 0.15,
+             speed_range: Tuple[float, float] = (6.0, 10.0),
+             arterial_speed: float = 14.0,
+             seed: Optional[int] = 42) -> 'RoadGraph':
+        """
+        Lưới đường tổng hợp: mỗi `arterial_every` hàng/cột là đường lớn (nhanh,
+        không bị bỏ), các đoạn đường nhỏ còn lại bị bỏ ngẫu nhiên theo drop_rate
+
+        Args:
+            center: Tâm lưới (lat, lng)
+            rows, cols: Số hàng/cột node
+            spacing_meters: Khoảng cách giữa 2 node liền kề
+            arterial_every: Chu kỳ đường lớn theo hàng/cột
+            drop_rate: Tỉ lệ đoạn đường nhỏ bị bỏ (tạo đường vòng)
+            speed_range: Tốc độ ngẫu nhiên của đường nhỏ (m/s)
+            arterial_speed: Tốc độ đường lớn (m/s)
+            seed: Seed để tái lập đồ thị
+        """
+        rng = random.Random(seed)
+        lat_step = spacing_meters / 111000.0
+        lng_step = lat_step / math.cos(math.radians(center[0]))
+        lat0 = center[0] - lat_step * (rows - 1) / 2
+        lng0 = center[1] - lng_step * (cols - 1) / 2
+
+        nodes = [(lat0 + r * lat_step, lng0 + c * lng_step)
+                 for r in range(rows) for c in range(cols)]
+        edges: List[Tuple[int, int, float]] = []
+
+        def _add(u: int, v: int, arterial: bool) -> None:
+            if arterial:
+                edges.append((u, v, arterial_speed))
+            elif rng.random() >= drop_rate:
+                edges.append((u, v, rng.uniform(*speed_range)))
+
+        for r in range(rows):
+            for c in range(cols):
+                node = r * cols + c
+                if c + 1 < cols:
+                    _add(node, node + 1, r % arterial_every == 0)
+                if r + 1 < rows:
+                    _add(node, node + cols, c % arterial_every == 0)
+
+        return cls(nodes, edges)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'RoadGraph':
+        """
+        Đọc đồ thị từ file JSON:
+            {"nodes": [[lat, lng], ...], "edges": [[u, v, speed_mps], ...]}
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        edges = [(int(e[0]), int(e[1]), float(e[2]) if len(e) > 2 else 10.0)
+                 for e in data["edges"]]
+        return cls([tuple(node) for node in data["nodes"]], edges)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.lats)
+
+    def nearest(self, lat: float, lng: float) -> Tuple[int, float]:
+        """Node gần nhất có cạnh nối (index, khoảng cách mét)"""
+        distances = np.where(self._isolated, np.inf, haversine(lat, lng, self.lats, self.lngs))
+        node = int(np.argmin(distances))
+        return node, float(distances[node])
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[List[int], float, float]]:
+        """
+        Đường nhanh nhất (A*, heuristic = khoảng cách / tốc độ tối đa)
+
+        Returns:
+            Tuple (danh sách node, quãng đường mét, thời gian giây) hoặc None nếu không có đường
+        """
+        key = (source, target)
+        with self._lock:
+            if key in self._route_cache:
+                self._route_cache.move_to_end(key)
+                return self._route_cache[key]
+
+        result = self._astar(source, target)
+
+        with self._lock:
+            self._route_cache[key] = result
+            while len(self._route_cache) > self.route_cache_size:
+                self._route_cache.popitem(last=False)
+        return result
+
+    def _astar(self, source: int, target: int) -> Optional[Tuple[List[int], float, float]]:
+        xs, ys = self._x, self._y
+        target_x, target_y = xs[target], ys[target]
+        # Nhân 0.99 để heuristic không vượt quá thời gian thực (sai số của phép chiếu phẳng)
+        scale = 0.99 / self.max_speed
+
+        def _heuristic(node: int) -> float:
+            return math.hypot(xs[node] - target_x, ys[node] - target_y) * scale
+
+        best: Dict[int, float] = {source: 0.0}
+        lengths: Dict[int, float] = {source: 0.0}
+        previous: Dict[int, int] = {}
+        heap = [(_heuristic(source), 0.0, source)]
+
+        while heap:
+            _, duration, node = heapq.heappop(heap)
+            if node == target:
+                path = [node]
+                while node in previous:
+                    node = previous[node]
+                    path.append(node)
+                path.reverse()
+                return path, lengths[target], duration
+            if duration > best.get(node, math.inf):
+                continue
+            for neighbor, length, edge_duration in self.adjacency[node]:
+                new_duration = duration + edge_duration
+                if new_duration < best.get(neighbor, math.inf):
+                    best[neighbor] = new_duration
+                    lengths[neighbor] = lengths[node] + length
+                    previous[neighbor] = node
+                    heapq.heappush(heap, (new_duration + _heuristic(neighbor), new_duration, neighbor))
+        return None
+
+    def costs_from(self, source: int) -> Tuple[Dict[int, float], Dict[int, float]]:
+        """Dijkstra từ một node tới mọi node (dùng cho /table)"""
+        durations: Dict[int, float] = {source: 0.0}
+        lengths: Dict[int, float] = {source: 0.0}
+        heap = [(0.0, source)]
+        done = set()
+        while heap:
+            duration, node = heapq.heappop(heap)
+            if node in done:
+                continue
+            done.add(node)
+            for neighbor, length, edge_duration in self.adjacency[node]:
+                new_duration = duration + edge_duration
+                if new_duration < durations.get(neighbor, math.inf):
+                    durations[neighbor] = new_duration
+                    lengths[neighbor] = lengths[node] + length
+                    heapq.heappush(heap, (new_duration, neighbor))
+        return durations, lengths
+
+
+def _parse_coordinates(text: str) -> List[Tuple[float, float]]:
+    """"lng,lat;lng,lat" -> List of (lat, lng)"""
+    coordinates = []
+    for pair in text.split(";"):
+        lng, lat = pair.split(",")
+        coordinates.append((float(lat), float(lng)))
+    return coordinates
+
+
+def _parse_indices(value: Optional[str], count: int) -> List[int]:
+    if value is None or value == "all":
+        return list(range(count))
+    indices = [int(i) for i in value.split(";")]
+    if any(i < 0 or i >= count for i in indices):
+        raise ValueError("Index out of range")
+    return indices
+
+
+class LocalOSRMServer:
+    """OSRM giả lập chạy trên một thread nền"""
+
+    def __init__(self,
+                 graph: Optional[RoadGraph] = None,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 latency_seconds: float = 0.0,
+                 latency_jitter_seconds: float = 0.0,
+                 failure_rate: float = 0.0,
+                 failure_status: int = 503,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            graph: Đồ thị đường (mặc định RoadGraph.grid())
+            host, port: Địa chỉ lắng nghe (port=0 = chọn port trống)
+            latency_seconds: Độ trễ cố định thêm vào mỗi request
+            latency_jitter_seconds: Độ trễ ngẫu nhiên thêm (0..jitter)
+            failure_rate: Xác suất một request bị trả lỗi failure_status
+            failure_status: HTTP status khi giả lập lỗi
+            seed: Seed cho độ trễ/lỗi ngẫu nhiên (để tái lập)
+        """
+        self.graph = graph or RoadGraph.grid()
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._fail_next = 0
+        self.request_counts: Dict[str, int] = {}
+
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'LocalOSRMServer':
+        """Chạy server trên thread nền"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                            name="local-osrm", daemon=True)
+            self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Chạy server trên thread hiện tại (chặn đến khi Ctrl+C)"""
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread = None
+
+    def __enter__(self) -> 'LocalOSRMServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+    def fail_next(self, count: int = 1) -> None:
+        """Trả lỗi failure_status cho `count` request tiếp theo"""
+        with self._lock:
+            self._fail_next += count
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            if self._fail_next > 0:
+                self._fail_next -= 1
+                return True
+            return self.failure_rate > 0 and self._random.random() < self.failure_rate
+
+    def _delay(self) -> None:
+        delay = self.latency_seconds
+        if self.latency_jitter_seconds > 0:
+            with self._lock:
+                delay += self._random.uniform(0.0, self.latency_jitter_seconds)
+        if delay > 0:
+            time.sleep(delay)
+
+    # ---------- OSRM services ----------
+
+    def route(self, coordinates: List[Tuple[float, float]],
+              params: Dict[str, str]) -> Tuple[int, dict]:
+        """Service /route: trả về (HTTP status, JSON response)"""
+        if len(coordinates) < 2:
+            return 400, {"code": "InvalidQuery", "message": "Need at least 2 coordinates"}
+
+        graph = self.graph
+        snapped = [graph.nearest(lat, lng) for lat, lng in coordinates]
+
+        legs = []
+        path_nodes: List[int] = []
+        total_distance = 0.0
+        total_duration = 0.0
+        for (source, _), (target, _) in zip(snapped, snapped[1:]):
+            result = graph.shortest_path(source, target)
+            if result is None:
+                return 400, {"code": "NoRoute", "message": "Impossible route between points"}
+            nodes, distance, duration = result
+            path_nodes.extend(nodes if not path_nodes else nodes[1:])
+            total_distance += distance
+            total_duration += duration
+            legs.append({"distance": distance, "duration": duration, "steps": [],
+                         "summary": "", "weight": duration})
+
+        route = {
+            "distance": total_distance,
+            "duration": total_duration,
+            "weight": total_duration,
+            "weight_name": "duration",
+            "legs": legs,
+        }
+
+        overview = params.get("overview", "simplified")
+        if overview != "false":
+            points = [(graph._lat_list[n], graph._lng_list[n]) for n in path_nodes]
+            if overview == "simplified":
+                points = simplify_route(points, tolerance_meters=5.0)
+            if params.get("geometries", "polyline") == "geojson":
+                route["geometry"] = {
+                    "type": "LineString",
+                    "coordinates": [[lng, lat] for lat, lng in points],
+                }
+            else:
+                route["geometry"] = encode_polyline(points)
+
+        return 200, {
+            "code": "Ok",
+            "routes": [route],
+            "waypoints": [
+                {"name": "", "distance": distance,
+                 "location": [float(graph.lngs[node]), float(graph.lats[node])]}
+                for node, distance in snapped
+            ],
+        }
+
+    def table(self, coordinates: List[Tuple[float, float]],
+              params: Dict[str, str]) -> Tuple[int, dict]:
+        """Service /table: ma trận thời gian (và quãng đường) giữa các điểm"""
+        try:
+            sources = _parse_indices(params.get("sources"), len(coordinates))
+            destinations = _parse_indices(params.get("destinations"), len(coordinates))
+        except ValueError:
+            return 400, {"code": "InvalidOptions", "message": "Invalid sources/destinations"}
+
+        annotations = params.get("annotations", "duration").split(",")
+        graph = self.graph
+        snapped = [graph.nearest(lat, lng) for lat, lng in coordinates]
+        targets = [snapped[i][0] for i in destinations]
+
+        durations: List[List[Optional[float]]] = []
+        distances: List[List[Optional[float]]] = []
+        for i in sources:
+            costs, lengths = graph.costs_from(snapped[i][0])
+            durations.append([costs.get(target) for target in targets])
+            distances.append([lengths.get(target) for target in targets])
+
+        def _waypoint(index: int) -> dict:
+            node, distance = snapped[index]
+            return {"name": "", "distance": distance,
+                    "location": [float(graph.lngs[node]), float(graph.lats[node])]}
+
+        response = {
+            "code": "Ok",
+            "sources": [_waypoint(i) for i in sources],
+            "destinations": [_waypoint(i) for i in destinations],
+        }
+        if "duration" in annotations:
+            response["durations"] = durations
+        if "distance" in annotations:
+            response["distances"] = distances
+        return 200, response
+
+    # ---------- HTTP ----------
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Header và body được ghi riêng => tắt Nagle để tránh trễ ~40ms mỗi request
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, value: dict) -> None:
+                body = json.dumps(value, separators=(",", ":")).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                segments = [s for s in unquote(parts.path).split("/") if s]
+                params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+
+                # /{service}/v1/{profile}/{coordinates}
+                if len(segments) != 4 or segments[0] not in ("route", "table"):
+                    self._send_json(400, {"code": "InvalidUrl", "message": "URL string malformed"})
+                    return
+                service = segments[0]
+
+                with server._lock:
+                    server.request_counts[service] = server.request_counts.get(service, 0) + 1
+
+                server._delay()
+                if server._should_fail():
+                    self._send_json(server.failure_status, {"code": "Error", "message": "Injected failure"})
+                    return
+
+                try:
+                    coordinates = _parse_coordinates(segments[3])
+                except ValueError:
+                    self._send_json(400, {"code": "InvalidQuery", "message": "Query string malformed"})
+                    return
+
+                if service == "route":
+                    status, response = server.route(coordinates, params)
+                else:
+                    status, response = server.table(coordinates, params)
+                self._send_json(status, response)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    failure_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+
+    server = LocalOSRMServer(port=port,
+                             latency_seconds=latency_ms / 1000.0,
+                             failure_rate=failure_rate)
+    print(f"Local OSRM đang chạy tại {server.url} "
+          f"({server.graph.node_count} node)")
+    print("Nhấn Ctrl+C để dừng")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nĐã dừng")
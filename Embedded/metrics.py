@@ -0,0 +1,280 @@
+"""
+Metrics - Counter, gauge và histogram trong process, xuất dạng Prometheus text hoặc JSON
+
+FirebaseClient và OSRMRouter ghi vào REGISTRY mặc định (có thể truyền registry
+riêng). Xem kết quả:
+
+    from metrics import REGISTRY
+    print(REGISTRY.to_prometheus())
+    json.dumps(REGISTRY.snapshot())
+
+Các metric chính:
+- firebase_requests_total{method, path, status}
+- firebase_request_duration_seconds{method, path} (histogram)
+- firebase_bytes_total{direction, method}
+- firebase_errors_total{method, error}
+- firebase_sse_events_total{event}, firebase_stream_reconnects_total
+- osrm_requests_total{server, outcome}, osrm_request_duration_seconds{server}
+- osrm_hedges_total, route_cache_requests_total{result}
+- callback_queue_depth{dispatcher} (gauge), callback_events_total{dispatcher, outcome}
+- callback_queue_wait_seconds{dispatcher}, callback_duration_seconds{dispatcher}
+"""
+
+import bisect
+import math
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+# Bucket mặc định (giây) cho latency request mạng
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (
+        name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def path_label(path: str) -> str:
+    """
+    Nhãn `path` gọn cho metric: giữ segment đầu, thay phần còn lại bằng "*"
+    để số nhãn không tăng theo số đơn hàng ("orders/-Nabc/status" -> "orders/*")
+    """
+    segments = [segment for segment in path.split("/") if segment]
+    if not segments:
+        return "/"
+    return segments[0] + ("/*" if len(segments) > 1 else "")
+
+
+class Counter:
+    """Bộ đếm tăng dần theo từng tổ hợp label"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str = ""):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0.0)
+
+    def total(self) -> float:
+        """Tổng trên mọi tổ hợp label"""
+        with self._lock:
+            return sum(self._values.values())
+
+    def _prometheus_lines(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+    def _snapshot(self) -> List[dict]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [{"labels": dict(key), "value": value} for key, value in items]
+
+
+class Gauge(Counter):
+    """Giá trị tăng/giảm tùy ý theo từng tổ hợp label (ví dụ độ dài hàng đợi)"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self, bucket_count: int):
+        self.counts = [0] * bucket_count
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram:
+    """Histogram với bucket cố định (giống Prometheus), theo từng tổ hợp label"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str = "",
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, _HistogramSeries] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.buckets) + 1)
+            series.counts[index] += 1
+            series.count += 1
+            series.sum += value
+
+    def count(self, **labels: object) -> int:
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            return series.count if series else 0
+
+    def quantile(self, q: float, **labels: object) -> Optional[float]:
+        """
+        Ước lượng quantile (0-1) từ bucket bằng nội suy tuyến tính như
+        histogram_quantile của Prometheus; None nếu chưa có mẫu
+        """
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            if series is None or series.count == 0:
+                return None
+            counts = list(series.counts)
+            total = series.count
+
+        rank = q * total
+        cumulative = 0
+        for i, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count > 0:
+                if i >= len(self.buckets):
+                    # Rơi vào bucket +Inf: trả về cận trên lớn nhất đã biết
+                    return self.buckets[-1] if self.buckets else None
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1] if self.buckets else None
+
+    def _prometheus_lines(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(s.counts), s.count, s.sum)) for key, s in self._series.items())
+
+        lines = []
+        for key, (counts, count, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+    def _snapshot(self) -> List[dict]:
+        with self._lock:
+            items = sorted((key, (list(s.counts), s.count, s.sum)) for key, s in self._series.items())
+
+        result = []
+        for key, (counts, count, total) in items:
+            labels = dict(key)
+            result.append({
+                "labels": labels,
+                "count": count,
+                "sum": total,
+                "buckets": {_format_value(bound): bucket_count
+                            for bound, bucket_count in zip(self.buckets + (math.inf,), counts)},
+                "p50": self.quantile(0.5, **labels),
+                "p95": self.quantile(0.95, **labels),
+                "p99": self.quantile(0.99, **labels),
+            })
+        return result
+
+
+class MetricsRegistry:
+    """Tập hợp các metric, xuất dạng Prometheus text hoặc JSON"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str = "") -> Counter:
+        """Lấy (hoặc tạo) counter theo tên"""
+        return self._get_or_create(name, lambda: Counter(name, help_text), Counter)
+
+    def gauge(self, name: str, help_text: str = "") -> Gauge:
+        """Lấy (hoặc tạo) gauge theo tên"""
+        return self._get_or_create(name, lambda: Gauge(name, help_text), Gauge)
+
+    def histogram(self, name: str, help_text: str = "",
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        """Lấy (hoặc tạo) histogram theo tên"""
+        return self._get_or_create(name, lambda: Histogram(name, help_text, buckets), Histogram)
+
+    def _get_or_create(self, name, factory, metric_type):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            elif type(metric) is not metric_type:
+                raise ValueError(f"Metric {name} đã được đăng ký với kiểu khác")
+            return metric
+
+    def reset(self) -> None:
+        """Xóa toàn bộ metric"""
+        with self._lock:
+            self._metrics.clear()
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+
+        lines: List[str] = []
+        for name, metric in metrics:
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type_name}")
+            lines.extend(metric._prometheus_lines())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Dictionary có thể json.dumps: tên metric -> {type, help, series}"""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+
+        return {
+            name: {
+                "type": metric.type_name,
+                "help": metric.help,
+                "series": metric._snapshot(),
+            }
+            for name, metric in metrics
+        }
+
+
+# Registry mặc định dùng chung trong process
+REGISTRY = MetricsRegistry()
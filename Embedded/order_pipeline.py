@@ -0,0 +1,237 @@
+"""
+Order Pipeline - Tạo nhiều đơn hàng song song có giới hạn tốc độ
+
+- OSRM lookup và Firebase POST chạy trên một worker pool giới hạn số luồng
+- Mỗi backend (OSRM, Firebase) có một token bucket dùng chung giữa các worker,
+  tránh làm quá tải server khi tăng số worker
+- Ghi lại thời gian từng stage để báo cáo throughput và p50/p95/p99; mỗi đơn
+  cũng là một span "create_order" (profiling.py) với các stage là span con
+"""
+
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from auto_create_order import (
+    FirebaseClient,
+    build_random_order,
+    get_osrm_router,
+    get_route_from_osrm,
+    push_order,
+)
+from profiling import span
+
+
+# Giới hạn mặc định cho OSRM public server (~1 request/giây theo usage policy)
+DEFAULT_OSRM_RATE = 1.0
+
+
+class TokenBucket:
+    """
+    Token bucket an toàn đa luồng: tối đa `rate` lần acquire mỗi giây,
+    cho phép burst tối đa `capacity` lần liên tiếp.
+    """
+
+    def __init__(self, rate: Optional[float], capacity: Optional[float] = None):
+        """
+        Args:
+            rate: Số token nạp lại mỗi giây (None hoặc <= 0 = không giới hạn)
+            capacity: Số token tối đa trong bucket (mặc định max(1, rate))
+        """
+        self.rate = rate if rate and rate > 0 else None
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate or 1.0)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Chờ đến khi đủ token rồi lấy ra
+
+        Returns:
+            Thời gian đã chờ (giây)
+        """
+        if self.rate is None:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._last_refill) * self.rate,
+                )
+                self._last_refill = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+
+                wait_time = (tokens - self._tokens) / self.rate
+
+            time.sleep(wait_time)
+            waited += wait_time
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Percentile (nearest-rank) của một list đã sắp xếp, p trong khoảng 0-100"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class StageTimer:
+    """Thu thập thời gian thực thi theo từng stage (an toàn đa luồng)"""
+
+    def __init__(self):
+        self._samples: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(stage, []).append(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns:
+            Dictionary stage -> {"count", "p50", "p95", "p99", "max"} (giây)
+        """
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+
+        return {
+            stage: {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1] if values else 0.0,
+            }
+            for stage, values in samples.items()
+        }
+
+
+@dataclass
+class PipelineResult:
+    """Kết quả của một lần chạy pipeline"""
+    order_ids: List[str] = field(default_factory=list)
+    failed: int = 0
+    elapsed_seconds: float = 0.0
+    stages: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+    @property
+    def throughput(self) -> float:
+        """Số đơn tạo thành công mỗi giây"""
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return len(self.order_ids) / self.elapsed_seconds
+
+
+def create_orders_concurrently(firebase: FirebaseClient,
+                               destinations: List[Tuple[float, float]],
+                               workers: int = 4,
+                               firebase_rate: Optional[float] = None,
+                               osrm_rate: Optional[float] = DEFAULT_OSRM_RATE,
+                               compact_route: bool = False) -> PipelineResult:
+    """
+    Tạo đơn hàng cho từng điểm đích trên một worker pool
+
+    Vị trí robot (pickup) được lấy một lần cho cả batch. Mỗi worker chạy
+    OSRM -> build order -> POST; các lời gọi OSRM và Firebase đi qua token
+    bucket riêng của từng backend.
+
+    Args:
+        firebase: FirebaseClient (nên có pool_size >= workers)
+        destinations: Danh sách (lat, lng) điểm đích, mỗi điểm một đơn
+        workers: Số worker chạy song song
+        firebase_rate: Số POST tối đa mỗi giây (None = không giới hạn)
+        osrm_rate: Số request OSRM tối đa mỗi giây (None = không giới hạn)
+        compact_route: Ghi lộ trình dạng encoded polyline ("routePolyline")
+
+    Returns:
+        PipelineResult với danh sách Order IDs và thống kê theo stage
+    """
+    timer = StageTimer()
+    result = PipelineResult()
+    firebase_bucket = TokenBucket(firebase_rate)
+    osrm_bucket = TokenBucket(osrm_rate)
+    lock = threading.Lock()
+    # Đủ worker OSRM cho mọi worker cùng hedge, không xếp hàng sau request bị bỏ
+    get_osrm_router().set_concurrency(workers)
+
+    start_time = time.perf_counter()
+
+    stage_start = time.perf_counter()
+    robot = firebase.get_robot_location()
+    timer.record("robot_get", time.perf_counter() - stage_start)
+    if not robot:
+        print("✗ Không thể lấy vị trí robot từ Firebase")
+        result.failed = len(destinations)
+        result.elapsed_seconds = time.perf_counter() - start_time
+        result.stages = timer.summary()
+        return result
+
+    def _create_one(destination: Tuple[float, float]) -> Optional[str]:
+        dest_lat, dest_lng = destination
+
+        with span("osrm_wait"):
+            timer.record("osrm_wait", osrm_bucket.acquire())
+        stage_start = time.perf_counter()
+        with span("osrm"):
+            route_coords = get_route_from_osrm(robot.lat, robot.lon, dest_lat, dest_lng)
+        timer.record("osrm", time.perf_counter() - stage_start)
+        if not route_coords:
+            route_coords = [(robot.lat, robot.lon), (dest_lat, dest_lng)]
+
+        stage_start = time.perf_counter()
+        order = build_random_order(dest_lat, dest_lng, route_coords)
+        timer.record("build", time.perf_counter() - stage_start)
+
+        with span("firebase_wait"):
+            timer.record("firebase_wait", firebase_bucket.acquire())
+        stage_start = time.perf_counter()
+        with span("firebase_post"):
+            order_id = push_order(firebase, order, compact_route=compact_route)
+        timer.record("firebase_post", time.perf_counter() - stage_start)
+        return order_id
+
+    def _run(destination: Tuple[float, float]) -> None:
+        stage_start = time.perf_counter()
+        with span("create_order", destination=destination) as order_span:
+            try:
+                order_id = _create_one(destination)
+            except Exception as e:
+                print(f"  ✗ Lỗi khi tạo đơn hàng: {e}")
+                order_id = None
+            order_span.set_attribute("order_id", order_id)
+        timer.record("total", time.perf_counter() - stage_start)
+
+        with lock:
+            if order_id:
+                result.order_ids.append(order_id)
+            else:
+                result.failed += 1
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # list() để chờ xong và re-raise lỗi không mong muốn (nếu có)
+        list(executor.map(_run, destinations))
+
+    result.elapsed_seconds = time.perf_counter() - start_time
+    result.stages = timer.summary()
+    return result
+
+
+def print_pipeline_report(result: PipelineResult) -> None:
+    """In throughput và percentile của từng stage"""
+    print(f"Thời gian: {result.elapsed_seconds:.2f}s | "
+          f"Throughput: {result.throughput:.2f} đơn/s")
+    print(f"{'Stage':<15}{'count':>7}{'p50 (ms)':>11}{'p95 (ms)':>11}{'p99 (ms)':>11}{'max (ms)':>11}")
+    for stage, stats in result.stages.items():
+        print(f"{stage:<15}{stats['count']:>7}"
+              f"{stats['p50'] * 1000:>11.1f}{stats['p95'] * 1000:>11.1f}"
+              f"{stats['p99'] * 1000:>11.1f}{stats['max'] * 1000:>11.1f}")
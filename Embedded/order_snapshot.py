@@ -0,0 +1,344 @@
+"""
+Order Snapshot - Lưu bản sao node `orders` trên đĩa để khởi động nhanh (warm start)
+
+Chạy: python Embedded/order_snapshot.py [snapshot_path]
+
+Thay vì tải lại toàn bộ `orders` mỗi lần khởi động, consumer đọc snapshot từ
+SQLite rồi đối chiếu với server bằng các request nhỏ:
+- GET `orders?shallow=true` (chỉ danh sách key) => biết đơn mới và đơn đã xóa
+- Đơn mới: push ID tăng theo thời gian nên thường tải được bằng một query
+  orderBy="$key"/startAt
+- Đơn chưa kết thúc (pending, in_progress) có thể đổi trạng thái => tải lại
+  bằng query orderBy="status"/equalTo; đơn đã hoàn thành coi như không đổi
+
+    store = OrderSnapshotStore()
+    cache = store.warm_start(firebase)          # vài ms thay vì tải cả node
+    firebase.listen_orders(on_change, snapshot_store=store)
+
+listen_orders(snapshot_store=...) gọi on_change ngay với dữ liệu từ snapshot
+và ghi lại mọi thay đổi nhận được từ stream (chỉ những đơn bị thay đổi).
+
+Giới hạn: stream REST của Firebase luôn gửi lại toàn bộ node trong event `put`
+đầu tiên của mỗi kết nối (kể cả khi kết nối lại). Với listen_orders, snapshot
+giúp có dữ liệu ngay khi khởi động (không chờ tải xong), còn lượng dữ liệu tải
+về không giảm; khi đó chỉ các đơn có digest khác bản đã lưu được ghi lại xuống
+đĩa. Tiết kiệm băng thông chỉ có với các consumer gọi warm_start() một lần rồi
+không mở stream (ví dụ script thống kê, CLI bên dưới).
+
+Query theo status cần rule `".indexOn": "status"` trên node `orders`; thiếu
+index thì Firebase trả lỗi 400, reconcile() in cảnh báo và giữ dữ liệu snapshot
+của các đơn chưa kết thúc thay vì tải lại từng đơn.
+"""
+
+import hashlib
+import marshal
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from firebase_sample import DEFAULT_DATABASE_URL, FirebaseClient, OrderCache, build_query_params
+
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    ".orders_snapshot.sqlite3",
+)
+
+# Trạng thái đơn còn có thể thay đổi (cần đối chiếu lại với server khi khởi động)
+ACTIVE_STATUSES = ("pending", "in_progress")
+
+# Dữ liệu từng đơn lưu bằng marshal (đọc nhanh hơn json ~2 lần, ghi ~10 lần)
+SNAPSHOT_FORMAT = "marshal-%d" % marshal.version
+
+
+def _digest(data: Any) -> bytes:
+    """
+    Dấu vân tay của dữ liệu một đơn để biết đơn có đổi hay không. Dùng marshal
+    version 2 (không có tham chiếu) nên 2 dict bằng nhau luôn cho cùng kết quả
+    """
+    return hashlib.blake2b(marshal.dumps(data, 2), digest_size=16).digest()
+
+
+class OrderSnapshotStore:
+    """Snapshot node `orders` trong SQLite kèm thời điểm áp dụng thay đổi gần nhất (an toàn đa luồng)"""
+
+    def __init__(self,
+                 path: str = DEFAULT_SNAPSHOT_PATH,
+                 active_statuses: Tuple[str, ...] = ACTIVE_STATUSES,
+                 mmap_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            path: File SQLite (":memory:" = chỉ trong RAM, dùng khi test)
+            active_statuses: Các status cần tải lại khi đối chiếu với server
+            mmap_bytes: Kích thước memory-map của SQLite khi đọc snapshot
+        """
+        self.path = path
+        self.active_statuses = tuple(active_statuses)
+
+        # Digest dữ liệu đã lưu của từng đơn, để chỉ ghi những đơn thật sự thay đổi
+        self._stored: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            " id TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " digest BLOB NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    # ==================== ĐỌC / GHI ====================
+
+    @property
+    def last_applied_at(self) -> Optional[float]:
+        """Thời điểm (epoch giây) snapshot được cập nhật lần cuối, None nếu chưa có"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM meta WHERE key = 'last_applied_at'").fetchone()
+        return float(row[0]) if row else None
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """
+        Đọc snapshot
+
+        Returns:
+            Dictionary order_id -> dữ liệu JSON gốc, None nếu chưa từng lưu snapshot
+        """
+        with self._lock:
+            meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+            if "last_applied_at" not in meta or meta.get("format") != SNAPSHOT_FORMAT:
+                return None
+            rows = self._db.execute("SELECT id, data, digest FROM orders").fetchall()
+            try:
+                raw = {order_id: marshal.loads(data) for order_id, data, _ in rows}
+            except (ValueError, EOFError, TypeError) as e:
+                print(f"✗ Snapshot hỏng, bỏ qua: {e}")
+                return None
+            self._stored = {order_id: digest for order_id, _, digest in rows}
+        return raw
+
+    def save_all(self, raw_orders: Dict[str, Any]) -> int:
+        """
+        Thay snapshot bằng toàn bộ node `orders` (chỉ ghi các đơn khác với bản đã lưu)
+
+        Returns:
+            Số đơn được ghi hoặc xóa
+        """
+        digests = {order_id: _digest(data)
+                   for order_id, data in raw_orders.items() if data is not None}
+        with self._lock:
+            removed = [order_id for order_id in self._stored if order_id not in digests]
+            changed = [(order_id, marshal.dumps(raw_orders[order_id]), digest)
+                       for order_id, digest in digests.items()
+                       if self._stored.get(order_id) != digest]
+            self._write(changed, removed)
+            self._stored = digests
+        return len(changed) + len(removed)
+
+    def save_orders(self, raw_by_id: Dict[str, Any]) -> None:
+        """Ghi một số đơn (giá trị None = đơn đã bị xóa)"""
+        changed = []
+        removed = []
+        for order_id, data in raw_by_id.items():
+            if data is None:
+                removed.append(order_id)
+            else:
+                changed.append((order_id, marshal.dumps(data), _digest(data)))
+
+        with self._lock:
+            self._write(changed, removed)
+            for order_id in removed:
+                self._stored.pop(order_id, None)
+            self._stored.update((order_id, digest) for order_id, _, digest in changed)
+
+    def _write(self, changed: Iterable[Tuple[str, bytes, bytes]], removed: Iterable[str]) -> None:
+        with self._db:
+            self._db.executemany("DELETE FROM orders WHERE id = ?",
+                                 [(order_id,) for order_id in removed])
+            self._db.executemany("INSERT OR REPLACE INTO orders (id, data, digest) VALUES (?, ?, ?)",
+                                 changed)
+            self._db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                 [("last_applied_at", repr(time.time())),
+                                  ("format", SNAPSHOT_FORMAT)])
+
+    def record_event(self, cache: OrderCache, event_type: str, payload: Any) -> None:
+        """
+        Ghi các đơn bị một event SSE thay đổi (gọi sau khi cache đã áp dụng event)
+
+        Event `put` tại root (snapshot đầu mỗi kết nối) được so digest với bản
+        đã lưu, chỉ các đơn khác mới được ghi
+        """
+        touched = OrderCache.touched_ids(event_type, payload)
+        if touched is None:
+            self.save_all(cache.raw_orders)
+        elif touched:
+            raw = cache.raw_orders
+            self.save_orders({order_id: raw.get(order_id) for order_id in touched})
+
+    # ==================== ĐỐI CHIẾU VỚI SERVER ====================
+
+    def reconcile(self, firebase: FirebaseClient,
+                  raw_orders: Dict[str, Any]) -> Optional[Dict[str, int]]:
+        """
+        Cập nhật raw_orders (tại chỗ) theo server mà không tải toàn bộ node
+
+        Args:
+            firebase: FirebaseClient
+            raw_orders: Dữ liệu từ load()
+
+        Chỉ xóa đơn không còn trong danh sách key (shallow) tải thành công; request
+        tải đơn bị lỗi thì giữ nguyên dữ liệu cũ và tính vào "failed".
+
+        Returns:
+            {"added", "updated", "removed", "failed", "requests", "changed_ids"},
+            hoặc None nếu không đối chiếu được (giữ nguyên raw_orders)
+        """
+        requests_made = 1
+        keys = firebase._make_request("GET", "orders", params=build_query_params(shallow=True))
+        if keys is None and raw_orders:
+            # None có thể là node rỗng hoặc lỗi mạng => không xóa snapshot
+            print("✗ Không lấy được danh sách key của orders, giữ nguyên snapshot")
+            return None
+        server_ids = set(keys) if isinstance(keys, dict) else set()
+
+        removed = [order_id for order_id in raw_orders if order_id not in server_ids]
+        for order_id in removed:
+            del raw_orders[order_id]
+
+        added = sorted(server_ids.difference(raw_orders))
+        last_key = max(raw_orders) if raw_orders else None
+        fetched: Dict[str, Any] = {}
+        failed = 0
+
+        def _fetch_one(order_id: str, into: Dict[str, Any]) -> None:
+            # None = lỗi mạng hoặc đơn vừa bị xóa; không phân biệt được nên giữ
+            # dữ liệu cũ, stream/lần đối chiếu sau sẽ cập nhật
+            nonlocal failed, requests_made
+            data = firebase._make_request("GET", f"orders/{order_id}")
+            requests_made += 1
+            if data is None:
+                failed += 1
+            else:
+                into[order_id] = data
+
+        if added:
+            if last_key is None or added[0] > last_key:
+                # Đơn mới đều nằm sau key cũ lớn nhất => một query theo key
+                data = firebase._make_request(
+                    "GET", "orders", params=build_query_params(order_by="$key", start_at=added[0]))
+                requests_made += 1
+                if isinstance(data, dict):
+                    fetched.update(data)
+            missing = [order_id for order_id in added if order_id not in fetched]
+            for order_id in missing:
+                _fetch_one(order_id, fetched)
+
+        active_before = {order_id for order_id, data in raw_orders.items()
+                         if isinstance(data, dict) and data.get("status") in self.active_statuses}
+        refreshed: Dict[str, Any] = {}
+        status_failed = False
+        for status in self.active_statuses:
+            data = firebase._make_request(
+                "GET", "orders", params=build_query_params(order_by="status", equal_to=status))
+            requests_made += 1
+            if isinstance(data, dict):
+                refreshed.update(data)
+            elif data is None:
+                # Query không khớp đơn nào trả về {}; None là lỗi (thường là thiếu index)
+                status_failed = True
+                failed += 1
+
+        if status_failed:
+            print(f"⚠ Query orderBy=\"status\" lỗi (đã thêm \".indexOn\": \"status\" vào rules "
+                  f"của orders chưa?). Giữ dữ liệu snapshot của {len(active_before)} đơn "
+                  f"chưa kết thúc, không tải lại từng đơn")
+        else:
+            # Đơn trước đây chưa kết thúc nhưng không còn trong query => đã đổi sang trạng thái khác
+            for order_id in active_before.difference(refreshed):
+                _fetch_one(order_id, refreshed)
+
+        changed_ids = set(removed)
+        added_count = 0
+        updated = 0
+        for order_id, data in {**fetched, **refreshed}.items():
+            old = raw_orders.get(order_id)
+            if old == data:
+                continue
+            if old is None:
+                added_count += 1
+            else:
+                updated += 1
+            raw_orders[order_id] = data
+            changed_ids.add(order_id)
+
+        return {
+            "added": added_count,
+            "updated": updated,
+            "removed": len(removed),
+            "failed": failed,
+            "requests": requests_made,
+            "changed_ids": changed_ids,
+        }
+
+    def warm_start(self, firebase: FirebaseClient,
+                   cache: Optional[OrderCache] = None) -> OrderCache:
+        """
+        Nạp snapshot vào OrderCache và đối chiếu với server
+
+        Lần đầu (chưa có snapshot) sẽ tải toàn bộ `orders` một lần rồi lưu lại.
+
+        Args:
+            firebase: FirebaseClient
+            cache: OrderCache cần nạp (None = tạo mới)
+
+        Returns:
+            OrderCache đã nạp (cache.loaded = False nếu không tải được dữ liệu nào)
+        """
+        cache = cache if cache is not None else OrderCache()
+        start = time.perf_counter()
+
+        raw = self.load()
+        if raw is None:
+            print("Chưa có snapshot, tải toàn bộ orders...")
+            data = firebase._make_request("GET", "orders")
+            raw = data if isinstance(data, dict) else {}
+            self.save_all(raw)
+            cache.load(raw)
+            print(f"✓ Đã lưu snapshot {len(raw)} đơn ({(time.perf_counter() - start) * 1000:.0f}ms)")
+            return cache
+
+        loaded_ms = (time.perf_counter() - start) * 1000
+        result = self.reconcile(firebase, raw)
+        if result is not None:
+            self.save_orders({order_id: raw.get(order_id) for order_id in result["changed_ids"]})
+            print(f"✓ Warm start: {len(raw)} đơn từ snapshot ({loaded_ms:.0f}ms), "
+                  f"+{result['added']} ~{result['updated']} -{result['removed']} "
+                  f"({result['failed']} lỗi) sau {result['requests']} request ({(time.perf_counter() - start) * 1000:.0f}ms)")
+        cache.load(raw)
+        return cache
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SNAPSHOT_PATH
+    firebase = FirebaseClient(DEFAULT_DATABASE_URL)
+    store = OrderSnapshotStore(path)
+    cache = store.warm_start(firebase)
+    print(f"Có {len(cache.orders)} đơn hàng, snapshot: {path}")
+    store.close()
@@ -0,0 +1,331 @@
+"""
+OSRM Client - Gọi nhiều OSRM server với hedged request và thống kê từng server
+
+- Server ưu tiên được chọn theo latency/tỉ lệ lỗi đo được (giống cơ chế
+  currentServerIndex của OSRMService bên app Mobile: giữ server vừa thành công)
+- Hedged mode: gửi request tới server ưu tiên, nếu sau một khoảng trễ
+  (percentile latency của server đó) chưa có kết quả thì gửi thêm tới server
+  tiếp theo, lấy kết quả tốt đầu tiên. Request thua không hủy được khi đang chạy,
+  nên hedged request có timeout ngắn (hedge_timeout) và pool worker được chỉnh
+  theo số lời gọi song song của caller (set_concurrency)
+- Latency/lỗi từng request và số lần hedge được ghi vào MetricsRegistry
+  (osrm_request_duration_seconds, osrm_requests_total, osrm_hedges_total)
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Deque, Dict, List, Optional
+
+import requests
+
+from metrics import REGISTRY, MetricsRegistry
+from route_cache import RouteResult
+
+
+_local = threading.local()
+
+
+def _get_session() -> requests.Session:
+    """Session keep-alive riêng cho từng thread"""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _local.session = session
+    return session
+
+
+def request_route(server_url: str,
+                  origin_lat: float, origin_lng: float,
+                  dest_lat: float, dest_lng: float,
+                  timeout: float = 30.0) -> RouteResult:
+    """
+    Gọi /route/v1/driving của một OSRM server
+
+    Raises:
+        requests.exceptions.RequestException: Lỗi kết nối/HTTP
+        ValueError: OSRM không tìm được route
+    """
+    url = (f"{server_url}/route/v1/driving/"
+           f"{origin_lng},{origin_lat};{dest_lng},{dest_lat}"
+           f"?overview=full&geometries=geojson")
+
+    response = _get_session().get(url, timeout=timeout)
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(
+            f"OSRM server returned status {response.status_code}",
+            response=response,
+        )
+
+    data = response.json()
+    if data.get('code') != 'Ok' or not data.get('routes'):
+        raise ValueError("No route found from OSRM")
+
+    route = data['routes'][0]
+    coordinates = route['geometry']['coordinates']
+
+    # Convert từ [lng, lat] sang (lat, lng)
+    return RouteResult(
+        points=[(coord[1], coord[0]) for coord in coordinates],
+        distance=route.get('distance', 0),  # meters
+        duration=route.get('duration', 0),  # seconds
+    )
+
+
+class ServerStats:
+    """Thống kê latency và lỗi gần đây của một OSRM server"""
+
+    def __init__(self, window: int = 50):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.successes = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+
+    def record_success(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.successes += 1
+        self.consecutive_errors = 0
+
+    def record_error(self) -> None:
+        self.errors += 1
+        self.consecutive_errors += 1
+
+    @property
+    def error_rate(self) -> float:
+        total = self.successes + self.errors
+        return self.errors / total if total else 0.0
+
+    def latency_percentile(self, p: float) -> Optional[float]:
+        """Percentile latency (giây) trên cửa sổ gần đây, None nếu chưa có mẫu"""
+        if not self.latencies:
+            return None
+        values = sorted(self.latencies)
+        index = min(len(values) - 1, int(p / 100.0 * len(values)))
+        return values[index]
+
+    def score(self, default_latency: float) -> float:
+        """Điểm để xếp hạng server (càng nhỏ càng tốt)"""
+        p50 = self.latency_percentile(50)
+        latency = p50 if p50 is not None else default_latency
+        # Mỗi lỗi liên tiếp nhân đôi điểm phạt, tỉ lệ lỗi chung cộng thêm
+        return latency * (1.0 + 4.0 * self.error_rate) * (2 ** min(self.consecutive_errors, 6))
+
+    def to_dict(self) -> dict:
+        return {
+            "successes": self.successes,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 3),
+            "p50": self.latency_percentile(50),
+            "p95": self.latency_percentile(95),
+        }
+
+
+class OSRMRouter:
+    """
+    Chọn OSRM server theo thống kê và gửi hedged request (an toàn đa luồng)
+    """
+
+    def __init__(self,
+                 servers: List[str],
+                 timeout: float = 30.0,
+                 hedge_percentile: float = 95.0,
+                 min_hedge_delay: float = 0.05,
+                 max_hedge_delay: float = 3.0,
+                 default_hedge_delay: float = 1.0,
+                 min_samples: int = 5,
+                 hedge_timeout: Optional[float] = None,
+                 max_concurrency: int = 2,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            servers: Danh sách URL OSRM server (thứ tự ban đầu = thứ tự ưu tiên)
+            timeout: Timeout của mỗi request (giây)
+            hedge_percentile: Percentile latency của server ưu tiên dùng làm
+                              khoảng trễ trước khi gửi hedged request
+            min_hedge_delay, max_hedge_delay: Giới hạn khoảng trễ hedge (giây)
+            default_hedge_delay: Khoảng trễ khi server chưa đủ min_samples mẫu
+            min_samples: Số mẫu latency tối thiểu để dùng percentile
+            hedge_timeout: Timeout của hedged request (giây, mặc định
+                           2 * max_hedge_delay, không quá timeout)
+            max_concurrency: Số lời gọi route() song song tối đa, dùng để chọn
+                             số worker (xem set_concurrency)
+            metrics: MetricsRegistry (mặc định metrics.REGISTRY)
+        """
+        self.servers = list(servers)
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        if hedge_timeout is None:
+            hedge_timeout = 2 * max_hedge_delay
+        self.hedge_timeout = min(timeout, hedge_timeout)
+
+        self.stats: Dict[str, ServerStats] = {server: ServerStats() for server in self.servers}
+        self._preferred = self.servers[0] if self.servers else None
+        self._lock = threading.Lock()
+        self.max_concurrency = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.set_concurrency(max_concurrency)
+
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self._requests_total = self.metrics.counter(
+            "osrm_requests_total", "Số request tới OSRM theo server và kết quả")
+        self._request_duration = self.metrics.histogram(
+            "osrm_request_duration_seconds", "Latency request tới OSRM (giây)")
+        self._hedges_total = self.metrics.counter(
+            "osrm_hedges_total", "Số hedged request gửi thêm tới server kế tiếp")
+
+    def set_concurrency(self, max_concurrency: int) -> None:
+        """
+        Nới pool worker cho max_concurrency lời gọi route() song song
+
+        Mỗi lời gọi chiếm tối đa len(servers) worker, và request thua cuộc vẫn
+        giữ worker tới khi xong/timeout => pool gấp đôi số đó, để request mới
+        không phải xếp hàng sau các request đã bị bỏ. Không thu nhỏ pool.
+        """
+        with self._lock:
+            if max_concurrency <= self.max_concurrency:
+                return
+            self.max_concurrency = max_concurrency
+            # Pool cũ không shutdown: request đang chạy vẫn xong, worker rảnh tự
+            # thoát khi không còn lời gọi route() nào giữ pool cũ
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(4, 2 * max_concurrency * len(self.servers)),
+                thread_name_prefix="osrm",
+            )
+
+    def ranked_servers(self) -> List[str]:
+        """
+        Danh sách server theo thứ tự ưu tiên: server ưu tiên (sticky, vừa thành
+        công gần nhất) đứng đầu trừ khi nó đang lỗi liên tiếp, còn lại xếp theo điểm
+        """
+        with self._lock:
+            ranked = sorted(
+                self.servers,
+                key=lambda s: self.stats[s].score(self.default_hedge_delay),
+            )
+            preferred = self._preferred
+            if preferred in ranked and self.stats[preferred].consecutive_errors == 0:
+                ranked.remove(preferred)
+                ranked.insert(0, preferred)
+            return ranked
+
+    def hedge_delay(self, server: str) -> float:
+        """Khoảng trễ trước khi hedge, theo percentile latency của server"""
+        with self._lock:
+            stats = self.stats[server]
+            if len(stats.latencies) < self.min_samples:
+                return self.default_hedge_delay
+            delay = stats.latency_percentile(self.hedge_percentile)
+        return max(self.min_hedge_delay, min(self.max_hedge_delay, delay))
+
+    def stats_snapshot(self) -> Dict[str, dict]:
+        """Thống kê hiện tại của từng server"""
+        with self._lock:
+            return {server: stats.to_dict() for server, stats in self.stats.items()}
+
+    def _attempt(self, server: str,
+                 origin_lat: float, origin_lng: float,
+                 dest_lat: float, dest_lng: float,
+                 timeout: Optional[float] = None) -> Optional[RouteResult]:
+        """Gọi một server và ghi lại thống kê; None nếu lỗi"""
+        start = time.perf_counter()
+        try:
+            result = request_route(server, origin_lat, origin_lng, dest_lat, dest_lng,
+                                   timeout=self.timeout if timeout is None else timeout)
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stats[server].record_error()
+            self._request_duration.observe(elapsed, server=server)
+            self._requests_total.inc(server=server, outcome=type(e).__name__)
+            print(f"  ✗ OSRM Error with {server}: {e}")
+            return None
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats[server].record_success(elapsed)
+        self._request_duration.observe(elapsed, server=server)
+        self._requests_total.inc(server=server, outcome="ok")
+        return result
+
+    def route(self, origin_lat: float, origin_lng: float,
+              dest_lat: float, dest_lng: float,
+              hedged: bool = True) -> Optional[RouteResult]:
+        """
+        Lấy lộ trình từ server tốt nhất
+
+        Args:
+            origin_lat, origin_lng: Tọa độ điểm đầu
+            dest_lat, dest_lng: Tọa độ điểm cuối
+            hedged: True = gửi thêm request tới server kế tiếp nếu server ưu tiên
+                    chậm hơn hedge_delay; False = thử lần lượt từng server
+
+        Returns:
+            RouteResult hoặc None nếu mọi server đều lỗi
+        """
+        servers = self.ranked_servers()
+        args = (origin_lat, origin_lng, dest_lat, dest_lng)
+
+        if not hedged:
+            for server in servers:
+                print(f"  Trying OSRM server: {server}")
+                result = self._attempt(server, *args)
+                if result is not None:
+                    self._mark_preferred(server)
+                    return result
+            return None
+
+        pending: Dict[Future, str] = {}
+        next_index = 0
+        executor = self._executor
+
+        def _launch(timeout: Optional[float] = None) -> None:
+            nonlocal next_index
+            server = servers[next_index]
+            next_index += 1
+            pending[executor.submit(self._attempt, server, *args, timeout)] = server
+
+        if not servers:
+            return None
+        print(f"  Trying OSRM server: {servers[0]}")
+        _launch()
+
+        while pending:
+            hedge_timeout = None
+            if next_index < len(servers):
+                hedge_timeout = self.hedge_delay(servers[next_index - 1])
+
+            done, _ = wait(pending, timeout=hedge_timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # Server hiện tại chậm hơn percentile thường lệ => hedge
+                print(f"  ↻ Hedging to OSRM server: {servers[next_index]} "
+                      f"(sau {hedge_timeout * 1000:.0f}ms)")
+                self._hedges_total.inc()
+                _launch(self.hedge_timeout)
+                continue
+
+            for future in done:
+                server = pending.pop(future)
+                result = future.result()
+                if result is not None:
+                    # Request còn lại: hủy nếu chưa chạy, nếu đang chạy thì bỏ qua kết quả
+                    for other in pending:
+                        other.cancel()
+                    self._mark_preferred(server)
+                    return result
+
+            # Server lỗi => thử ngay server kế tiếp
+            if next_index < len(servers) and not pending:
+                print(f"  Trying OSRM server: {servers[next_index]}")
+                _launch()
+
+        return None
+
+    def _mark_preferred(self, server: str) -> None:
+        with self._lock:
+            self._preferred = server
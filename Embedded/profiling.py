@@ -0,0 +1,331 @@
+"""
+Profiling - Span lồng nhau có thuộc tính và hook để thu thập thời gian từng stage
+
+Code được đo chỉ cần mở span; khi chưa đăng ký hook nào, span() trả về một
+span rỗng dùng chung nên gần như không tốn chi phí:
+
+    with span("osrm.route", cache="miss") as s:
+        ...
+        s.set_attribute("points", len(points))
+
+Span mở trong span khác (cùng thread) trở thành span con. Hook nhận
+on_start/on_end của mọi span; ProfileCollector là hook có sẵn, giữ các span
+gốc (ví dụ mỗi lần create_order) để in breakdown theo từng đơn và bảng tổng
+hợp kiểu flame graph sau một batch:
+
+    collector = ProfileCollector()
+    add_hook(collector)
+    ... tạo đơn ...
+    collector.print_summary()
+    collector.write_folded("orders.folded")  # flamegraph.pl / speedscope
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+
+# ==================== SPAN ====================
+
+class Span:
+    """Một khoảng thời gian có tên, thuộc tính và các span con"""
+
+    __slots__ = ("name", "attributes", "parent", "children", "start", "end", "thread")
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attributes: Dict[str, Any] = attributes or {}
+        self.parent: Optional[Span] = None
+        self.children: List[Span] = []
+        self.start = 0.0
+        self.end: Optional[float] = None
+        self.thread = ""
+
+    @property
+    def duration(self) -> float:
+        """Thời gian (giây); span chưa kết thúc tính tới hiện tại"""
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    @property
+    def self_time(self) -> float:
+        """Thời gian không nằm trong span con nào"""
+        return max(0.0, self.duration - sum(child.duration for child in self.children))
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def walk(self, path: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], 'Span']]:
+        """Duyệt span này và mọi span con, kèm đường dẫn tên từ span gốc"""
+        path = path + (self.name,)
+        yield path, self
+        for child in self.children:
+            yield from child.walk(path)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "attributes": dict(self.attributes),
+            "duration_ms": round(self.duration * 1000, 3),
+            "children": [child.to_dict() for child in self.children],
+        }
+
+    def __enter__(self) -> 'Span':
+        stack = _stack()
+        self.parent = stack[-1] if stack else None
+        self.thread = threading.current_thread().name
+        stack.append(self)
+        for hook in _hooks:
+            hook.on_start(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if self.parent is not None:
+            self.parent.children.append(self)
+        for hook in _hooks:
+            hook.on_end(self)
+
+
+class _NoopSpan:
+    """Span rỗng dùng khi chưa có hook (không đo, không lưu gì)"""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_local = threading.local()
+# Tuple (không phải list) để các thread đọc không cần lock khi hook thay đổi
+_hooks: Tuple['SpanHook', ...] = ()
+_hooks_lock = threading.Lock()
+
+
+def _stack() -> List[Span]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def span(name: str, **attributes: Any):
+    """
+    Mở một span (dùng với `with`)
+
+    Args:
+        name: Tên span, ví dụ "osrm.route"
+        **attributes: Thuộc tính ban đầu của span
+
+    Returns:
+        Span, hoặc span rỗng nếu chưa có hook nào được đăng ký
+    """
+    if not _hooks:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def current_span() -> Optional[Span]:
+    """Span đang mở trong thread hiện tại (None nếu không có)"""
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+# ==================== HOOKS ====================
+
+class SpanHook:
+    """Hook nhận sự kiện bắt đầu/kết thúc của mọi span (override theo nhu cầu)"""
+
+    def on_start(self, span: Span) -> None:
+        pass
+
+    def on_end(self, span: Span) -> None:
+        pass
+
+
+def add_hook(hook: SpanHook) -> None:
+    """Đăng ký hook (span chỉ được đo khi có ít nhất một hook)"""
+    global _hooks
+    with _hooks_lock:
+        if hook not in _hooks:
+            _hooks = _hooks + (hook,)
+
+
+def remove_hook(hook: SpanHook) -> None:
+    """Hủy đăng ký hook"""
+    global _hooks
+    with _hooks_lock:
+        _hooks = tuple(h for h in _hooks if h is not hook)
+
+
+# ==================== COLLECTOR ====================
+
+class ProfileCollector(SpanHook):
+    """
+    Giữ các span gốc đã kết thúc để in breakdown từng lần chạy và bảng tổng hợp
+    kiểu flame graph (tổng thời gian/self time theo đường dẫn span)
+    """
+
+    def __init__(self, root_names: Optional[List[str]] = None,
+                 max_traces: int = 10000,
+                 breakdown_path: Optional[str] = None):
+        """
+        Args:
+            root_names: Chỉ giữ span gốc có tên trong danh sách này
+                        (None = mọi span gốc)
+            max_traces: Số span gốc tối đa giữ trong bộ nhớ (cũ nhất bị bỏ)
+            breakdown_path: Nếu có, ghi breakdown từng span gốc vào file này
+                            dạng JSON Lines ngay khi span kết thúc
+        """
+        self.root_names = set(root_names) if root_names else None
+        self.traces: Deque[Span] = deque(maxlen=max_traces)
+        self.breakdown_path = breakdown_path
+        self._lock = threading.Lock()
+
+    def on_end(self, span: Span) -> None:
+        if span.parent is not None:
+            return
+        if self.root_names is not None and span.name not in self.root_names:
+            return
+
+        with self._lock:
+            self.traces.append(span)
+            if self.breakdown_path:
+                with open(self.breakdown_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(self.breakdown(span), ensure_ascii=False, default=str) + "\n")
+
+    def clear(self) -> None:
+        with self._lock:
+            self.traces.clear()
+
+    @staticmethod
+    def breakdown(trace: Span) -> dict:
+        """
+        Thời gian từng stage của một span gốc
+
+        Returns:
+            Dictionary {"name", "attributes", "total_ms", "stages": {"a/b": ms}}
+        """
+        stages: Dict[str, float] = {}
+        for path, node in trace.walk():
+            if len(path) > 1:
+                key = "/".join(path[1:])
+                stages[key] = stages.get(key, 0.0) + round(node.duration * 1000, 3)
+        return {
+            "name": trace.name,
+            "attributes": dict(trace.attributes),
+            "total_ms": round(trace.duration * 1000, 3),
+            "stages": stages,
+        }
+
+    @staticmethod
+    def format_trace(trace: Span) -> str:
+        """Cây span của một lần chạy, mỗi dòng một span kèm thời gian và % của span gốc"""
+        total = trace.duration or 1e-12
+        lines = []
+        for path, node in trace.walk():
+            attrs = " ".join(f"{k}={v}" for k, v in node.attributes.items())
+            lines.append(f"{'  ' * (len(path) - 1)}{node.name:<{max(1, 32 - 2 * (len(path) - 1))}}"
+                         f"{node.duration * 1000:>9.1f}ms {node.duration / total * 100:>5.1f}%"
+                         f"{'  ' + attrs if attrs else ''}")
+        return "\n".join(lines)
+
+    def flame_summary(self) -> List[dict]:
+        """
+        Tổng hợp mọi span gốc theo đường dẫn span (như flame graph)
+
+        Returns:
+            List các {"stack", "count", "total", "self"} (giây); span con đứng
+            ngay sau span cha, span tốn nhiều thời gian hơn đứng trước
+        """
+        with self._lock:
+            traces = list(self.traces)
+
+        rows: Dict[Tuple[str, ...], List[float]] = {}
+        for trace in traces:
+            for path, node in trace.walk():
+                row = rows.setdefault(path, [0, 0.0, 0.0])
+                row[0] += 1
+                row[1] += node.duration
+                row[2] += node.self_time
+
+        children: Dict[Tuple[str, ...], List[Tuple[str, ...]]] = {}
+        for path in rows:
+            children.setdefault(path[:-1], []).append(path)
+
+        ordered: List[dict] = []
+
+        def _visit(parent: Tuple[str, ...]) -> None:
+            for path in sorted(children.get(parent, ()), key=lambda p: -rows[p][1]):
+                count, total, self_time = rows[path]
+                ordered.append({"stack": path, "count": count, "total": total, "self": self_time})
+                _visit(path)
+
+        _visit(())
+        return ordered
+
+    def self_time_by_name(self) -> Dict[str, float]:
+        """Self time (giây) cộng dồn theo tên span, giảm dần; cho biết thời gian thực sự nằm ở đâu"""
+        totals: Dict[str, float] = {}
+        for row in self.flame_summary():
+            name = row["stack"][-1]
+            totals[name] = totals.get(name, 0.0) + row["self"]
+        return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+    def to_folded(self) -> str:
+        """Folded stacks ("a;b;c <self_us>") cho flamegraph.pl hoặc speedscope"""
+        return "\n".join(
+            f"{';'.join(row['stack'])} {int(row['self'] * 1_000_000)}"
+            for row in self.flame_summary()
+        ) + "\n"
+
+    def write_folded(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_folded())
+
+    def print_breakdowns(self, limit: Optional[int] = None) -> None:
+        """In cây span của từng lần chạy (limit = chỉ in N lần gần nhất)"""
+        with self._lock:
+            traces = list(self.traces)
+        if limit is not None:
+            traces = traces[-limit:]
+        for trace in traces:
+            print(self.format_trace(trace))
+            print()
+
+    def print_summary(self, bar_width: int = 30) -> None:
+        """In bảng tổng hợp kiểu flame graph và self time theo tên span"""
+        rows = self.flame_summary()
+        if not rows:
+            print("(chưa có span nào)")
+            return
+
+        grand_total = sum(row["total"] for row in rows if len(row["stack"]) == 1) or 1e-12
+        print(f"{'Span':<40}{'count':>7}{'total (ms)':>12}{'avg (ms)':>10}{'self (ms)':>11}  %")
+        for row in rows:
+            depth = len(row["stack"]) - 1
+            share = row["total"] / grand_total
+            label = "  " * depth + row["stack"][-1]
+            print(f"{label:<40}{row['count']:>7}{row['total'] * 1000:>12.1f}"
+                  f"{row['total'] / row['count'] * 1000:>10.2f}{row['self'] * 1000:>11.1f}"
+                  f"  {'█' * max(1, round(share * bar_width))} {share * 100:.1f}%")
+
+        print("\nSelf time theo span:")
+        for name, seconds in self.self_time_by_name().items():
+            print(f"  {name:<38}{seconds * 1000:>12.1f}ms {seconds / grand_total * 100:>6.1f}%")
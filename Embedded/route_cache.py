@@ -0,0 +1,230 @@
+"""
+Route Cache - Cache lộ trình OSRM trên RAM và trên đĩa (SQLite)
+
+- Key là tọa độ điểm đầu/điểm cuối đã làm tròn theo `precision` chữ số thập phân
+  (5 chữ số ~ 1.1m), nên các cặp địa điểm lặp lại (HANOI_LOCATIONS, DEMO_LOCATIONS)
+  chỉ gọi OSRM một lần; key kèm cả số điểm tối đa của lộ trình (`max_points`),
+  để lộ trình gốc và lộ trình đã đơn giản hóa không lẫn vào nhau
+- LRU trong RAM phía trước, SQLite phía sau để cache còn giữ được giữa các lần chạy
+- Hết hạn theo TTL và giới hạn số entry trên đĩa (xóa entry ít dùng nhất)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    ".osrm_route_cache.sqlite3",
+)
+
+
+@dataclass
+class RouteResult:
+    """Lộ trình OSRM kèm tổng quãng đường và thời gian di chuyển"""
+    points: List[Tuple[float, float]]  # (lat, lng)
+    distance: float  # mét
+    duration: float  # giây
+
+
+class RouteCache:
+    """Cache lộ trình 2 tầng: LRU trong RAM + SQLite trên đĩa (an toàn đa luồng)"""
+
+    def __init__(self,
+                 path: Optional[str] = DEFAULT_CACHE_PATH,
+                 precision: int = 5,
+                 ttl_seconds: Optional[float] = 7 * 24 * 3600,
+                 max_entries: int = 10000,
+                 memory_entries: int = 256):
+        """
+        Args:
+            path: File SQLite (None = chỉ cache trong RAM)
+            precision: Số chữ số thập phân khi làm tròn tọa độ để tạo key
+            ttl_seconds: Thời gian sống của một entry (None = không hết hạn)
+            max_entries: Số entry tối đa trên đĩa
+            memory_entries: Số entry tối đa của LRU trong RAM
+        """
+        self.path = path
+        self.precision = precision
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+
+        self._memory: "OrderedDict[str, Tuple[float, RouteResult]]" = OrderedDict()
+        # Lần truy cập trúng RAM chưa ghi xuống đĩa: key -> accessed_at
+        # (ghi theo lô trước khi evict để entry hay dùng không bị coi là cũ)
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS routes ("
+                " key TEXT PRIMARY KEY,"
+                " points TEXT NOT NULL,"
+                " distance REAL NOT NULL,"
+                " duration REAL NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS routes_accessed_at ON routes (accessed_at)"
+            )
+            self._db.commit()
+
+    def key(self, origin_lat: float, origin_lng: float,
+            dest_lat: float, dest_lng: float,
+            max_points: Optional[int] = None) -> str:
+        """
+        Key của cặp điểm đầu -> điểm cuối sau khi làm tròn tọa độ
+
+        Args:
+            max_points: Số điểm tối đa của lộ trình được lưu (None = lộ trình gốc)
+        """
+        p = self.precision
+        variant = "full" if max_points is None else str(max_points)
+        return (f"{origin_lat:.{p}f},{origin_lng:.{p}f};"
+                f"{dest_lat:.{p}f},{dest_lng:.{p}f}@{variant}")
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, origin_lat: float, origin_lng: float,
+            dest_lat: float, dest_lng: float,
+            max_points: Optional[int] = None) -> Optional[RouteResult]:
+        """
+        Tìm lộ trình trong cache
+
+        Args:
+            max_points: Số điểm tối đa của lộ trình (None = lộ trình gốc), xem key()
+
+        Returns:
+            RouteResult hoặc None nếu không có (hoặc đã hết hạn)
+        """
+        key = self.key(origin_lat, origin_lng, dest_lat, dest_lng, max_points)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, result = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    if self._db is not None:
+                        self._touched[key] = now
+                        if len(self._touched) >= self.memory_entries:
+                            self._flush_touched()
+                            self._db.commit()
+                    return result
+                del self._memory[key]
+
+            if self._db is None:
+                return None
+
+            row = self._db.execute(
+                "SELECT points, distance, duration, created_at FROM routes WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            points_json, distance, duration, created_at = row
+            if self._expired(created_at, now):
+                self._db.execute("DELETE FROM routes WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+
+            self._touched[key] = now
+            self._flush_touched()
+            self._db.commit()
+
+            result = RouteResult(
+                points=[(lat, lng) for lat, lng in json.loads(points_json)],
+                distance=distance,
+                duration=duration,
+            )
+            self._remember(key, created_at, result)
+            return result
+
+    def put(self, origin_lat: float, origin_lng: float,
+            dest_lat: float, dest_lng: float, result: RouteResult,
+            max_points: Optional[int] = None) -> None:
+        """Lưu lộ trình vào cache (RAM + đĩa) dưới key ứng với max_points"""
+        key = self.key(origin_lat, origin_lng, dest_lat, dest_lng, max_points)
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, now, result)
+
+            if self._db is None:
+                return
+
+            self._db.execute(
+                "INSERT OR REPLACE INTO routes"
+                " (key, points, distance, duration, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(result.points, separators=(",", ":")),
+                 result.distance, result.duration, now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def clear(self) -> None:
+        """Xóa toàn bộ cache"""
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM routes")
+                self._db.commit()
+
+    def close(self) -> None:
+        """Đóng kết nối SQLite"""
+        with self._lock:
+            if self._db is not None:
+                self._flush_touched()
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key: str, created_at: float, result: RouteResult) -> None:
+        self._memory[key] = (created_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self) -> None:
+        """Ghi accessed_at của các lần trúng RAM xuống đĩa (chưa commit)"""
+        if not self._touched:
+            return
+        self._db.executemany(
+            "UPDATE routes SET accessed_at = ? WHERE key = ?",
+            [(accessed_at, key) for key, accessed_at in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def _evict(self) -> None:
+        """Xóa entry hết hạn và entry ít dùng nhất khi vượt quá max_entries"""
+        self._flush_touched()
+        if self.ttl_seconds is not None:
+            self._db.execute(
+                "DELETE FROM routes WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,),
+            )
+
+        (count,) = self._db.execute("SELECT COUNT(*) FROM routes").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM routes WHERE key IN"
+                " (SELECT key FROM routes ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
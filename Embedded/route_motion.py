@@ -0,0 +1,217 @@
+"""
+Route Motion - Mô phỏng robot di chuyển dọc theo lộ trình của đơn hàng
+
+Chạy: python Embedded/route_motion.py <order_id> [speed_mps]
+
+Thay cho random walk của generate_next_location: robot đi theo routePoints
+với tốc độ theo SpeedProfile (tăng tốc, tốc độ hành trình, giảm tốc khi gần
+điểm đích). Quãng đường tích lũy của lộ trình được tính trước một lần, vị trí
+tại mỗi bước được tìm bằng binary search (bisect) nên mỗi bước không phụ thuộc
+độ dài lộ trình.
+
+    motion = RouteMotion.from_order(order)
+    while not motion.finished:
+        lat, lng = motion.advance(1.0)
+"""
+
+import sys
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from firebase_sample import DEFAULT_DATABASE_URL, FirebaseClient, Order
+from geo_utils import bearing, polyline_cumulative_length
+from telemetry import TelemetryPublisher
+
+
+@dataclass
+class SpeedProfile:
+    """Tốc độ của robot theo quãng đường còn lại"""
+    cruise_speed_mps: float = 1.5  # tốc độ hành trình
+    acceleration_mps2: Optional[float] = 0.5  # None = đổi tốc độ tức thời
+    approach_distance_meters: float = 20.0  # bắt đầu giảm tốc khi còn cách đích
+    approach_speed_mps: float = 0.5  # tốc độ khi gần đích
+
+    def target_speed(self, remaining_meters: float) -> float:
+        """Tốc độ mong muốn khi còn remaining_meters tới điểm đích"""
+        if remaining_meters <= self.approach_distance_meters:
+            return min(self.cruise_speed_mps, self.approach_speed_mps)
+        return self.cruise_speed_mps
+
+    def next_speed(self, current_speed: float, remaining_meters: float, dt: float) -> float:
+        """Tốc độ sau dt giây, giới hạn bởi gia tốc"""
+        target = self.target_speed(remaining_meters)
+        if self.acceleration_mps2 is None:
+            return target
+        max_change = self.acceleration_mps2 * dt
+        if current_speed < target:
+            return min(target, current_speed + max_change)
+        return max(target, current_speed - max_change)
+
+
+class RouteMotion:
+    """Vị trí của robot dọc theo lộ trình theo thời gian"""
+
+    def __init__(self, points: Sequence[Tuple[float, float]],
+                 profile: Optional[SpeedProfile] = None):
+        """
+        Args:
+            points: List of (lat, lng) của lộ trình (ít nhất 1 điểm)
+            profile: SpeedProfile (mặc định SpeedProfile())
+        """
+        if len(points) == 0:
+            raise ValueError("Lộ trình phải có ít nhất 1 điểm")
+
+        self.lats: List[float] = [float(lat) for lat, _ in points]
+        self.lngs: List[float] = [float(lng) for _, lng in points]
+        self.profile = profile or SpeedProfile()
+
+        # Tính một lần: cumulative[i] = quãng đường từ điểm đầu tới điểm i
+        self.cumulative: List[float] = polyline_cumulative_length(
+            list(zip(self.lats, self.lngs))
+        ).tolist()
+        self.total_length = self.cumulative[-1]
+
+        self.distance = 0.0
+        self.speed = 0.0
+        self._segment = 0
+
+    @classmethod
+    def from_order(cls, order: Order, profile: Optional[SpeedProfile] = None) -> 'RouteMotion':
+        """Tạo từ routePoints của đơn hàng (lộ trình trống => đứng tại điểm đích)"""
+        points = order.routePoints.coords()
+        if not points:
+            points = [(order.destinationLat, order.destinationLng)]
+        return cls(points, profile)
+
+    @property
+    def remaining(self) -> float:
+        """Quãng đường còn lại (mét)"""
+        return self.total_length - self.distance
+
+    @property
+    def finished(self) -> bool:
+        return self.distance >= self.total_length
+
+    def _find_segment(self, distance: float) -> int:
+        """Index i của đoạn [i, i+1] chứa vị trí distance"""
+        cumulative = self.cumulative
+        last = len(cumulative) - 2
+        if last < 0:
+            return 0
+
+        # Robot chỉ đi tới nên thường vẫn ở đoạn cũ hoặc đoạn kế tiếp
+        i = self._segment
+        if cumulative[i] <= distance and (i == last or distance < cumulative[i + 1]):
+            return i
+        if i < last and cumulative[i + 1] <= distance and (i + 1 == last or distance < cumulative[i + 2]):
+            return i + 1
+        return min(max(bisect_right(cumulative, distance) - 1, 0), last)
+
+    def position_at(self, distance: float) -> Tuple[float, float]:
+        """
+        Tọa độ tại quãng đường `distance` (mét) tính từ điểm đầu
+
+        Returns:
+            Tuple (lat, lng), nội suy tuyến tính trong đoạn chứa distance
+        """
+        if len(self.cumulative) == 1:
+            return self.lats[0], self.lngs[0]
+
+        distance = min(max(distance, 0.0), self.total_length)
+        i = self._find_segment(distance)
+        self._segment = i
+
+        start = self.cumulative[i]
+        length = self.cumulative[i + 1] - start
+        t = (distance - start) / length if length > 0 else 0.0
+        return (self.lats[i] + t * (self.lats[i + 1] - self.lats[i]),
+                self.lngs[i] + t * (self.lngs[i + 1] - self.lngs[i]))
+
+    def heading(self) -> float:
+        """Hướng của đoạn lộ trình hiện tại (độ, 0 = Bắc)"""
+        i = self._segment
+        if i + 1 >= len(self.lats):
+            return 0.0
+        return float(bearing(self.lats[i], self.lngs[i], self.lats[i + 1], self.lngs[i + 1]))
+
+    def advance(self, dt: float) -> Tuple[float, float]:
+        """
+        Đi tiếp dt giây theo SpeedProfile
+
+        Returns:
+            Tuple (lat, lng) sau khi di chuyển
+        """
+        if not self.finished and dt > 0:
+            new_speed = self.profile.next_speed(self.speed, self.remaining, dt)
+            # Quãng đường theo tốc độ trung bình trong dt (gia tốc đều)
+            self.distance = min(self.total_length,
+                                self.distance + 0.5 * (self.speed + new_speed) * dt)
+            self.speed = 0.0 if self.finished else new_speed
+        return self.position_at(self.distance)
+
+
+def run_route_following_update(firebase_client: FirebaseClient,
+                               order: Order,
+                               interval_seconds: float = 1.0,
+                               profile: Optional[SpeedProfile] = None,
+                               publisher: Optional[TelemetryPublisher] = None) -> None:
+    """
+    Cho robot đi theo lộ trình của đơn hàng và đẩy vị trí lên Firebase
+
+    Args:
+        firebase_client: FirebaseClient instance
+        order: Đơn hàng cần giao (dùng routePoints)
+        interval_seconds: Thời gian giữa 2 bước mô phỏng (giây)
+        profile: SpeedProfile (mặc định SpeedProfile())
+        publisher: TelemetryPublisher (optional), nếu có thì chỉ đẩy theo
+                   dead-band của publisher
+    """
+    motion = RouteMotion.from_order(order, profile)
+    print(f"=== Robot đi theo lộ trình đơn {order.id} "
+          f"({len(motion.cumulative)} điểm, {motion.total_length:.0f}m) ===")
+    print("Nhấn Ctrl+C để dừng\n")
+
+    if publisher is not None:
+        publisher.set_destination(order.destinationLat, order.destinationLng)
+
+    try:
+        lat, lng = motion.position_at(0.0)
+        while True:
+            if publisher is not None:
+                # Vị trí tới đích luôn được đẩy, kể cả khi trong dead-band
+                publisher.offer(lat, lng, force=motion.finished)
+            else:
+                firebase_client.update_robot_location(lat, lng)
+            print(f"  {motion.distance:7.1f}/{motion.total_length:.0f}m "
+                  f"v={motion.speed:.2f}m/s: lat={lat:.6f}, lon={lng:.6f}")
+
+            if motion.finished:
+                print("\n✓ Robot đã tới điểm đích")
+                break
+
+            time.sleep(interval_seconds)
+            lat, lng = motion.advance(interval_seconds)
+    except KeyboardInterrupt:
+        print(f"\n\nĐã dừng tại {motion.distance:.1f}m / {motion.total_length:.0f}m")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Sử dụng: python route_motion.py <order_id> [speed_mps]")
+        sys.exit(1)
+
+    firebase = FirebaseClient(DEFAULT_DATABASE_URL)
+    order = firebase.get_order(sys.argv[1])
+    if order is None:
+        print(f"✗ Không tìm thấy đơn hàng {sys.argv[1]}")
+        sys.exit(1)
+
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 1.5
+    run_route_following_update(
+        firebase,
+        order,
+        profile=SpeedProfile(cruise_speed_mps=speed),
+        publisher=TelemetryPublisher(firebase),
+    )
@@ -3,21 +3,32 @@ Script để chạy định kỳ đẩy tọa độ robot lên Firebase
 Chạy: python Embedded/run_periodic_update.py
 """
 
-from firebase_sample import FirebaseClient, run_periodic_location_update
+from firebase_sample import DEFAULT_DATABASE_URL, FirebaseClient, run_periodic_location_update
+from telemetry import TelemetryPublisher
+from telemetry_queue import TelemetryQueue
 
 if __name__ == "__main__":
     # Khởi tạo Firebase Client
-    firebase = FirebaseClient("https://robot-delivery-cbdcf-default-rtdb.firebaseio.com")
+    firebase = FirebaseClient(DEFAULT_DATABASE_URL)
+    
+    # Ghi vị trí qua hàng đợi write-behind: không chặn vòng lặp, mất mạng thì giữ
+    # trong Embedded/.telemetry_queue.sqlite3 và gửi bù theo lô khi có mạng lại
+    queue = TelemetryQueue(firebase)
     
     # Chạy định kỳ đẩy tọa độ robot lên Firebase
-    # - interval_seconds=10: Cập nhật mỗi 10 giây
-    # - max_distance_meters=200.0: Khoảng cách tối đa giữa các điểm là 200 mét
+    # - interval_seconds=10: Lấy mẫu tối đa mỗi 10 giây
+    # - max_distance_meters=200.0: Robot đi tối đa 200 mét trong 10 giây
     # - initial_lat, initial_lon: Có thể chỉ định vị trí ban đầu (None = lấy từ Firebase)
+    # - publisher: Chỉ đẩy khi robot di chuyển/đổi hướng đủ nhiều (dead-band);
+    #   khi đứng yên giãn chu kỳ lấy mẫu ra 15s, nhưng không bao giờ nhanh hơn 10s
+    #   (None = đẩy mọi lần)
     run_periodic_location_update(
         firebase_client=firebase,
         interval_seconds=10,
         max_distance_meters=200.0,
         initial_lat=None,  # None = lấy từ Firebase, hoặc chỉ định ví dụ: 21.0285
-        initial_lon=None  # None = lấy từ Firebase, hoặc chỉ định ví dụ: 105.8542
+        initial_lon=None,  # None = lấy từ Firebase, hoặc chỉ định ví dụ: 105.8542
+        publisher=TelemetryPublisher(queue, max_staleness_seconds=60.0),
+        write_queue=queue,
     )
 
@@ -0,0 +1,192 @@
+"""
+Telemetry - Đẩy vị trí robot lên Firebase có chọn lọc
+
+TelemetryPublisher đứng trước FirebaseClient.update_robot_location:
+- Dead-band: chỉ PUT khi robot đã đi đủ xa hoặc đổi hướng đủ nhiều so với
+  vị trí đã đẩy gần nhất (bỏ qua rung GPS khi đứng yên)
+- Heartbeat: vẫn PUT nếu vị trí đã cũ quá max_staleness_seconds, để app Mobile
+  phân biệt robot đứng yên với robot mất kết nối
+- Chu kỳ lấy mẫu thích ứng (next_interval): nhanh khi đang chạy hoặc gần
+  điểm đích, chậm khi đứng yên
+
+    publisher = TelemetryPublisher(firebase)
+    while True:
+        lat, lon = read_gps()
+        publisher.offer(lat, lon)
+        time.sleep(publisher.next_interval())
+"""
+
+import math
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from firebase_sample import FirebaseClient, calculate_distance
+from geo_utils import bearing
+
+
+def _heading_difference(a: float, b: float) -> float:
+    """Độ lệch nhỏ nhất giữa 2 hướng (độ, trong [0, 180])"""
+    diff = abs(a - b) % 360.0
+    return 360.0 - diff if diff > 180.0 else diff
+
+
+class TelemetryPublisher:
+    """Quyết định khi nào cần đẩy vị trí robot và với chu kỳ lấy mẫu bao nhiêu"""
+
+    def __init__(self,
+                 firebase: FirebaseClient,
+                 min_distance_meters: float = 5.0,
+                 min_heading_change_degrees: float = 25.0,
+                 max_staleness_seconds: float = 60.0,
+                 moving_interval_seconds: float = 2.0,
+                 idle_interval_seconds: float = 15.0,
+                 near_destination_interval_seconds: float = 1.0,
+                 near_destination_meters: float = 100.0,
+                 moving_speed_mps: float = 0.5,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            firebase: FirebaseClient dùng để PUT `robot` (hoặc TelemetryQueue
+                      để ghi không chặn qua hàng đợi write-behind)
+            min_distance_meters: Quãng đường tối thiểu kể từ lần đẩy trước
+            min_heading_change_degrees: Độ đổi hướng tối thiểu (so với hướng lúc đẩy trước)
+            max_staleness_seconds: Khoảng tối đa giữa 2 lần đẩy (heartbeat)
+            moving_interval_seconds: Chu kỳ lấy mẫu khi robot đang di chuyển
+            idle_interval_seconds: Chu kỳ lấy mẫu khi robot đứng yên
+            near_destination_interval_seconds: Chu kỳ lấy mẫu khi gần điểm đích
+            near_destination_meters: Bán kính được coi là "gần điểm đích"
+            moving_speed_mps: Tốc độ (m/s) từ đó trở lên được coi là đang di chuyển
+            clock: Hàm lấy thời gian (giây), đổi được khi mô phỏng
+        """
+        self.firebase = firebase
+        self.min_distance_meters = min_distance_meters
+        self.min_heading_change_degrees = min_heading_change_degrees
+        self.max_staleness_seconds = max_staleness_seconds
+        self.moving_interval_seconds = moving_interval_seconds
+        self.idle_interval_seconds = idle_interval_seconds
+        self.near_destination_interval_seconds = near_destination_interval_seconds
+        self.near_destination_meters = near_destination_meters
+        self.moving_speed_mps = moving_speed_mps
+        self.clock = clock
+
+        self.destination: Optional[Tuple[float, float]] = None
+
+        # Vị trí/hướng/thời điểm của lần đẩy thành công gần nhất
+        self._published: Optional[Tuple[float, float]] = None
+        self._published_heading: Optional[float] = None
+        self._published_at: Optional[float] = None
+
+        # Mẫu gần nhất (đẩy hoặc không) để ước lượng tốc độ
+        self._last_sample: Optional[Tuple[float, float, float]] = None
+        self.speed_mps = 0.0
+
+        self.samples = 0
+        self.published = 0
+        self.failed = 0
+
+    def set_destination(self, lat: Optional[float], lng: Optional[float]) -> None:
+        """Đặt điểm đích hiện tại (None = không có đơn đang giao)"""
+        self.destination = None if lat is None or lng is None else (lat, lng)
+
+    def publish_reason(self, lat: float, lon: float,
+                       now: Optional[float] = None) -> Optional[str]:
+        """
+        Lý do cần đẩy vị trí này lên Firebase
+
+        Returns:
+            "first", "distance", "heading", "heartbeat" hoặc None nếu có thể bỏ qua
+        """
+        if self._published is None:
+            return "first"
+
+        now = self.clock() if now is None else now
+        moved = calculate_distance(self._published[0], self._published[1], lat, lon)
+        if moved >= self.min_distance_meters:
+            return "distance"
+
+        # Hướng chỉ có nghĩa khi đã đi được một đoạn, tránh nhiễu GPS tại chỗ
+        if (self._published_heading is not None
+                and moved >= self.min_distance_meters / 2):
+            heading = float(bearing(self._published[0], self._published[1], lat, lon))
+            if _heading_difference(heading, self._published_heading) >= self.min_heading_change_degrees:
+                return "heading"
+
+        if now - self._published_at >= self.max_staleness_seconds:
+            return "heartbeat"
+        return None
+
+    def offer(self, lat: float, lon: float, now: Optional[float] = None,
+              force: bool = False) -> bool:
+        """
+        Đưa vào một mẫu vị trí mới, đẩy lên Firebase nếu vượt dead-band
+
+        Args:
+            force: Luôn đẩy, bỏ qua dead-band (ví dụ vị trí lúc tới điểm đích)
+
+        Returns:
+            True nếu đã đẩy thành công, False nếu bỏ qua hoặc lỗi
+        """
+        now = self.clock() if now is None else now
+        self.samples += 1
+
+        if self._last_sample is not None:
+            last_lat, last_lon, last_time = self._last_sample
+            elapsed = now - last_time
+            if elapsed > 0:
+                self.speed_mps = calculate_distance(last_lat, last_lon, lat, lon) / elapsed
+        self._last_sample = (lat, lon, now)
+
+        reason = self.publish_reason(lat, lon, now)
+        if reason is None and force:
+            reason = "forced"
+        if reason is None:
+            return False
+
+        if not self.firebase.update_robot_location(lat, lon):
+            self.failed += 1
+            return False
+
+        if self._published is not None and reason != "heartbeat":
+            self._published_heading = float(
+                bearing(self._published[0], self._published[1], lat, lon)
+            )
+        self._published = (lat, lon)
+        self._published_at = now
+        self.published += 1
+        return True
+
+    def next_interval(self, now: Optional[float] = None) -> float:
+        """
+        Chu kỳ lấy mẫu tiếp theo (giây) theo trạng thái robot,
+        không vượt quá thời điểm cần gửi heartbeat
+        """
+        if self.destination is not None and self._last_sample is not None:
+            to_destination = calculate_distance(
+                self._last_sample[0], self._last_sample[1], *self.destination
+            )
+        else:
+            to_destination = math.inf
+
+        if to_destination <= self.near_destination_meters:
+            interval = self.near_destination_interval_seconds
+        elif self.speed_mps >= self.moving_speed_mps:
+            interval = self.moving_interval_seconds
+        else:
+            interval = self.idle_interval_seconds
+
+        if self._published_at is not None:
+            now = self.clock() if now is None else now
+            until_heartbeat = self.max_staleness_seconds - (now - self._published_at)
+            interval = min(interval, max(0.0, until_heartbeat))
+        return interval
+
+    def stats(self) -> Dict[str, float]:
+        """Số mẫu, số lần đẩy và tỉ lệ mẫu được bỏ qua"""
+        suppressed = self.samples - self.published - self.failed
+        return {
+            "samples": self.samples,
+            "published": self.published,
+            "failed": self.failed,
+            "suppressed": suppressed,
+            "suppression_rate": suppressed / self.samples if self.samples else 0.0,
+        }
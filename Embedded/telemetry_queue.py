@@ -0,0 +1,336 @@
+"""
+Telemetry Queue - Hàng đợi ghi sau (write-behind) cho vị trí robot, lưu tạm trên đĩa
+
+Vòng lặp điều khiển chỉ gọi update_robot_location()/enqueue() (không chờ mạng),
+một thread nền ghi lên Firebase:
+- Vị trí mới thay thế vị trí chưa kịp gửi của cùng đường dẫn (chỉ gửi bản mới nhất)
+- Mọi thay đổi được giữ trong SQLite cho tới khi Firebase xác nhận, nên mất mạng
+  hoặc khởi động lại process không làm mất dữ liệu
+- Khi có mạng lại, dồn nhiều entry vào một multi-path PATCH, lỗi thì thử lại
+  với backoff tăng dần
+- Tùy chọn `track_path`: thêm mỗi vị trí vào lịch sử hành trình
+  (`{track_path}/{push_id}`) để giữ đủ track khi mạng chập chờn
+
+    queue = TelemetryQueue(firebase, track_path="robotTrack")
+    publisher = TelemetryPublisher(queue)  # dùng thay cho FirebaseClient
+    ...
+    queue.close()  # gửi nốt phần còn lại
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from firebase_sample import FirebaseClient, generate_push_id
+
+
+DEFAULT_QUEUE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    ".telemetry_queue.sqlite3",
+)
+
+
+class TelemetryQueue:
+    """Write-behind queue: nhận ghi không chặn, gửi lên Firebase theo lô trên thread nền"""
+
+    def __init__(self,
+                 firebase: FirebaseClient,
+                 path: Optional[str] = DEFAULT_QUEUE_PATH,
+                 robot_path: str = "robot",
+                 track_path: Optional[str] = None,
+                 flush_interval_seconds: float = 1.0,
+                 max_batch: int = 500,
+                 retry_initial_seconds: float = 1.0,
+                 retry_max_seconds: float = 60.0,
+                 max_pending: int = 100000,
+                 clock: Callable[[], float] = time.monotonic,
+                 autostart: bool = True):
+        """
+        Args:
+            firebase: FirebaseClient dùng để gửi multi-path PATCH
+            path: File SQLite lưu các entry chưa gửi (None = chỉ giữ trong RAM)
+            robot_path: Đường dẫn vị trí hiện tại của robot
+            track_path: Đường dẫn lịch sử hành trình (None = không lưu lịch sử)
+            flush_interval_seconds: Chu kỳ gửi khi mạng bình thường
+            max_batch: Số entry tối đa trong một PATCH
+            retry_initial_seconds: Thời gian chờ sau lần gửi lỗi đầu tiên
+            retry_max_seconds: Thời gian chờ tối đa giữa 2 lần thử lại
+            max_pending: Số entry tối đa chờ gửi; vượt quá thì bỏ entry cũ nhất
+            clock: Hàm lấy thời gian (giây), đổi được khi mô phỏng
+            autostart: Tự chạy thread nền (False = gọi start() sau)
+        """
+        self.firebase = firebase
+        self.path = path
+        self.robot_path = robot_path
+        self.track_path = track_path
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_batch = max_batch
+        self.retry_initial_seconds = retry_initial_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.max_pending = max_pending
+        self._clock = clock
+
+        # Entry mới từ producer, chưa ghi xuống SQLite: path -> (seq, json)
+        self._incoming: Dict[str, tuple] = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._idle = threading.Condition(self._lock)
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Chỉ thread nền đụng tới SQLite
+        self._db: Optional[sqlite3.Connection] = None
+        self._stored = 0
+        self._retry_delay = 0.0
+        self._next_attempt = 0.0
+
+        # Thống kê
+        self.enqueued = 0
+        self.superseded = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+
+        if autostart:
+            self.start()
+
+    # ==================== PRODUCER ====================
+
+    def enqueue(self, path: str, value: Any) -> None:
+        """
+        Đưa một lần ghi vào hàng đợi (không chặn, không chờ mạng)
+
+        Args:
+            path: Đường dẫn trong database, ví dụ "robot"
+            value: Giá trị JSON sẽ ghi vào đường dẫn đó (None = xóa)
+        """
+        payload = json.dumps(value)
+        with self._lock:
+            self._seq += 1
+            if path in self._incoming:
+                self.superseded += 1
+            self._incoming[path] = (self._seq, payload)
+            self.enqueued += 1
+            if len(self._incoming) >= self.max_batch:
+                self._wakeup.set()
+
+    def update_robot_location(self, lat: float, lon: float) -> bool:
+        """
+        Cùng chữ ký với FirebaseClient.update_robot_location nên dùng được
+        thay cho FirebaseClient (ví dụ trong TelemetryPublisher)
+
+        Returns:
+            Luôn True: vị trí đã được nhận vào hàng đợi
+        """
+        self.enqueue(self.robot_path, {"lat": lat, "lon": lon})
+        if self.track_path:
+            # Push ID tăng theo thời gian nên lịch sử giữ đúng thứ tự
+            self.enqueue(f"{self.track_path}/{generate_push_id()}",
+                         {"lat": lat, "lon": lon, "timestamp": int(time.time() * 1000)})
+        return True
+
+    # ==================== BACKGROUND WRITER ====================
+
+    def start(self) -> None:
+        """Chạy thread nền (gửi luôn các entry còn lại từ lần chạy trước)"""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, name="telemetry-queue", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Dừng thread nền sau khi thử gửi nốt các entry còn lại"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def __enter__(self) -> 'TelemetryQueue':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Yêu cầu gửi ngay và chờ tới khi hàng đợi trống
+
+        Returns:
+            True nếu mọi entry đã được gửi trước khi hết timeout
+        """
+        deadline = time.monotonic() + timeout
+        # Chờ thread nền đọc xong các entry còn lại từ lần chạy trước
+        if not self._ready.wait(timeout):
+            return False
+        with self._idle:
+            self._next_attempt = 0.0
+            self._wakeup.set()
+            while self._incoming or self._stored:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._thread is None:
+                    return False
+                self._idle.wait(min(remaining, 0.1))
+                self._wakeup.set()
+            return True
+
+    def _open_db(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path or ":memory:")
+        if self.path:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            " path TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " seq INTEGER NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS pending_seq ON pending (seq)")
+        db.commit()
+        return db
+
+    def _run(self) -> None:
+        self._db = self._open_db()
+        try:
+            stored, max_seq = self._db.execute(
+                "SELECT COUNT(*), COALESCE(MAX(seq), 0) FROM pending").fetchone()
+            with self._lock:
+                self._stored += stored
+                # seq tiếp tục sau entry cũ để entry mới luôn đứng sau
+                self._seq += max_seq
+                self._incoming = {path: (seq + max_seq, payload)
+                                  for path, (seq, payload) in self._incoming.items()}
+            self._ready.set()
+            if stored:
+                print(f"Telemetry queue: còn {stored} entry chưa gửi từ lần chạy trước")
+
+            while True:
+                stopping = self._stopping.is_set()
+                self._persist_incoming()
+                if stopping or self._clock() >= self._next_attempt:
+                    self._flush_stored()
+                if stopping:
+                    break
+
+                wait = self.flush_interval_seconds
+                if self._retry_delay:
+                    wait = max(0.0, self._next_attempt - self._clock())
+                self._wakeup.wait(wait)
+                self._wakeup.clear()
+        finally:
+            self._db.close()
+            self._db = None
+            with self._idle:
+                self._idle.notify_all()
+
+    def _persist_incoming(self) -> None:
+        """Chuyển entry mới từ RAM xuống SQLite (một transaction)"""
+        with self._lock:
+            incoming, self._incoming = self._incoming, {}
+            # Tính luôn là đang chờ gửi để flush()/pending không thấy hàng đợi trống giữa chừng
+            self._stored += len(incoming)
+        if not incoming:
+            return
+
+        db = self._db
+        with db:
+            # Entry cùng đường dẫn đang chờ gửi sẽ bị thay bằng bản mới
+            existing = 0
+            for path in incoming:
+                if db.execute("SELECT 1 FROM pending WHERE path = ?", (path,)).fetchone():
+                    existing += 1
+            db.executemany(
+                "INSERT OR REPLACE INTO pending (path, value, seq) VALUES (?, ?, ?)",
+                [(path, payload, seq) for path, (seq, payload) in incoming.items()],
+            )
+            with self._lock:
+                overflow = max(0, self._stored - existing - self.max_pending)
+            if overflow:
+                db.execute(
+                    "DELETE FROM pending WHERE path IN "
+                    "(SELECT path FROM pending ORDER BY seq LIMIT ?)",
+                    (overflow,),
+                )
+
+        with self._idle:
+            self.superseded += existing
+            self.dropped += overflow
+            self._stored -= existing + overflow
+
+    def _flush_stored(self) -> None:
+        """Gửi các entry trong SQLite theo lô cho tới khi hết hoặc gặp lỗi"""
+        db = self._db
+        while True:
+            rows = db.execute(
+                "SELECT path, value, seq FROM pending ORDER BY seq LIMIT ?",
+                (self.max_batch,),
+            ).fetchall()
+            if not rows:
+                self._retry_delay = 0.0
+                with self._idle:
+                    self._idle.notify_all()
+                return
+
+            updates = {path: json.loads(value) for path, value, _ in rows}
+            if not self.firebase.multi_path_update(updates):
+                self.failed_flushes += 1
+                self._retry_delay = min(
+                    self.retry_max_seconds,
+                    self._retry_delay * 2 if self._retry_delay else self.retry_initial_seconds,
+                )
+                self._next_attempt = self._clock() + self._retry_delay
+                print(f"Telemetry queue: gửi lỗi, giữ {self._stored} entry, "
+                      f"thử lại sau {self._retry_delay:.1f}s")
+                return
+
+            # Chỉ xóa entry chưa bị thay bằng bản mới hơn trong lúc đang gửi
+            with db:
+                deleted = db.executemany(
+                    "DELETE FROM pending WHERE path = ? AND seq = ?",
+                    [(path, seq) for path, _, seq in rows],
+                ).rowcount
+
+            if self._retry_delay:
+                print(f"Telemetry queue: đã kết nối lại, gửi {len(rows)} entry")
+            self._retry_delay = 0.0
+            self._next_attempt = 0.0
+            with self._idle:
+                self._stored -= deleted
+                self.flushed += len(rows)
+                self.batches += 1
+                self._idle.notify_all()
+
+            # Có entry mới trong lúc gửi => đưa xuống SQLite để gửi chung lô sau
+            self._persist_incoming()
+
+    # ==================== STATS ====================
+
+    @property
+    def pending(self) -> int:
+        """Số entry chưa được Firebase xác nhận"""
+        with self._lock:
+            return len(self._incoming) + self._stored
+
+    def stats(self) -> Dict[str, float]:
+        """Số entry đã nhận, bị thay thế, đã gửi, đang chờ và số lần gửi lỗi"""
+        with self._lock:
+            pending = len(self._incoming) + self._stored
+        return {
+            "enqueued": self.enqueued,
+            "superseded": self.superseded,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+            "pending": pending,
+        }
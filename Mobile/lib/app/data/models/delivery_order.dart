@@ -1,3 +1,5 @@
+import 'dart:math' as math;
+
 class DeliveryOrder {
   final String? id;
   final String receiverName;
@@ -36,6 +38,9 @@ class DeliveryOrder {
       'destinationLat': destinationLat,
       'destinationLng': destinationLng,
       'routePoints': routePoints?.map((point) => point.toJson()).toList(),
+      // App luôn ghi list routePoints => xóa routePolyline cũ (nếu có) để
+      // reader không đọc lại lộ trình dạng gọn đã lỗi thời
+      'routePolyline': null,
       'status': status,
       'createdAt': createdAt.toIso8601String(),
     };
@@ -51,11 +56,13 @@ class DeliveryOrder {
       weight: (json['weight'] ?? 0).toDouble(),
       destinationLat: (json['destinationLat'] ?? 0).toDouble(),
       destinationLng: (json['destinationLng'] ?? 0).toDouble(),
-      routePoints: json['routePoints'] != null
-          ? (json['routePoints'] as List)
-              .map((point) => RoutePoint.fromJson(point))
-              .toList()
-          : null,
+      routePoints: json['routePolyline'] != null
+          ? RoutePoint.decodePolyline(json['routePolyline'])
+          : json['routePoints'] != null
+              ? (json['routePoints'] as List)
+                  .map((point) => RoutePoint.fromJson(point))
+                  .toList()
+              : null,
       status: json['status'] ?? 'pending',
       createdAt: json['createdAt'] != null
           ? DateTime.parse(json['createdAt'])
@@ -118,4 +125,36 @@ class RoutePoint {
       order: json['order'] ?? 0,
     );
   }
+
+  /// Giải mã lộ trình dạng Google encoded polyline (trường `routePolyline`
+  /// do các tool Embedded ghi khi bật chế độ route gọn)
+  static List<RoutePoint> decodePolyline(String encoded, {int precision = 5}) {
+    final factor = math.pow(10, precision).toDouble();
+    final points = <RoutePoint>[];
+    int index = 0;
+    int lat = 0;
+    int lng = 0;
+
+    while (index < encoded.length) {
+      for (var coord = 0; coord < 2; coord++) {
+        int result = 0;
+        int shift = 0;
+        int b;
+        do {
+          b = encoded.codeUnitAt(index++) - 63;
+          result |= (b & 0x1f) << shift;
+          shift += 5;
+        } while (b >= 0x20);
+        final delta = (result & 1) != 0 ? ~(result >> 1) : (result >> 1);
+        if (coord == 0) {
+          lat += delta;
+        } else {
+          lng += delta;
+        }
+      }
+      points.add(RoutePoint(lat: lat / factor, lng: lng / factor, order: points.length));
+    }
+
+    return points;
+  }
 }
@@ -117,9 +117,11 @@ class FirebaseService extends GetxService {
   // Save route points for an order
   Future<bool> saveRoutePoints(String orderId, List<RoutePoint> points) async {
     try {
-      await _database.child('orders/$orderId/routePoints').set(
-        points.map((point) => point.toJson()).toList(),
-      );
+      // Xóa routePolyline cùng lúc, nếu không reader vẫn ưu tiên lộ trình gọn cũ
+      await _database.child('orders/$orderId').update({
+        'routePoints': points.map((point) => point.toJson()).toList(),
+        'routePolyline': null,
+      });
       return true;
     } catch (e) {
       print('Error saving route points: $e');
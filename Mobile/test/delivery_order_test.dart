@@ -0,0 +1,60 @@
+import 'package:flutter_test/flutter_test.dart';
+
+import 'package:robot_delivery/app/data/models/delivery_order.dart';
+
+// Áp dụng update() như Firebase: giá trị null xóa key tương ứng
+Map<String, dynamic> applyUpdate(
+    Map<String, dynamic> stored, Map<String, dynamic> update) {
+  final result = Map<String, dynamic>.from(stored);
+  update.forEach((key, value) {
+    if (value == null) {
+      result.remove(key);
+    } else {
+      result[key] = value;
+    }
+  });
+  return result;
+}
+
+void main() {
+  final compactOrder = <String, dynamic>{
+    'receiverName': 'Nguyễn Văn A',
+    'receiverAge': 30,
+    'phoneNumber': '0912345678',
+    'goods': 'Sách',
+    'weight': 1.5,
+    'destinationLat': 43.252,
+    'destinationLng': -126.453,
+    'routePolyline': '_p~iF~ps|U_ulLnnqC_mqNvxq`@',
+    'status': 'pending',
+    'createdAt': '2026-01-01T00:00:00.000',
+  };
+
+  test('đọc lộ trình dạng routePolyline', () {
+    final order = DeliveryOrder.fromJson(compactOrder, 'o1');
+
+    expect(order.routePoints!.length, 3);
+    expect(order.routePoints![0].lat, closeTo(38.5, 1e-9));
+    expect(order.routePoints![0].lng, closeTo(-120.2, 1e-9));
+    expect(order.routePoints![2].order, 2);
+  });
+
+  test('sửa lộ trình của đơn dạng gọn không bị routePolyline cũ che mất', () {
+    final order = DeliveryOrder.fromJson(compactOrder, 'o1');
+    final editedRoute = [
+      RoutePoint(lat: 21.0, lng: 105.8, order: 0),
+      RoutePoint(lat: 21.1, lng: 105.9, order: 1),
+    ];
+
+    final stored = applyUpdate(
+      compactOrder,
+      order.copyWith(routePoints: editedRoute).toJson(),
+    );
+    final reloaded = DeliveryOrder.fromJson(stored, 'o1');
+
+    expect(stored.containsKey('routePolyline'), isFalse);
+    expect(reloaded.routePoints!.length, 2);
+    expect(reloaded.routePoints![1].lat, 21.1);
+    expect(reloaded.routePoints![1].lng, 105.9);
+  });
+}